@@ -2,6 +2,11 @@
 """Django's command-line utility for administrative tasks."""
 import os
 import sys
+from pathlib import Path
+
+# The shared package (../shared), first on the path so a checkout runs even
+# before `pip install -r requirements.txt` has picked it up
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'shared'))
 
 
 def main():
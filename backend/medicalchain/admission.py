@@ -0,0 +1,193 @@
+import math
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from .localstore import LocalStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (token TEXT PRIMARY KEY, scope TEXT, wallet TEXT, expires REAL);
+CREATE INDEX IF NOT EXISTS slots_scope_wallet ON slots (scope, wallet);
+CREATE TABLE IF NOT EXISTS buckets (scope TEXT, wallet TEXT, tokens REAL, updated REAL, PRIMARY KEY (scope, wallet));
+CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated);
+"""
+# Token buckets idle this long are full again and can be forgotten
+BUCKET_IDLE_SECONDS = 3600
+PRUNE_INTERVAL = 60
+
+
+class Rejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionStore(LocalStore):
+    """
+    Concurrency slots and token buckets in a local SQLite file, so every
+    worker process on the host sees the same counts. Each admission is one
+    short IMMEDIATE transaction; slots carry a lease so a crashed worker's
+    slots free themselves.
+    """
+    schema = SCHEMA
+
+    def __init__(self, path, timeout=1.0):
+        super().__init__(path, timeout)
+        self._last_prune = 0.0
+
+    def acquire(self, scope, wallet, limits):
+        """Take a slot for `wallet` in `scope`, or raise Rejected; returns the slot token"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM slots WHERE expires < ?', (now,))
+            if now - self._last_prune > PRUNE_INTERVAL:
+                self._last_prune = now
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - BUCKET_IDLE_SECONDS,))
+
+            if limits['global_concurrency']:
+                (running,) = conn.execute('SELECT COUNT(*) FROM slots WHERE scope = ?', (scope,)).fetchone()
+                if running >= limits['global_concurrency']:
+                    raise Rejected(503, 'Server busy', settings.ADMISSION_RETRY_AFTER)
+            if limits['wallet_concurrency']:
+                (running,) = conn.execute(
+                    'SELECT COUNT(*) FROM slots WHERE scope = ? AND wallet = ?', (scope, wallet)
+                ).fetchone()
+                if running >= limits['wallet_concurrency']:
+                    raise Rejected(429, 'Too many concurrent requests', settings.ADMISSION_RETRY_AFTER)
+
+            if limits['rate']:
+                row = conn.execute(
+                    'SELECT tokens, updated FROM buckets WHERE scope = ? AND wallet = ?', (scope, wallet)
+                ).fetchone()
+                tokens = limits['burst'] if row is None else \
+                    min(limits['burst'], row[0] + (now - row[1]) * limits['rate'])
+                if tokens < 1:
+                    raise Rejected(429, 'Rate limit exceeded', math.ceil((1 - tokens) / limits['rate']))
+                conn.execute(
+                    'INSERT OR REPLACE INTO buckets (scope, wallet, tokens, updated) VALUES (?, ?, ?, ?)',
+                    (scope, wallet, tokens - 1, now)
+                )
+
+            token = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO slots (token, scope, wallet, expires) VALUES (?, ?, ?, ?)',
+                (token, scope, wallet, now + settings.ADMISSION_LEASE_SECONDS)
+            )
+            conn.execute('COMMIT')
+            return token
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release(self, token):
+        self._connection().execute('DELETE FROM slots WHERE token = ?', (token,))
+
+    def running(self, scope):
+        (count,) = self._connection().execute(
+            'SELECT COUNT(*) FROM slots WHERE scope = ? AND expires >= ?', (scope, time.time())
+        ).fetchone()
+        return count
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != settings.ADMISSION_STORE:
+            _store = AdmissionStore(settings.ADMISSION_STORE, settings.ADMISSION_STORE_TIMEOUT)
+        return _store
+
+
+def _reject(status, reason, retry_after=None):
+    response = JsonResponse({'error': reason}, status=status)
+    if retry_after is not None:
+        response['Retry-After'] = str(max(1, int(retry_after)))
+    return response
+
+
+def _released(content, release):
+    try:
+        yield from content
+    finally:
+        release()
+
+
+class AdmissionMiddleware:
+    """
+    Admission control for the expensive endpoints (ADMISSION_ENDPOINTS maps
+    URL names to a limit class in ADMISSION_LIMITS). Runs once the URL is
+    resolved but before the view touches the body:
+
+    - bodies over the class's max_body_bytes get 413 from Content-Length alone
+    - a full host (global_concurrency) sheds with 503, a wallet over its
+      concurrency or token-bucket rate gets 429; both carry Retry-After
+
+    Rejections are immediate rather than queued, so a client hammering an
+    endpoint is turned away cheaply while everyone else's latency stays
+    flat. Wallets are the X-Wallet-Address header, or the client IP without
+    one. If the store itself fails, requests are let through.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        token = getattr(request, '_admission_token', None)
+        if token is None:
+            return response
+
+        store = get_store()
+
+        def release():
+            try:
+                store.release(token)
+            except sqlite3.Error as e:
+                print(f"[Admission] Could not release slot: {e}")
+
+        if response.streaming:
+            # Exports stream long after the view returns; hold the slot until the body is sent
+            response.streaming_content = _released(response.streaming_content, release)
+        else:
+            release()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.ADMISSION_CONTROL or request.resolver_match is None:
+            return None
+        limit_class = settings.ADMISSION_ENDPOINTS.get(request.resolver_match.url_name)
+        if limit_class is None:
+            return None
+        limits = settings.ADMISSION_LIMITS[limit_class]
+
+        # A chunked body has no Content-Length to check against the cap, so it isn't accepted here
+        if limits['max_body_bytes'] and not request.META.get('CONTENT_LENGTH') \
+                and request.META.get('HTTP_TRANSFER_ENCODING'):
+            return _reject(411, 'Content-Length required')
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return _reject(400, 'Invalid Content-Length')
+        if limits['max_body_bytes'] and length > limits['max_body_bytes']:
+            return _reject(413, f"Request body too large (max {limits['max_body_bytes']} bytes)")
+
+        wallet = request.headers.get('X-Wallet-Address', '').lower() or f"ip:{request.META.get('REMOTE_ADDR', '')}"
+        try:
+            request._admission_token = get_store().acquire(limit_class, wallet, limits)
+        except Rejected as e:
+            print(f"[Admission] {e.status} {request.resolver_match.url_name} for {wallet[:12]}...: {e.reason}")
+            return _reject(e.status, e.reason, e.retry_after)
+        except sqlite3.Error as e:
+            print(f"[Admission] Store unavailable, admitting: {e}")
+        return None
@@ -8,9 +8,21 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
+import sys
+from pathlib import Path
 
-from django.core.asgi import get_asgi_application
+# The shared package (../shared), first on the path so a checkout runs even
+# before `pip install -r requirements.txt` has picked it up
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'shared'))
+
+from medicalchain import startup  # noqa: E402  imported first so startup timing includes Django
+from django.core.asgi import get_asgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medicalchain.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WARMUP_ON_START:
+    startup.warm_up()
\ No newline at end of file
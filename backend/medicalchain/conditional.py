@@ -0,0 +1,46 @@
+import hashlib
+
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# Bump to invalidate every client's cached ETags, e.g. when a serializer's output changes
+ETAG_VERSION = '2'
+
+
+def make_etag(*parts):
+    """Strong ETag from cheap version markers (ids, counts, timestamps)"""
+    marker = '|'.join(str(part) for part in (ETAG_VERSION,) + parts)
+    return '"' + hashlib.sha1(marker.encode('utf-8')).hexdigest() + '"'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # Weak validators (W/"...") are compared by their opaque part for GETs
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return etag in candidates
+
+
+def conditional_response(request, etag, cache_control, build, content_type='application/json'):
+    """
+    Answer 304 Not Modified when the client already holds `etag`; otherwise
+    call `build()` for the payload. Serialization only happens on a miss.
+    `build()` may return pre-rendered bytes of `content_type` (e.g. JSON from
+    medicalchain.fastjson).
+    """
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        payload = build()
+        if isinstance(payload, bytes):
+            response = HttpResponse(payload, content_type=content_type)
+        else:
+            response = Response(payload)
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,227 @@
+import contextvars
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connections
+
+from .localstore import LocalStore
+
+STICKY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sticky (wallet TEXT PRIMARY KEY, until REAL);
+"""
+PRUNE_INTERVAL = 60
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# URL kwargs naming the wallet a read is about
+WALLET_KWARGS = ('wallet_address', 'patient_address')
+
+# Replica alias the current request may read from (None: primary)
+_replica = contextvars.ContextVar('db_replica', default=None)
+
+
+class StickyStore(LocalStore):
+    """
+    Wallets that wrote recently, shared by the workers on a host so the
+    request after a write reads from the primary whichever worker serves it
+    """
+    schema = STICKY_SCHEMA
+
+    def __init__(self, path, timeout=1.0):
+        super().__init__(path, timeout)
+        self._last_prune = 0.0
+
+    def stick(self, wallet, seconds):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO sticky (wallet, until) VALUES (?, ?)', (wallet, now + seconds))
+        if now - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = now
+            conn.execute('DELETE FROM sticky WHERE until < ?', (now,))
+
+    def is_sticky(self, wallets):
+        placeholders = ', '.join('?' * len(wallets))
+        row = self._connection().execute(
+            f'SELECT 1 FROM sticky WHERE wallet IN ({placeholders}) AND until > ? LIMIT 1', (*wallets, time.time())
+        ).fetchone()
+        return row is not None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != settings.DB_STICKY_STORE:
+            _store = StickyStore(settings.DB_STICKY_STORE)
+        return _store
+
+
+def stick(wallet):
+    """Send `wallet`'s reads to the primary for DB_REPLICA_STICKY_SECONDS (call after a write)"""
+    wallet = (wallet or '').lower()
+    if not wallet or not settings.DB_REPLICAS:
+        return
+    try:
+        get_store().stick(wallet, settings.DB_REPLICA_STICKY_SECONDS)
+    except sqlite3.Error as e:
+        print(f"[Replica] Could not record write for {wallet[:12]}...: {e}")
+
+
+def _wallets(request, kwargs):
+    """The caller's wallet and any wallet the URL names"""
+    wallets = [request.headers.get('X-Wallet-Address', '')]
+    wallets += [kwargs[name] for name in WALLET_KWARGS if name in kwargs]
+    return [wallet.lower() for wallet in wallets if wallet]
+
+
+def _is_sticky(wallets):
+    if not wallets:
+        return False
+    try:
+        return get_store().is_sticky(wallets)
+    except sqlite3.Error as e:
+        # Can't tell whether they just wrote: the primary is always correct
+        print(f"[Replica] Sticky store unavailable, reading from primary: {e}")
+        return True
+
+
+# alias -> (healthy, checked at); per process
+_health = {}
+_health_lock = threading.Lock()
+
+
+def _probe(alias):
+    """Raises if `alias` can't serve reads or lags more than DB_REPLICA_MAX_LAG_SECONDS"""
+    connection = connections[alias]
+    if connection.vendor == 'sqlite':
+        name = connection.settings_dict['NAME']
+        # Connecting would create an empty file in place of a missing replica
+        if not connection.is_in_memory_db() and not os.path.exists(name):
+            raise OperationalError(f'{name} does not exist')
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+            )
+            (lag,) = cursor.fetchone()
+            if lag and lag > settings.DB_REPLICA_MAX_LAG_SECONDS:
+                raise OperationalError(f'replication lag {lag:.1f}s')
+
+
+def is_healthy(alias):
+    """Cached for DB_REPLICA_HEALTH_INTERVAL seconds per alias"""
+    now = time.monotonic()
+    cached = _health.get(alias)
+    if cached is not None and now - cached[1] < settings.DB_REPLICA_HEALTH_INTERVAL:
+        return cached[0]
+    try:
+        _probe(alias)
+        healthy = True
+    except Exception as e:
+        healthy = False
+        connections[alias].close()
+        if cached is None or cached[0]:
+            print(f"[Replica] {alias} unhealthy, reading from primary: {e}")
+    else:
+        if cached is not None and not cached[0]:
+            print(f"[Replica] {alias} healthy again")
+    with _health_lock:
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+def mark_down(alias):
+    """Take `alias` out of rotation until its next health check"""
+    with _health_lock:
+        _health[alias] = (False, time.monotonic())
+    connections[alias].close()
+
+
+def healthy_replicas():
+    return [alias for alias in settings.DB_REPLICAS if is_healthy(alias)]
+
+
+class ReplicaRouter:
+    """
+    Reads go to the replica ReplicaMiddleware chose for the request, if any;
+    everything else (writes, management commands, background jobs, reads
+    inside a transaction) uses the primary. Migrations only run on the
+    primary: replicas get the schema through replication.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections['default'].in_atomic_block:
+            return 'default'
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    """
+    Chooses where each request reads from. Only safe requests to the views
+    in DB_REPLICA_VIEWS (URL names) use a replica, and only when:
+
+    - neither the caller (X-Wallet-Address) nor the wallet in the URL has
+      written in the last DB_REPLICA_STICKY_SECONDS: any successful unsafe
+      request marks those wallets, so a client always reads its own writes
+    - a replica passes its health check; otherwise the primary serves it
+
+    A replica failing mid-request is taken out of rotation and the view is
+    run once more against the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _replica.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            match = request.resolver_match
+            for wallet in _wallets(request, match.kwargs if match else {}):
+                stick(wallet)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DB_REPLICAS or request.method not in SAFE_METHODS or request.resolver_match is None:
+            return None
+        if request.resolver_match.url_name not in settings.DB_REPLICA_VIEWS:
+            return None
+        if _is_sticky(_wallets(request, view_kwargs)):
+            return None
+        replicas = healthy_replicas()
+        if replicas:
+            request._db_replica = random.choice(replicas)
+            _replica.set(request._db_replica)
+        return None
+
+    def process_exception(self, request, exception):
+        alias = getattr(request, '_db_replica', None)
+        if alias is None or not isinstance(exception, DatabaseError):
+            return None
+        print(f"[Replica] {alias} failed during {request.resolver_match.url_name}, retrying on primary: {exception}")
+        mark_down(alias)
+        request._db_replica = None
+        _replica.set(None)
+        match = request.resolver_match
+        return match.func(request, *match.args, **match.kwargs)
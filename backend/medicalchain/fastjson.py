@@ -0,0 +1,138 @@
+import datetime
+import json
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder produces the same bytes, just slower
+    orjson = None
+
+
+class UnsupportedSerializer(Exception):
+    """The serializer has a field the fast path cannot reproduce exactly"""
+
+
+def drf_datetime(value, tz):
+    """DateTimeField.to_representation for the ISO 8601 default format; `tz` is the current timezone or None"""
+    if tz is not None:
+        value = value.astimezone(tz) if timezone.is_aware(value) else timezone.make_aware(value, tz)
+    elif timezone.is_aware(value):
+        value = timezone.make_naive(value, datetime.timezone.utc)
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _converter(field):
+    """Factory taking the request's timezone and returning the field's value converter"""
+    # Order matters: EmailField is a CharField, ChoiceField returns the stored value as-is
+    if isinstance(field, serializers.DateTimeField):
+        if getattr(field, 'format', api_settings.DATETIME_FORMAT) != api_settings.DATETIME_FORMAT \
+                or api_settings.DATETIME_FORMAT.lower() != 'iso-8601' or hasattr(field, 'timezone'):
+            raise UnsupportedSerializer(f'{field.field_name}: custom datetime format')
+        return lambda tz: lambda value: drf_datetime(value, tz)
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda tz: lambda value: choices.get(str(value), value) if value != '' else value
+    if isinstance(field, serializers.CharField):
+        return lambda tz: str
+    if isinstance(field, serializers.IntegerField):
+        return lambda tz: int
+    if isinstance(field, serializers.BooleanField):
+        return lambda tz: field.to_representation
+    raise UnsupportedSerializer(f'{field.field_name}: {type(field).__name__}')
+
+
+class ValuesRenderer:
+    """
+    Fast path for list endpoints: reads exactly the serializer's columns with
+    .values_list() and builds the output dicts directly, skipping model
+    instances and DRF's per-field machinery. The column list and converters
+    are compiled once from the serializer's own field declarations, so the
+    output keeps matching serializer(queryset, many=True).data byte for byte
+    as long as the serializer only uses plain model fields.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        fields = [f for f in serializer_class().fields.values() if not f.write_only]
+        for field in fields:
+            if field.source == '*' or '.' in field.source:
+                raise UnsupportedSerializer(f'{field.field_name}: source {field.source!r}')
+        self.keys = tuple(f.field_name for f in fields)
+        self.columns = tuple(f.source for f in fields)
+        self._converters = tuple((i, _converter(f)) for i, f in enumerate(fields))
+
+    def rows(self, queryset):
+        keys = self.keys
+        # Resolve the timezone once per call instead of once per datetime value
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        # (position, converter) pairs; None values bypass converters like DRF does
+        converters = [(i, factory(tz)) for i, factory in self._converters]
+        out = []
+        for row in queryset.values_list(*self.columns):
+            row = list(row)
+            for i, convert in converters:
+                if row[i] is not None:
+                    row[i] = convert(row[i])
+            out.append(dict(zip(keys, row)))
+        return out
+
+    def render(self, queryset):
+        return dumps(self.rows(queryset))
+
+
+def dumps(data):
+    """Bytes identical to DRF's JSONRenderer with its default compact/unicode settings"""
+    if orjson is not None:
+        try:
+            body = orjson.dumps(data)
+        except (TypeError, orjson.JSONEncodeError):
+            body = None
+        if body is not None:
+            # Same JavaScript-subset escaping JSONRenderer applies
+            return body.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+    body = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return body.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def accepts_fast_json(request):
+    """Only plain JSON responses take the fast path (not the browsable API or ?indent)"""
+    if not settings.FAST_SERIALIZATION:
+        return False
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is None or renderer.format != 'json':
+        return False
+    return (
+        api_settings.COMPACT_JSON and api_settings.UNICODE_JSON and api_settings.STRICT_JSON
+        and renderer.get_indent(request.accepted_media_type, {}) is None
+    )
+
+
+def render_list(request, renderer, queryset):
+    """
+    JSON bytes for a list endpoint via the fast path, or the serializer's data
+    when the request needs DRF rendering. With FAST_SERIALIZATION_VERIFY on,
+    both paths run and a mismatch falls back to the serializer output.
+    """
+    if not accepts_fast_json(request):
+        return renderer.serializer_class(queryset, many=True).data
+    body = renderer.render(queryset)
+    if settings.FAST_SERIALIZATION_VERIFY:
+        expected = request.accepted_renderer.render(renderer.serializer_class(queryset, many=True).data)
+        if body != expected:
+            print(f"[FastJSON] Output mismatch for {renderer.serializer_class.__name__}; using serializer")
+            return renderer.serializer_class(queryset, many=True).data
+    return body
+
+
+def list_response(request, renderer, queryset):
+    payload = render_list(request, renderer, queryset)
+    if isinstance(payload, bytes):
+        return HttpResponse(payload, content_type='application/json')
+    return Response(payload)
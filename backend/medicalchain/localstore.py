@@ -0,0 +1,27 @@
+import sqlite3
+import threading
+
+
+class LocalStore:
+    """
+    A small SQLite file on local disk shared by every worker process on the
+    host: cross-process counters and flags without a cache server. One
+    connection per thread, WAL mode so readers never wait on a writer.
+    Subclasses set `schema`.
+    """
+    schema = ''
+
+    def __init__(self, path, timeout=1.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # transient state: losing it on power loss is fine
+            conn.executescript(self.schema)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from medichain_shared.profiling import HEADER, Capture, reason
+
+SERVICE = 'backend'
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in request profiling (PROFILING=True). A PROFILE_SAMPLE_RATE fraction
+    of requests, and any request carrying X-Profile: <PROFILE_TOKEN>, are
+    captured into PROFILE_DIR and answered with an X-Profile-Id header; see
+    `manage.py profiles`. Requests arriving while another is being captured
+    run unprofiled. With PROFILING off the middleware removes itself.
+    Capture and on-disk format live in medichain_shared.profiling (the
+    encryption service's ASGI middleware uses the same).
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        why = reason(request.headers.get(HEADER, ''), settings.PROFILE_TOKEN, settings.PROFILE_SAMPLE_RATE)
+        if why is None:
+            return self.get_response(request)
+        capture = Capture(
+            SERVICE, settings.PROFILE_MODE, settings.PROFILE_SAMPLE_INTERVAL_MS / 1000, settings.PROFILE_ALLOCATIONS
+        )
+        if not capture.start():
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            capture.stop()
+        match = request.resolver_match
+        try:
+            profile_id = capture.write(settings.PROFILE_DIR, {
+                'endpoint': match.url_name if match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'reason': why,
+            }, settings.PROFILE_KEEP, settings.PROFILE_MAX_MB * 1024 * 1024)
+        except OSError as e:
+            print(f"[Profile] Could not write profile: {e}")
+        else:
+            print(f"[Profile] {request.method} {request.path} -> {profile_id} ({capture.duration * 1000:.0f} ms)")
+            response['X-Profile-Id'] = profile_id
+        return response
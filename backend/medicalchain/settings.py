@@ -24,10 +24,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'medicalchain.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'medicalchain.admission.AdmissionMiddleware',
+    'medicalchain.db_router.ReplicaMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -54,12 +57,87 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'medicalchain.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database
+# DB_ENGINE=sqlite (default) keeps the single-file setup but runs it in WAL mode
+# with a busy timeout so concurrent writers wait instead of failing with
+# "database is locked". DB_ENGINE=postgres is the production mode.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite').lower()
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'medichain'),
+            'USER': os.getenv('DB_USER', 'medichain'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Persistent connections: reuse a connection for up to this many
+            # seconds instead of reconnecting on every request.
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+            # Transaction-mode poolers (PgBouncer) can't hold server-side cursors
+            # across transactions.
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_POOLER', '') == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+            },
+            'TEST': {
+                'NAME': os.getenv('DB_TEST_NAME', 'test_medichain'),
+            },
+        }
     }
-}
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'medicalchain.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0')),
+            'OPTIONS': {
+                # Seconds a writer waits on a locked database (busy_timeout)
+                'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+            },
+            'JOURNAL_MODE': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+            'SYNCHRONOUS': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            # Transactions take the write lock when they begin (see the backend)
+            'TRANSACTION_MODE': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            # A file rather than Django's in-memory default, so tests run under
+            # the same WAL/busy_timeout locking as the real database
+            'TEST': {
+                'NAME': os.getenv('DB_TEST_NAME', str(BASE_DIR / 'test_db.sqlite3')),
+            },
+        }
+    }
+else:
+    raise ValueError(f"Unsupported DB_ENGINE: {DB_ENGINE}")
+
+# Read replicas (medicalchain.db_router). DB_REPLICAS is a comma-separated
+# list: host[:port] of streaming replicas for postgres, database file paths
+# (e.g. a copy kept current by Litestream/rsync) for sqlite. Each becomes a
+# replica_N alias with the primary's other settings; empty = primary only.
+DB_REPLICAS = []
+for i, replica in enumerate(r.strip() for r in os.getenv('DB_REPLICAS', '').split(',') if r.strip()):
+    alias = f'replica_{i}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if DB_ENGINE == 'sqlite':
+        DATABASES[alias]['NAME'] = replica
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias].update(HOST=host, PORT=port or DATABASES['default']['PORT'])
+    DB_REPLICAS.append(alias)
+if DB_REPLICAS:
+    DATABASE_ROUTERS = ['medicalchain.db_router.ReplicaRouter']
+# URL names whose GETs may read from a replica
+DB_REPLICA_VIEWS = (
+    'patient_records', 'patient_stats', 'get_by_cid',
+    'get_user', 'list_doctors', 'search_doctors', 'resolve_patient',
+)
+# After a write, a wallet reads from the primary for this long (read-your-writes)
+DB_REPLICA_STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))
+DB_STICKY_STORE = os.getenv('DB_STICKY_STORE', '/tmp/medichain-sticky.sqlite3')
+DB_REPLICA_HEALTH_INTERVAL = float(os.getenv('DB_REPLICA_HEALTH_INTERVAL', '5'))
+# Postgres replicas further behind than this are skipped
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', '5'))
 
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -83,14 +161,180 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
     'X-Wallet-Address',
     'x-wallet-address',
+    'if-none-match',
+    'idempotency-key',
+    'last-event-id',
+    'x-record-type',
 ]
 
+CORS_EXPOSE_HEADERS = ['ETag', 'Content-Disposition', 'X-Export-Until', 'Idempotent-Replayed', 'Retry-After', 'X-Profile-Id']
+
+# Cache-Control per endpoint; every one of them also sends an ETag and
+# answers If-None-Match with 304 (medicalchain.conditional)
+HTTP_CACHE_CONTROL = {
+    'patient_records': 'private, no-cache',
+    'patient_stats': 'private, no-cache',
+    'record_pending': 'private, no-cache',
+    # Metadata for a CID whose transaction is confirmed no longer changes
+    'record_final': 'private, max-age=31536000, immutable',
+    'doctors': 'public, max-age=30, must-revalidate',
+    'user': 'private, no-cache',
+    'preview': 'private, max-age=31536000, immutable',
+}
+
+# List endpoints render straight from .values_list() rows (medicalchain.fastjson).
+# VERIFY also runs the DRF serializer on every request and compares the bytes.
+FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION', 'true').lower() == 'true'
+FAST_SERIALIZATION_VERIFY = os.getenv('FAST_SERIALIZATION_VERIFY', 'false').lower() == 'true'
+
+# Delta sync (GET /api/records/changes/): page size cap, and how old a change
+# must be before it is served so late-committing transactions are not skipped
+RECORD_CHANGES_PAGE_MAX = int(os.getenv('RECORD_CHANGES_PAGE_MAX', '500'))
+RECORD_CHANGES_SETTLE_SECONDS = float(os.getenv('RECORD_CHANGES_SETTLE_SECONDS', '1'))
+
+# Server-Sent Events (GET /api/events/<wallet>/). Each open stream holds a
+# worker thread: run gunicorn with --worker-class gthread --threads N.
+SSE_POLL_INTERVAL = float(os.getenv('SSE_POLL_INTERVAL', '1'))
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_MAX_CONNECTION_SECONDS = int(os.getenv('SSE_MAX_CONNECTION_SECONDS', '300'))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', '3000'))
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', '100'))
+SSE_EVENT_RETENTION_SECONDS = int(os.getenv('SSE_EVENT_RETENTION_SECONDS', '86400'))
+# Events younger than this aren't sent yet, so one that commits after a higher id isn't skipped
+SSE_SETTLE_SECONDS = float(os.getenv('SSE_SETTLE_SECONDS', '1'))
+
+# Access-change indexer (manage.py index_access_events)
+ACCESS_INDEXER_START_BLOCK = int(os.getenv('ACCESS_INDEXER_START_BLOCK', '0'))
+ACCESS_INDEXER_CONFIRMATIONS = int(os.getenv('ACCESS_INDEXER_CONFIRMATIONS', '2'))
+ACCESS_INDEXER_CHUNK_BLOCKS = int(os.getenv('ACCESS_INDEXER_CHUNK_BLOCKS', '2000'))
+
+# Transaction confirmation poller (manage.py confirm_transactions): blocks a
+# receipt must be under before a record counts as confirmed, hashes per
+# batched RPC poll, and how long an unknown tx may stay pending before it is
+# marked dropped
+TX_CONFIRMATIONS = int(os.getenv('TX_CONFIRMATIONS', '2'))
+TX_CONFIRM_BATCH_SIZE = int(os.getenv('TX_CONFIRM_BATCH_SIZE', '100'))
+TX_CONFIRM_INTERVAL = float(os.getenv('TX_CONFIRM_INTERVAL', '12'))
+TX_DROP_AFTER_SECONDS = int(os.getenv('TX_DROP_AFTER_SECONDS', '3600'))
+
+# Record previews (records.previews): allowed thumbnail sizes in px (the
+# first is the default), largest source file worth fetching, JPEG quality
+PREVIEW_SIZES = [int(size) for size in os.getenv('PREVIEW_SIZES', '256,128,512').split(',')]
+PREVIEW_MAX_SOURCE_BYTES = int(os.getenv('PREVIEW_MAX_SOURCE_BYTES', str(100 * 1024 * 1024)))
+PREVIEW_JPEG_QUALITY = int(os.getenv('PREVIEW_JPEG_QUALITY', '80'))
+
+# Archive export (GET /api/records/export/<patient>/): records fetched and
+# decrypted ahead of the archive writer; also the max decrypted files in memory
+EXPORT_FETCH_WORKERS = int(os.getenv('EXPORT_FETCH_WORKERS', '4'))
+
+# Integrity scrubber (manage.py scrub_records): records per batch, hours
+# before a record is re-verified, and limits that keep it off live traffic's
+# toes (0 = unlimited; CPU fraction is the share of wall time spent working)
+SCRUB_BATCH_SIZE = int(os.getenv('SCRUB_BATCH_SIZE', '100'))
+SCRUB_INTERVAL_HOURS = float(os.getenv('SCRUB_INTERVAL_HOURS', '168'))
+SCRUB_MAX_BYTES_PER_SECOND = int(os.getenv('SCRUB_MAX_BYTES_PER_SECOND', str(5 * 1024 * 1024)))
+SCRUB_CPU_FRACTION = float(os.getenv('SCRUB_CPU_FRACTION', '0.25'))
+SCRUB_FETCH_TIMEOUT = int(os.getenv('SCRUB_FETCH_TIMEOUT', '60'))
+
+# Idempotency-Key support on upload/sync/tx endpoints (records.idempotency):
+# how long a stored response is replayed, how long a duplicate waits for the
+# first request to finish before getting 409, and after how long an
+# unfinished request (crashed worker) is presumed dead and may be re-run
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '30'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '600'))
+
+# Admission control (medicalchain.admission) for the endpoints that tie up a
+# worker and the encryption service. Counts live in a SQLite file shared by
+# the workers on one host, so global_concurrency is per host. 0 disables a
+# limit; rate is requests per second per wallet, refilling up to burst.
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'True') == 'True'
+ADMISSION_STORE = os.getenv('ADMISSION_STORE', '/tmp/medichain-admission.sqlite3')
+ADMISSION_STORE_TIMEOUT = float(os.getenv('ADMISSION_STORE_TIMEOUT', '1'))
+# A slot outlives a crashed worker by at most this long
+ADMISSION_LEASE_SECONDS = int(os.getenv('ADMISSION_LEASE_SECONDS', '600'))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '2'))
+ADMISSION_LIMITS = {
+    'upload': {
+        'wallet_concurrency': int(os.getenv('ADMISSION_UPLOAD_WALLET_CONCURRENCY', '2')),
+        'global_concurrency': int(os.getenv('ADMISSION_UPLOAD_GLOBAL_CONCURRENCY', '16')),
+        'rate': float(os.getenv('ADMISSION_UPLOAD_RATE', '0.5')),
+        'burst': int(os.getenv('ADMISSION_UPLOAD_BURST', '10')),
+        'max_body_bytes': int(os.getenv('ADMISSION_UPLOAD_MAX_BODY_BYTES', str(500 * 1024 * 1024))),
+    },
+    'download': {
+        'wallet_concurrency': int(os.getenv('ADMISSION_DOWNLOAD_WALLET_CONCURRENCY', '4')),
+        'global_concurrency': int(os.getenv('ADMISSION_DOWNLOAD_GLOBAL_CONCURRENCY', '32')),
+        'rate': float(os.getenv('ADMISSION_DOWNLOAD_RATE', '2')),
+        'burst': int(os.getenv('ADMISSION_DOWNLOAD_BURST', '20')),
+        'max_body_bytes': int(os.getenv('ADMISSION_DOWNLOAD_MAX_BODY_BYTES', str(64 * 1024))),
+    },
+}
+# URL name -> limit class
+ADMISSION_ENDPOINTS = {
+    'upload_record_complete': 'upload',
+    'upload_records_batch': 'upload',
+    'download_record': 'download',
+    'record_preview': 'download',
+    'export_records': 'download',
+}
+
+# Request profiling (medicalchain.profiling), off unless PROFILING=True. A
+# PROFILE_SAMPLE_RATE fraction of requests, plus any sent with
+# X-Profile: <PROFILE_TOKEN>, are profiled into a ring buffer of the newest
+# PROFILE_KEEP profiles (and at most PROFILE_MAX_MB) in PROFILE_DIR.
+# PROFILE_MODE: 'sample' (stack samples, flamegraph-ready) or 'cprofile'.
+PROFILING = os.getenv('PROFILING', 'False') == 'True'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sample')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_ALLOCATIONS = os.getenv('PROFILE_ALLOCATIONS', 'True') == 'True'
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/medichain-profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))
+PROFILE_MAX_MB = float(os.getenv('PROFILE_MAX_MB', '100'))
+
 # Custom settings
 ENCRYPTION_SERVICE_URL = os.getenv('ENCRYPTION_SERVICE_URL', 'http://localhost:8001')
 PINATA_API_KEY = os.getenv('PINATA_API_KEY')
 PINATA_SECRET_KEY = os.getenv('PINATA_SECRET_KEY')
+IPFS_GATEWAY = os.getenv('IPFS_GATEWAY', 'https://gateway.pinata.cloud/ipfs/')
 CONTRACT_ADDRESS = os.getenv('CONTRACT_ADDRESS')
 SEPOLIA_RPC_URL = os.getenv('SEPOLIA_RPC_URL')
+# RPC the backend talks to; point at http://127.0.0.1:8545 for a local Hardhat node
+CHAIN_RPC_URL = os.getenv('CHAIN_RPC_URL', SEPOLIA_RPC_URL)
+# Max records per getRecordsRange call
+CHAIN_PAGE_MAX = int(os.getenv('CHAIN_PAGE_MAX', '100'))
+
+# Batched anchoring (records.anchoring): 'per_record' keeps one addRecord
+# transaction per upload; 'batch' anchors Merkle roots via `manage.py anchor_records`
+ANCHOR_MODE = os.getenv('ANCHOR_MODE', 'per_record')
+ANCHOR_BATCH_SIZE = int(os.getenv('ANCHOR_BATCH_SIZE', '1000'))
+ANCHOR_PRIVATE_KEY = os.getenv('ANCHOR_PRIVATE_KEY')
+
+# Startup / warm-up (medicalchain.startup)
+# Heavy modules are imported on first use; WARMUP_IMPORTS are pulled in by
+# warm_up() (on worker boot when WARMUP_ON_START=True, or via /api/ready/).
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'False') == 'True'
+WARMUP_IMPORTS = [name for name in os.getenv('WARMUP_IMPORTS', 'requests').split(',') if name]
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+
+# Compression before encryption: 'auto' (by record type / sampling), 'zlib', 'zstd' or 'none'
+RECORD_COMPRESSION = os.getenv('RECORD_COMPRESSION', 'auto')
+
+# Shared with the encryption service; required for its /datakey endpoint
+SERVICE_TOKEN = os.getenv('SERVICE_TOKEN', '')
+
+# Encrypt single-file uploads chunk by chunk as they arrive (records.streaming);
+# needs /datakey, so it's on by default only once SERVICE_TOKEN is set
+STREAMING_UPLOAD_ENCRYPTION = os.getenv('STREAMING_UPLOAD_ENCRYPTION', str(bool(SERVICE_TOKEN))) == 'True'
+
+# Multi-file upload pipeline (records.pipeline)
+UPLOAD_BATCH_MAX_FILES = int(os.getenv('UPLOAD_BATCH_MAX_FILES', '50'))
+UPLOAD_PIPELINE_ENCRYPT_WORKERS = int(os.getenv('UPLOAD_PIPELINE_ENCRYPT_WORKERS', '4'))
+UPLOAD_PIPELINE_PIN_WORKERS = int(os.getenv('UPLOAD_PIPELINE_PIN_WORKERS', '4'))
+UPLOAD_PIPELINE_MAX_IN_FLIGHT = int(os.getenv('UPLOAD_PIPELINE_MAX_IN_FLIGHT', '8'))
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
@@ -0,0 +1,46 @@
+import threading
+import time
+
+from medichain_shared.lazy import LazyModule, import_timings, lazy_module  # noqa: F401
+
+# Captured when settings are first loaded, i.e. as early as the process can see
+PROCESS_STARTED = time.perf_counter()
+
+_warmup_lock = threading.Lock()
+_warmup_seconds = None
+
+
+def warm_up():
+    """
+    Pay one-time costs before real traffic arrives: deferred imports, the
+    database connection and the pooled HTTP session. Safe to call repeatedly;
+    only the first call does any work.
+    """
+    global _warmup_seconds
+    with _warmup_lock:
+        if _warmup_seconds is not None:
+            return _warmup_seconds
+
+        from django.conf import settings
+        from django.db import connections
+
+        started = time.perf_counter()
+        for name in settings.WARMUP_IMPORTS:
+            lazy_module(name)._load()
+        for alias in connections:
+            connections[alias].ensure_connection()
+
+        from records.http import get_session
+        get_session()
+
+        _warmup_seconds = round(time.perf_counter() - started, 4)
+        return _warmup_seconds
+
+
+def startup_report():
+    return {
+        'ready': _warmup_seconds is not None,
+        'uptime_seconds': round(time.perf_counter() - PROCESS_STARTED, 4),
+        'warmup_seconds': _warmup_seconds,
+        'deferred_imports': dict(sorted(import_timings.items(), key=lambda item: -item[1])),
+    }
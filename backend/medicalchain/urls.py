@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.urls import path
+from medicalchain import views as core_views
 from users import views as user_views
 from records import views as record_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/ready/', core_views.ready, name='ready'),
     
     # User endpoints
     path('api/users/register/', user_views.register_user, name='register'),
@@ -17,10 +19,21 @@ urlpatterns = [
     # Record endpoints
     path('api/records/upload/', record_views.upload_record, name='upload_record'),
     path('api/records/upload-complete/', record_views.upload_record_complete, name='upload_record_complete'),
+    path('api/records/upload-batch/', record_views.upload_records_batch, name='upload_records_batch'),
     path('api/records/download/', record_views.download_record, name='download_record'),
     path('api/records/sync-blockchain/', record_views.sync_blockchain_record, name='sync_blockchain'),
     path('api/records/patient/<str:patient_address>/', record_views.get_patient_records, name='patient_records'),
+    path('api/records/stats/<str:patient_address>/', record_views.get_patient_stats, name='patient_stats'),
+    path('api/records/changes/<str:wallet_address>/', record_views.get_record_changes, name='record_changes'),
+    path('api/records/export/<str:patient_address>/', record_views.export_records, name='export_records'),
+    path('api/records/integrity/', record_views.get_integrity_report, name='integrity_report'),
+    path('api/records/tx/metrics/', record_views.get_tx_metrics, name='tx_metrics'),
     path('api/records/<int:record_id>/tx/', record_views.update_tx_hash, name='update_tx'),
+    path('api/records/<int:record_id>/preview/', record_views.get_record_preview, name='record_preview'),
+    path('api/records/<int:record_id>/anchor/', record_views.verify_record_anchor, name='verify_anchor'),
+    path('api/records/chain/access/', record_views.check_access_batch, name='check_access_batch'),
+    path('api/records/chain/<str:patient_address>/', record_views.get_chain_records, name='chain_records'),
     path('api/records/cid/<str:cid>/', record_views.get_record_by_cid, name='get_by_cid'),
+    path('api/events/<str:wallet_address>/', record_views.event_stream, name='event_stream'),
     path('api/users/sync-from-blockchain/', user_views.sync_user_from_blockchain, name='sync_user'),
 ]
\ No newline at end of file
@@ -0,0 +1,23 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from . import db_router, startup
+
+
+@api_view(['GET'])
+def ready(request):
+    """
+    Readiness probe: warms the worker on first call (deferred imports, DB
+    connection, HTTP pool) and reports startup timings
+    """
+    try:
+        startup.warm_up()
+    except Exception as e:
+        return Response({'ready': False, 'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    report = startup.startup_report()
+    if settings.DB_REPLICAS:
+        # A down replica doesn't make the worker unready: reads fall back to the primary
+        report['replicas'] = {alias: db_router.is_healthy(alias) for alias in settings.DB_REPLICAS}
+    return Response(report)
@@ -1,9 +1,15 @@
 from django.contrib import admin
-from .models import MedicalRecord
+from .models import MedicalRecord, PatientRecordStats
 
 @admin.register(MedicalRecord)
 class MedicalRecordAdmin(admin.ModelAdmin):
-    list_display = ['record_id', 'patient', 'uploaded_by', 'filename', 'created_at']
-    list_filter = ['created_at', 'uploaded_by']
+    list_display = ['record_id', 'patient', 'uploaded_by', 'filename', 'created_at', 'verify_status', 'verified_at']
+    list_filter = ['created_at', 'uploaded_by', 'verify_status', 'cipher_suite', 'tx_status']
     search_fields = ['patient__wallet_address', 'ipfs_cid', 'filename']
-    readonly_fields = ['created_at', 'record_id']
\ No newline at end of file
+    readonly_fields = ['created_at', 'record_id']
+
+@admin.register(PatientRecordStats)
+class PatientRecordStatsAdmin(admin.ModelAdmin):
+    list_display = ['patient', 'total_records', 'total_bytes', 'doctor_count', 'last_upload_at', 'updated_at']
+    search_fields = ['patient__wallet_address']
+    readonly_fields = ['updated_at']
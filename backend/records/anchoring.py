@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import chain, merkle
+from .models import AnchorBatch, MedicalRecord
+
+
+def unanchored_records(limit):
+    """Records not yet covered by a batch and not anchored individually via addRecord"""
+    return (
+        MedicalRecord.objects
+        .filter(anchor_batch__isnull=True)
+        .filter(Q(tx_hash__isnull=True) | Q(tx_hash=''))
+        .filter(file_hash__regex=r'^0x[0-9a-fA-F]{64}$')
+        .order_by('record_id')[:limit]
+    )
+
+
+def create_batch(limit=None):
+    """
+    Build a Merkle tree over pending record hashes, store each record's
+    inclusion proof and return the new (pending) AnchorBatch, or None when
+    there is nothing to anchor.
+    """
+    limit = limit or settings.ANCHOR_BATCH_SIZE
+    with transaction.atomic():
+        records = list(unanchored_records(limit).select_for_update())
+        if not records:
+            return None
+
+        levels = merkle.build_tree([merkle.leaf_hash(record.file_hash) for record in records])
+        batch = AnchorBatch.objects.create(
+            merkle_root=merkle.to_hex(merkle.root_of(levels)),
+            record_count=len(records),
+        )
+        for index, record in enumerate(records):
+            record.anchor_batch = batch
+            record.merkle_proof = [merkle.to_hex(node) for node in merkle.proof_for(levels, index)]
+        MedicalRecord.objects.bulk_update(records, ['anchor_batch', 'merkle_proof'])
+    return batch
+
+
+def _settle(batch, receipt_status, block_number):
+    batch.status = 'confirmed' if receipt_status == 1 else 'failed'
+    batch.block_number = block_number
+    batch.anchored_at = timezone.now()
+    batch.save(update_fields=['status', 'block_number', 'anchored_at'])
+    if batch.status == 'failed':
+        _release(batch)
+
+
+def _release(batch):
+    # Free the records so the next run re-batches them
+    batch.records.update(anchor_batch=None, merkle_proof=None)
+
+
+def submit_batch(batch, wait=True):
+    """Send anchorBatch(root, count) and record the outcome on the batch"""
+    contract = chain.get_contract()
+    call = contract.functions.anchorBatch(merkle.to_bytes32(batch.merkle_root), batch.record_count)
+    batch.tx_hash = chain.send_transaction(call, settings.ANCHOR_PRIVATE_KEY)
+    batch.status = 'submitted'
+    batch.submitted_at = timezone.now()
+    batch.save(update_fields=['tx_hash', 'status', 'submitted_at'])
+
+    if wait:
+        try:
+            receipt = chain.wait_for_receipt(batch.tx_hash)
+        except chain.web3.exceptions.TimeExhausted:
+            print(f"[Anchor] No receipt yet for batch {batch.merkle_root[:10]}...; the next run checks again")
+            return batch
+        _settle(batch, receipt['status'], receipt['blockNumber'])
+    return batch
+
+
+def check_submitted(log=print):
+    """
+    Settle batches left 'submitted' (sent with --no-wait, or their receipt
+    wait timed out): receipts and mempool entries for all of them go out in
+    one JSON-RPC batch. A transaction gone from the node for longer than
+    TX_DROP_AFTER_SECONDS fails its batch, releasing the records for a new
+    one. Returns {status: count} over the batches checked.
+    """
+    batches = list(AnchorBatch.objects.filter(status='submitted').exclude(tx_hash=None))
+    if not batches:
+        return {}
+    calls = [('eth_getTransactionReceipt', [batch.tx_hash]) for batch in batches]
+    calls += [('eth_getTransactionByHash', [batch.tx_hash]) for batch in batches]
+    results = chain.rpc_batch(calls)
+
+    now = timezone.now()
+    summary = {}
+    for batch, receipt, tx in zip(batches, results, results[len(batches):]):
+        if isinstance(receipt, Exception) or isinstance(tx, Exception):
+            log(f"[Anchor] Batch {batch.merkle_root[:10]}...: {receipt if isinstance(receipt, Exception) else tx}")
+        elif receipt is not None:
+            _settle(batch, int(receipt['status'], 16), int(receipt['blockNumber'], 16))
+        elif tx is None and now - (batch.submitted_at or batch.created_at) > timedelta(
+            seconds=settings.TX_DROP_AFTER_SECONDS
+        ):
+            log(f"[Anchor] Batch {batch.merkle_root[:10]}... tx {batch.tx_hash[:20]}... dropped")
+            batch.status = 'failed'
+            batch.save(update_fields=['status'])
+            _release(batch)
+        summary[batch.status] = summary.get(batch.status, 0) + 1
+    return summary
+
+
+def verify_record(record, onchain=False):
+    """Check a record's inclusion proof locally and, optionally, against the contract"""
+    batch = record.anchor_batch
+    if batch is None or record.merkle_proof is None:
+        return {'anchored': False}
+
+    proof = [merkle.to_bytes32(node) for node in record.merkle_proof]
+    root = merkle.to_bytes32(batch.merkle_root)
+    result = {
+        'anchored': batch.status == 'confirmed',
+        'merkle_root': batch.merkle_root,
+        'proof': record.merkle_proof,
+        'leaf': merkle.to_hex(merkle.leaf_hash(record.file_hash)),
+        'verified': merkle.verify_proof(merkle.leaf_hash(record.file_hash), proof, root),
+        'batch_status': batch.status,
+        'tx_hash': batch.tx_hash,
+        'block_number': batch.block_number,
+    }
+    if onchain:
+        result['verified_onchain'] = chain.get_contract().functions.verifyRecordInclusion(
+            merkle.to_bytes32(record.file_hash), proof, root
+        ).call()
+    return result
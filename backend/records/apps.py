@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class RecordsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'records'
\ No newline at end of file
+    name = 'records'
+
+    def ready(self):
+        from . import changes, events, stats  # noqa: F401  connect the change-log, push and stats signals
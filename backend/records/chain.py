@@ -0,0 +1,298 @@
+from django.conf import settings
+
+from medicalchain.startup import lazy_module
+from .http import get_session
+
+# web3 is the heaviest import in the backend; only chain-facing code pays for it
+web3 = lazy_module('web3')
+eth_abi = lazy_module('eth_abi')
+
+RECORD_COMPONENTS = [
+    {'name': 'ipfsCID', 'type': 'string'},
+    {'name': 'fileHash', 'type': 'bytes32'},
+    {'name': 'patient', 'type': 'address'},
+    {'name': 'uploadedBy', 'type': 'address'},
+    {'name': 'timestamp', 'type': 'uint256'},
+    {'name': 'exists', 'type': 'bool'},
+]
+
+# Fragments of MedicalRecords.sol used by the backend
+MEDICAL_RECORDS_ABI = [
+    {
+        'type': 'function', 'name': 'getRecordsRange', 'stateMutability': 'view',
+        'inputs': [
+            {'name': '_patient', 'type': 'address'},
+            {'name': '_offset', 'type': 'uint256'},
+            {'name': '_limit', 'type': 'uint256'},
+        ],
+        'outputs': [
+            {'name': 'page', 'type': 'tuple[]', 'components': RECORD_COMPONENTS},
+            {'name': 'total', 'type': 'uint256'},
+        ],
+    },
+    {
+        'type': 'function', 'name': 'getRecordCount', 'stateMutability': 'view',
+        'inputs': [{'name': '_patient', 'type': 'address'}],
+        'outputs': [{'name': '', 'type': 'uint256'}],
+    },
+    {
+        'type': 'function', 'name': 'hasAccessBatch', 'stateMutability': 'view',
+        'inputs': [
+            {'name': '_patient', 'type': 'address'},
+            {'name': '_doctors', 'type': 'address[]'},
+        ],
+        'outputs': [{'name': '', 'type': 'bool[]'}],
+    },
+    {
+        'type': 'function', 'name': 'anchorBatch', 'stateMutability': 'nonpayable',
+        'inputs': [
+            {'name': '_merkleRoot', 'type': 'bytes32'},
+            {'name': '_recordCount', 'type': 'uint256'},
+        ],
+        'outputs': [],
+    },
+    {
+        'type': 'function', 'name': 'getAnchor', 'stateMutability': 'view',
+        'inputs': [{'name': '_merkleRoot', 'type': 'bytes32'}],
+        'outputs': [{
+            'name': '', 'type': 'tuple',
+            'components': [
+                {'name': 'anchoredBy', 'type': 'address'},
+                {'name': 'recordCount', 'type': 'uint256'},
+                {'name': 'timestamp', 'type': 'uint256'},
+            ],
+        }],
+    },
+    {
+        'type': 'function', 'name': 'verifyRecordInclusion', 'stateMutability': 'view',
+        'inputs': [
+            {'name': '_fileHash', 'type': 'bytes32'},
+            {'name': '_proof', 'type': 'bytes32[]'},
+            {'name': '_merkleRoot', 'type': 'bytes32'},
+        ],
+        'outputs': [{'name': '', 'type': 'bool'}],
+    },
+]
+
+
+class ChainNotConfigured(Exception):
+    """CHAIN_RPC_URL / CONTRACT_ADDRESS (or a signing key) are missing"""
+
+
+_w3 = None
+
+
+def get_web3():
+    global _w3
+    if not settings.CHAIN_RPC_URL:
+        raise ChainNotConfigured('CHAIN_RPC_URL is not set')
+    if _w3 is None:
+        _w3 = web3.Web3(web3.Web3.HTTPProvider(settings.CHAIN_RPC_URL, request_kwargs={'timeout': 30}))
+    return _w3
+
+
+def get_contract():
+    if not settings.CONTRACT_ADDRESS:
+        raise ChainNotConfigured('CONTRACT_ADDRESS is not set')
+    w3 = get_web3()
+    return w3.eth.contract(address=w3.to_checksum_address(settings.CONTRACT_ADDRESS), abi=MEDICAL_RECORDS_ABI)
+
+
+def send_transaction(function_call, private_key):
+    """Sign and send a contract call from the account of `private_key`; returns the tx hash hex"""
+    if not private_key:
+        raise ChainNotConfigured('No signing key configured')
+    w3 = get_web3()
+    account = w3.eth.account.from_key(private_key)
+    tx = function_call.build_transaction({
+        'from': account.address,
+        'nonce': w3.eth.get_transaction_count(account.address, 'pending'),
+        'chainId': w3.eth.chain_id,
+    })
+    signed = account.sign_transaction(tx)
+    return w3.eth.send_raw_transaction(signed.rawTransaction).hex()
+
+
+def wait_for_receipt(tx_hash, timeout=120):
+    return get_web3().eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+
+
+# What require(condition, "reason") reverts with: Error(string)
+ERROR_SELECTOR = '0x08c379a0'
+# MedicalRecords.requiresAccess's revert reason
+ACCESS_DENIED = 'No access'
+
+
+class ChainCallError(Exception):
+    """A call inside a JSON-RPC batch failed (revert, bad params, ...); `error` is the JSON-RPC error object"""
+
+    def __init__(self, message, error=None):
+        super().__init__(message)
+        self.error = error or {}
+
+    @property
+    def revert_reason(self):
+        """The contract's require() message if the call reverted with one, else None"""
+        data = self.error.get('data')
+        if isinstance(data, dict):  # Hardhat nests it
+            data = data.get('data')
+        if isinstance(data, str) and data.startswith(ERROR_SELECTOR):
+            try:
+                return eth_abi.decode(['string'], bytes.fromhex(data[len(ERROR_SELECTOR):]))[0]
+            except Exception:
+                return None
+        # Nodes that only put the reason in the message
+        message = self.error.get('message') or ''
+        for prefix in ('execution reverted: ', "reverted with reason string '"):
+            if prefix in message:
+                return message.split(prefix, 1)[1].rstrip("'")
+        return None
+
+
+def _abi_type(param):
+    kind = param['type']
+    if kind.startswith('tuple'):
+        return '(' + ','.join(_abi_type(c) for c in param['components']) + ')' + kind[len('tuple'):]
+    return kind
+
+
+def _to_python(param, value):
+    """Turn decoded ABI values into JSON-friendly data, naming struct fields"""
+    kind = param['type']
+    if kind.endswith('[]'):
+        item = dict(param, type=kind[:-2])
+        return [_to_python(item, v) for v in value]
+    if kind == 'tuple':
+        return {c['name']: _to_python(c, v) for c, v in zip(param['components'], value)}
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    if kind == 'address':
+        return value.lower()
+    return value
+
+
+def rpc_batch(calls):
+    """
+    Send many JSON-RPC requests in ONE batch request over the pooled HTTP
+    session (web3's provider sends them one by one). `calls` is a list of
+    (method, params); returns the raw results in order, with a ChainCallError
+    in place of each request that failed.
+    """
+    if not calls:
+        return []
+    if not settings.CHAIN_RPC_URL:
+        raise ChainNotConfigured('CHAIN_RPC_URL is not set')
+    payload = [
+        {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': list(params)}
+        for request_id, (method, params) in enumerate(calls)
+    ]
+    response = get_session().post(settings.CHAIN_RPC_URL, json=payload, timeout=30)
+    response.raise_for_status()
+    body = response.json()
+    if not isinstance(body, list):  # node rejected the batch as a whole
+        raise ChainCallError(f"Batch request failed: {body.get('error', body)}")
+    replies = {reply['id']: reply for reply in body}
+
+    results = []
+    for request_id, (method, _) in enumerate(calls):
+        reply = replies.get(request_id, {'error': {'message': 'missing from batch response'}})
+        if 'error' in reply:
+            results.append(ChainCallError(f"{method}: {reply['error'].get('message')}", reply['error']))
+        else:
+            results.append(reply['result'])
+    return results
+
+
+def batch_call(calls, from_address=None, block='latest'):
+    """
+    Run many read-only contract calls in ONE JSON-RPC batch request.
+
+    `calls` is a list of (function_name, args). Returns one entry per call,
+    in order: the decoded output (a single value, or a dict of named outputs
+    when the function returns several), or a ChainCallError for calls that
+    failed. web3 is only used for ABI encoding.
+    """
+    if not calls:
+        return []
+    contract = get_contract()
+    abi_by_name = {entry['name']: entry for entry in MEDICAL_RECORDS_ABI if entry['type'] == 'function'}
+
+    requests = []
+    for name, args in calls:
+        tx = {'to': contract.address, 'data': contract.encodeABI(fn_name=name, args=list(args))}
+        if from_address:
+            tx['from'] = web3.Web3.to_checksum_address(from_address)
+        requests.append(('eth_call', [tx, block]))
+
+    results = []
+    for (name, _), reply in zip(calls, rpc_batch(requests)):
+        if isinstance(reply, ChainCallError):
+            results.append(ChainCallError(f"{name}: {reply}", reply.error))
+            continue
+        outputs = abi_by_name[name]['outputs']
+        decoded = eth_abi.decode([_abi_type(o) for o in outputs], bytes.fromhex(reply[2:]))
+        values = [_to_python(o, v) for o, v in zip(outputs, decoded)]
+        if len(outputs) == 1:
+            results.append(values[0])
+        else:
+            results.append({o['name'] or str(i): v for i, (o, v) in enumerate(zip(outputs, values))})
+    return results
+
+
+def get_records_pages(patient, pages, caller):
+    """
+    Fetch several (offset, limit) pages of a patient's on-chain records in one
+    round trip, as `caller`: the contract only answers the patient and
+    doctors they granted access
+    """
+    calls = [('getRecordsRange', (web3.Web3.to_checksum_address(patient), offset, limit)) for offset, limit in pages]
+    return batch_call(calls, from_address=caller)
+
+
+def has_access_batch(patient, doctors, chunk_size=200):
+    """Map doctor address -> has access, chunking the doctor list into one batched request"""
+    patient = web3.Web3.to_checksum_address(patient)
+    doctors = [web3.Web3.to_checksum_address(d) for d in doctors]
+    chunks = [doctors[i:i + chunk_size] for i in range(0, len(doctors), chunk_size)]
+    results = batch_call([('hasAccessBatch', (patient, chunk)) for chunk in chunks])
+
+    access = {}
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            raise result
+        access.update({doctor.lower(): allowed for doctor, allowed in zip(chunk, result)})
+    return access
+
+
+ACCESS_EVENTS = {
+    'AccessGranted(address,address,uint256)': 'access.granted',
+    'AccessRevoked(address,address,uint256)': 'access.revoked',
+}
+
+
+def _topic_address(topic):
+    return '0x' + bytes(topic)[-20:].hex()
+
+
+def get_access_events(from_block, to_block):
+    """AccessGranted / AccessRevoked logs in [from_block, to_block], oldest first"""
+    w3 = get_web3()
+    contract = get_contract()
+    names = {'0x' + bytes(w3.keccak(text=signature)).hex(): name for signature, name in ACCESS_EVENTS.items()}
+    logs = w3.eth.get_logs({
+        'address': contract.address,
+        'fromBlock': from_block,
+        'toBlock': to_block,
+        'topics': [list(names)],
+    })
+    return [
+        {
+            'event': names['0x' + bytes(log['topics'][0]).hex()],
+            'patient': _topic_address(log['topics'][1]),
+            'doctor': _topic_address(log['topics'][2]),
+            'timestamp': int.from_bytes(bytes(log['data'])[:32], 'big'),
+            'block_number': log['blockNumber'],
+            'tx_hash': '0x' + bytes(log['transactionHash']).hex(),
+        }
+        for log in logs
+    ]
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MedicalRecord, RecordChange
+
+
+def log_changes(records, operation='upsert'):
+    """Append change-log rows; call this for writes that skip model signals (bulk_create, update())"""
+    RecordChange.objects.bulk_create([
+        RecordChange(
+            record_id=record.record_id,
+            patient=record.patient_id,
+            uploaded_by=record.uploaded_by_id,
+            operation=operation,
+        )
+        for record in records
+    ])
+
+
+@receiver(post_save, sender=MedicalRecord, dispatch_uid='records_change_log_save')
+def _record_saved(sender, instance, raw=False, **kwargs):
+    if not raw:  # fixtures load without logging
+        log_changes([instance])
+
+
+@receiver(post_delete, sender=MedicalRecord, dispatch_uid='records_change_log_delete')
+def _record_deleted(sender, instance, **kwargs):
+    log_changes([instance], operation='delete')
+
+
+def changes_since(wallet, role, cursor, limit, serialize):
+    """
+    Collapse the change log after `cursor` for one wallet into current record
+    rows plus tombstones. `serialize` turns a MedicalRecord queryset into row
+    dicts. Returns (rows, deleted_ids, next_cursor, has_more).
+
+    Ids are allocated before commit, so a slow transaction can commit a lower
+    change_id after a reader has moved past it. Changes younger than
+    RECORD_CHANGES_SETTLE_SECONDS are left for the next poll to avoid that.
+    """
+    column = 'patient' if role == 'patient' else 'uploaded_by'
+    settled = timezone.now() - timedelta(seconds=settings.RECORD_CHANGES_SETTLE_SECONDS)
+    page = list(
+        RecordChange.objects
+        .filter(**{column: wallet}, change_id__gt=cursor, changed_at__lte=settled)
+        .order_by('change_id')
+        .values_list('change_id', 'record_id', 'operation')[:limit + 1]
+    )
+    has_more = len(page) > limit
+    page = page[:limit]
+    if not page:
+        return [], [], cursor, False
+
+    # Last operation per record wins
+    latest = {}
+    for _, record_id, operation in page:
+        latest[record_id] = operation
+    upserted = [record_id for record_id, operation in latest.items() if operation == 'upsert']
+
+    rows = serialize(MedicalRecord.objects.filter(record_id__in=upserted, **{column: wallet}))
+    # Logged as upserted but already gone again counts as deleted too
+    present = {row['record_id'] for row in rows}
+    deleted = sorted(record_id for record_id in latest if record_id not in present)
+    return rows, deleted, page[-1][0], has_more
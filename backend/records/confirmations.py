@@ -0,0 +1,158 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from . import chain, events
+from .models import MedicalRecord
+
+TX_HASH = re.compile(r'^0x[0-9a-fA-F]{64}$')
+# Confirmed records considered for the latency percentiles
+LATENCY_SAMPLE = 1000
+
+
+def is_tx_hash(value):
+    return bool(TX_HASH.match(value or ''))
+
+
+def _int(hex_value):
+    return int(hex_value, 16) if hex_value is not None else None
+
+
+def pending_records(limit):
+    """Pending transactions, never-checked first, then least recently checked"""
+    return (
+        MedicalRecord.objects.filter(tx_status='pending')
+        .order_by(F('tx_checked_at').asc(nulls_first=True), 'record_id')[:limit]
+    )
+
+
+def _classify(record, receipt, tx, head, now):
+    """New (status, fields) for a record from its receipt / mempool entry"""
+    if receipt is not None:
+        block = _int(receipt['blockNumber'])
+        if head - block + 1 < settings.TX_CONFIRMATIONS:
+            return 'pending', {'tx_block_number': block}
+        to = (receipt.get('to') or '').lower()
+        wrong_target = settings.CONTRACT_ADDRESS and to != settings.CONTRACT_ADDRESS.lower()
+        succeeded = _int(receipt['status']) == 1 and not wrong_target
+        return 'confirmed' if succeeded else 'failed', {'tx_block_number': block, 'tx_confirmed_at': now}
+    if tx is not None:
+        return 'pending', {'tx_sender': (tx.get('from') or '').lower(), 'tx_nonce': _int(tx.get('nonce'))}
+    submitted = record.tx_submitted_at or record.created_at
+    if now - submitted > timedelta(seconds=settings.TX_DROP_AFTER_SECONDS):
+        return 'dropped', {}
+    return 'pending', {}
+
+
+def poll(limit=None, log=print):
+    """
+    One confirmation pass over up to `limit` pending transactions: receipts
+    and mempool entries for every hash plus the chain head go out in a single
+    JSON-RPC batch; a second batch reads the sender nonces of transactions
+    that vanished, to tell replaced from dropped. Returns {status: count}.
+    """
+    records = list(pending_records(limit or settings.TX_CONFIRM_BATCH_SIZE))
+    if not records:
+        return {}
+    hashes = sorted({record.tx_hash.lower() for record in records})
+    calls = [('eth_blockNumber', [])]
+    calls += [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in hashes]
+    calls += [('eth_getTransactionByHash', [tx_hash]) for tx_hash in hashes]
+    results = chain.rpc_batch(calls)
+    if isinstance(results[0], Exception):
+        raise results[0]
+    head = _int(results[0])
+    receipts = dict(zip(hashes, results[1:len(hashes) + 1]))
+    transactions = dict(zip(hashes, results[len(hashes) + 1:]))
+
+    now = timezone.now()
+    outcomes = []
+    for record in records:
+        receipt, tx = receipts[record.tx_hash.lower()], transactions[record.tx_hash.lower()]
+        if isinstance(receipt, Exception) or isinstance(tx, Exception):
+            log(f"[Confirm] Record {record.record_id}: {receipt if isinstance(receipt, Exception) else tx}")
+            outcomes.append((record, 'pending', {}))
+            continue
+        outcomes.append((record, *_classify(record, receipt, tx, head, now)))
+
+    # A vanished transaction whose nonce the sender has since used was replaced
+    vanished = [
+        (i, record) for i, (record, new_status, _) in enumerate(outcomes)
+        if receipts[record.tx_hash.lower()] is None and transactions[record.tx_hash.lower()] is None
+        and record.tx_sender and record.tx_nonce is not None
+    ]
+    if vanished:
+        senders = sorted({record.tx_sender for _, record in vanished})
+        counts = dict(zip(senders, chain.rpc_batch([('eth_getTransactionCount', [s, 'latest']) for s in senders])))
+        for i, record in vanished:
+            count = counts[record.tx_sender]
+            if not isinstance(count, Exception) and _int(count) > record.tx_nonce:
+                outcomes[i] = (record, 'replaced', {})
+
+    summary = {}
+    for record, new_status, fields in outcomes:
+        summary[new_status] = summary.get(new_status, 0) + 1
+        record.tx_checked_at = now
+        changed = new_status != record.tx_status
+        record.tx_status = new_status
+        for name, value in fields.items():
+            setattr(record, name, value)
+        if changed:
+            # save(), not update(): bumps updated_at so ETags, delta sync and SSE see it
+            record.save(update_fields=['tx_status', 'tx_checked_at', 'updated_at', *fields])
+            events.record_tx_status(record)
+            if new_status != 'confirmed':
+                log(f"[Confirm] Record {record.record_id} tx {record.tx_hash[:20]}...: {new_status}")
+        else:
+            MedicalRecord.objects.filter(pk=record.pk).update(tx_checked_at=now, **fields)
+    return summary
+
+
+def submit(record, tx_hash):
+    """Record a client-reported transaction; the poller decides its fate"""
+    record.tx_hash = tx_hash
+    record.tx_status = 'pending'
+    record.tx_submitted_at = timezone.now()
+    record.tx_block_number = record.tx_confirmed_at = record.tx_checked_at = record.tx_nonce = None
+    record.tx_sender = ''
+    record.save()
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def lag_metrics():
+    """
+    Aggregate confirmation health: counts per status, the pending backlog
+    and its oldest member, and submit -> confirm latency over the most
+    recent confirmations.
+    """
+    now = timezone.now()
+    counts = dict(MedicalRecord.objects.order_by().values_list('tx_status').annotate(count=Count('record_id')))
+    pending = MedicalRecord.objects.filter(tx_status='pending').aggregate(
+        oldest=Min('tx_submitted_at'), last_checked=Min('tx_checked_at')
+    )
+    latencies = sorted(
+        (confirmed - submitted).total_seconds()
+        for submitted, confirmed in MedicalRecord.objects.filter(
+            tx_status='confirmed', tx_submitted_at__isnull=False, tx_confirmed_at__isnull=False
+        ).order_by('-tx_confirmed_at').values_list('tx_submitted_at', 'tx_confirmed_at')[:LATENCY_SAMPLE]
+    )
+    return {
+        'counts': counts,
+        'pending': counts.get('pending', 0),
+        'oldest_pending_seconds': (now - pending['oldest']).total_seconds() if pending['oldest'] else None,
+        # Longest any pending tx has gone unchecked; grows if the poller stops
+        'stalest_check_seconds': (now - pending['last_checked']).total_seconds() if pending['last_checked'] else None,
+        'confirmation_seconds': {
+            'samples': len(latencies),
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'p50': _percentile(latencies, 0.5) if latencies else None,
+            'p95': _percentile(latencies, 0.95) if latencies else None,
+            'max': latencies[-1] if latencies else None,
+        },
+    }
@@ -0,0 +1,229 @@
+import json
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MedicalRecord, PushEvent
+
+
+def publish(event, wallets, data):
+    """Queue `event` for each wallet; written once the surrounding transaction commits"""
+    wallets = sorted({wallet.lower() for wallet in wallets if wallet})
+
+    def write():
+        PushEvent.objects.bulk_create([PushEvent(wallet=wallet, event=event, data=data) for wallet in wallets])
+
+    transaction.on_commit(write)
+
+
+def _record_data(record):
+    return {
+        'record_id': record.record_id,
+        'patient_address': record.patient_id,
+        'doctor_address': record.uploaded_by_id,
+        'filename': record.filename,
+        'ipfs_cid': record.ipfs_cid,
+        'tx_hash': record.tx_hash,
+        'tx_status': record.tx_status,
+        'tx_block_number': record.tx_block_number,
+    }
+
+
+def records_created(records):
+    """Announce new records to their patient and uploader; call this after bulk_create"""
+    for record in records:
+        publish('record.created', [record.patient_id, record.uploaded_by_id], _record_data(record))
+
+
+def record_confirmed(record):
+    publish('record.confirmed', [record.patient_id, record.uploaded_by_id], _record_data(record))
+
+
+def record_tx_status(record):
+    """record.confirmed, or record.tx_failed / tx_replaced / tx_dropped, once the confirmation poller settles a tx"""
+    if record.tx_status == 'confirmed':
+        return record_confirmed(record)
+    if record.tx_status != 'pending':
+        publish(f'record.tx_{record.tx_status}', [record.patient_id, record.uploaded_by_id], _record_data(record))
+
+
+@receiver(post_save, sender=MedicalRecord, dispatch_uid='records_push_created')
+def _record_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        records_created([instance])
+
+
+def settled_events():
+    """
+    push_events old enough to send. Ids are allocated before commit, so a
+    slow writer can commit a lower id after a reader has moved past it;
+    events younger than SSE_SETTLE_SECONDS wait for the next poll, as in
+    changes.changes_since.
+    """
+    settled = timezone.now() - timedelta(seconds=settings.SSE_SETTLE_SECONDS)
+    return PushEvent.objects.filter(created_at__lte=settled)
+
+
+class EventHub:
+    """
+    Per-process fan-out. One background thread polls push_events for new ids
+    and hands each row to the queues of local subscribers for that wallet, so
+    a worker runs one cheap indexed query per interval however many
+    connections it holds. The thread stops when the last subscriber leaves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._thread = None
+        self.last_id = 0
+
+    def subscribe(self, wallet):
+        subscriber = queue.Queue(maxsize=settings.SSE_QUEUE_SIZE)
+        # Set when an event didn't fit; the stream then re-reads push_events
+        subscriber.overflowed = False
+        with self._lock:
+            self._subscribers.setdefault(wallet, set()).add(subscriber)
+            if self._thread is None:
+                self.last_id = settled_events().order_by('-id').values_list('id', flat=True).first() or 0
+                self._thread = threading.Thread(target=self._run, name='sse-event-hub', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, wallet, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(wallet, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(wallet, None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _run(self):
+        last_prune = time.monotonic()
+        try:
+            while True:
+                time.sleep(settings.SSE_POLL_INTERVAL)
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        return
+                close_old_connections()
+                self._dispatch()
+                if time.monotonic() - last_prune > 60:
+                    prune_events()
+                    last_prune = time.monotonic()
+        except Exception as e:
+            print(f"[EventHub] Poller stopped: {e}")
+            with self._lock:
+                self._thread = None
+        finally:
+            connection.close()
+
+    def _dispatch(self):
+        rows = list(
+            settled_events().filter(id__gt=self.last_id).order_by('id')
+            .values('id', 'wallet', 'event', 'data')[:1000]
+        )
+        for row in rows:
+            with self._lock:
+                subscribers = list(self._subscribers.get(row['wallet'], ()))
+            for subscriber in subscribers:
+                try:
+                    subscriber.put_nowait(row)
+                except queue.Full:
+                    # Client isn't reading; its stream catches up from the table
+                    subscriber.overflowed = True
+                    print(f"[EventHub] Queue full for slow client {row['wallet'][:10]}... at event {row['id']}")
+        if rows:
+            self.last_id = rows[-1]['id']
+
+
+hub = EventHub()
+
+
+def prune_events():
+    cutoff = timezone.now() - timedelta(seconds=settings.SSE_EVENT_RETENTION_SECONDS)
+    PushEvent.objects.filter(created_at__lt=cutoff).delete()
+
+
+def format_event(row):
+    return f"id: {row['id']}\nevent: {row['event']}\ndata: {json.dumps(row['data'])}\n\n"
+
+
+def _catch_up(wallet, subscriber, after):
+    """
+    Events for `wallet` after id `after` from the table, a page at a time,
+    until a short page shows it's caught up. Queued live events are all in
+    the table too, so they're discarded first to make room; if the queue
+    still overflows while a page is being sent, another page is read.
+    """
+    while True:
+        subscriber.overflowed = False
+        while True:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                break
+        rows = list(
+            settled_events().filter(wallet=wallet, id__gt=after).order_by('id')
+            .values('id', 'event', 'data')[:settings.SSE_QUEUE_SIZE]
+        )
+        for row in rows:
+            after = row['id']
+            yield row
+        if len(rows) < settings.SSE_QUEUE_SIZE and not subscriber.overflowed:
+            return
+
+
+def stream(wallet, last_event_id=None):
+    """
+    SSE body for one wallet: replays events after `last_event_id` (from the
+    Last-Event-ID header on reconnect), then live events with keepalive
+    comments. Replay, and recovery from a full queue, page through
+    push_events until caught up. Connections end after SSE_MAX_CONNECTION_SECONDS and the
+    browser reconnects on its own, which spreads long-lived threads over
+    workers and lets deploys drain.
+    """
+    replay = last_event_id is not None
+    if not replay:
+        # A new subscriber starts from now: catch-ups after an overflow resume here
+        latest = settled_events().filter(wallet=wallet).order_by('-id').values_list('id', flat=True).first()
+        last_event_id = latest or 0
+    # Subscribe before replaying so nothing published in between is lost
+    subscriber = hub.subscribe(wallet)
+    try:
+        yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+        sent = last_event_id
+        if replay:
+            for row in _catch_up(wallet, subscriber, sent):
+                sent = row['id']
+                yield format_event(row)
+
+        deadline = time.monotonic() + settings.SSE_MAX_CONNECTION_SECONDS
+        while time.monotonic() < deadline:
+            if subscriber.overflowed:
+                # Events were dropped while this client fell behind
+                for row in _catch_up(wallet, subscriber, sent):
+                    sent = row['id']
+                    yield format_event(row)
+            try:
+                row = subscriber.get(timeout=settings.SSE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if row['id'] <= sent:
+                continue
+            sent = row['id']
+            yield format_event(row)
+    finally:
+        hub.unsubscribe(wallet, subscriber)
@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import re
+import tarfile
+import zipfile
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import storage
+from .pipeline import ordered_prefetch
+
+FORMATS = {
+    'zip': 'application/zip',
+    'tar': 'application/x-tar',
+}
+UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9._ -]+')
+
+
+class _ChunkSink:
+    """Write-only file object the archive writers stream into; drained after each entry"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def entry_name(record):
+    """Stable, collision-free archive name; the record id prefix also orders entries"""
+    filename = UNSAFE_NAME_CHARS.sub('_', os.path.basename(record.filename.replace('\\', '/'))) or 'record'
+    return f"{record.record_id:08d}_{filename}"
+
+
+def _manifest_entry(record, name, content):
+    return {
+        'record_id': record.record_id,
+        'name': name,
+        'filename': record.filename,
+        'record_type': record.record_type,
+        'size': len(content),
+        'file_hash': record.file_hash,
+        'ipfs_cid': record.ipfs_cid,
+        'tx_hash': record.tx_hash,
+        'created_at': record.created_at.isoformat(),
+        'uploaded_by': record.uploaded_by_id,
+    }
+
+
+def _read(record):
+    if not record.wrapped_key:
+        raise storage.StorageError('Legacy record: key is held by the client, export it with download_record')
+    return storage.read_record(record)
+
+
+class ArchiveWriter:
+    def __init__(self, archive_format, sink):
+        self.format = archive_format
+        if archive_format == 'zip':
+            # Non-seekable sink: zipfile writes data descriptors instead of seeking back
+            self.archive = zipfile.ZipFile(sink, 'w', allowZip64=True)
+        else:
+            self.archive = tarfile.open(fileobj=sink, mode='w|', format=tarfile.PAX_FORMAT)
+
+    def add(self, name, content, modified, compress=False):
+        if self.format == 'zip':
+            info = zipfile.ZipInfo(name, date_time=modified.timetuple()[:6])
+            # Only deflate what the encryption service also found compressible
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            info.file_size = len(content)
+            with self.archive.open(info, 'w', force_zip64=len(content) > zipfile.ZIP64_LIMIT) as entry:
+                entry.write(content)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mtime = int(modified.timestamp())
+            info.mode = 0o644
+            self.archive.addfile(info, io.BytesIO(content))
+
+    def close(self):
+        self.archive.close()
+
+
+def stream_archive(patient, records, archive_format='zip'):
+    """
+    Yield a ZIP/tar of `records` chunk by chunk. Entries are fetched from
+    IPFS, decrypted and hash-checked EXPORT_FETCH_WORKERS at a time ahead of
+    the writer, so memory holds a few decrypted files at most, never the
+    archive. manifest.json goes last, listing hashes and tx hashes of what
+    was exported and why anything was skipped.
+    """
+    sink = _ChunkSink()
+    writer = ArchiveWriter(archive_format, sink)
+    exported, failed = [], []
+
+    for record, content in ordered_prefetch(records, _read, workers=settings.EXPORT_FETCH_WORKERS):
+        if isinstance(content, Exception):
+            print(f"[Export] Record {record.record_id} skipped: {content}")
+            failed.append({'record_id': record.record_id, 'filename': record.filename, 'error': str(content)})
+            continue
+        name = entry_name(record)
+        writer.add(name, content, record.created_at, compress=record.compression != 'none')
+        exported.append(_manifest_entry(record, name, content))
+        del content
+        yield sink.drain()
+
+    manifest = {
+        'patient_address': patient,
+        'format': archive_format,
+        'last_record_id': exported[-1]['record_id'] if exported else None,
+        'records': exported,
+        'failed': failed,
+    }
+    writer.add('manifest.json', json.dumps(manifest, indent=2).encode('utf-8'), timezone.now())
+    writer.close()
+    yield sink.drain()
+    print(f"[Export] {patient}: {len(exported)} records exported, {len(failed)} failed")
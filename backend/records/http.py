@@ -0,0 +1,31 @@
+import threading
+
+from django.conf import settings
+
+from medicalchain.startup import lazy_module
+
+requests = lazy_module('requests')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Process-wide requests.Session with a keep-alive connection pool, shared by
+    calls to the encryption service and Pinata so each request doesn't pay for
+    a fresh TCP/TLS handshake.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
@@ -0,0 +1,186 @@
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.25
+PRUNE_INTERVAL = 60
+# Never stored for replay: a record's plaintext key only ever travels in its first response
+SECRET_FIELDS = ('encryption_key',)
+
+_last_prune = 0.0
+
+
+def fingerprint(request):
+    """
+    SHA-256 of the request, to tell a retry from a different request. Multipart
+    bodies are fingerprinted by media type and length only: parsing them here
+    would spool an upload before the view installs its encrypting upload
+    handler. The boundary is left out as clients pick a new one per attempt.
+    """
+    if request.content_type.startswith('multipart/'):
+        fields = {'multipart': request.META.get('CONTENT_LENGTH', '')}
+    else:
+        data = request.data
+        fields = dict(data.lists()) if hasattr(data, 'lists') else data
+    body = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def _stored(data):
+    """`data` without SECRET_FIELDS, at any depth (batch uploads nest them per file)"""
+    if isinstance(data, dict):
+        return {name: _stored(value) for name, value in data.items() if name not in SECRET_FIELDS}
+    if isinstance(data, list):
+        return [_stored(value) for value in data]
+    return data
+
+
+def _prune():
+    """Drop expired keys, at most once a minute per process"""
+    global _last_prune
+    if time.monotonic() - _last_prune > PRUNE_INTERVAL:
+        _last_prune = time.monotonic()
+        IdempotencyKey.objects.filter(expires_at__lt=timezone.now()).delete()
+
+
+def _claim(scope):
+    """
+    Take the key for this request. Returns None when the caller now owns it
+    and must run the view, else the row of the request that owns it. An
+    expired result or an abandoned lock is taken over, by exactly one claimant.
+    """
+    now = timezone.now()
+    fresh = {
+        'locked_at': now,
+        'completed_at': None,
+        'response_status': None,
+        'response_data': None,
+        'fingerprint': '',
+        'expires_at': now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+    }
+    while True:
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(**scope, **fresh)
+            return None
+        except IntegrityError:
+            entry = IdempotencyKey.objects.filter(**scope).first()
+        if entry is not None:  # else the owner released it in between; insert again
+            break
+
+    abandoned = entry.completed_at is None and \
+        entry.locked_at < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    if entry.expires_at <= now or abandoned:
+        taken = IdempotencyKey.objects.filter(
+            pk=entry.pk, locked_at=entry.locked_at, completed_at=entry.completed_at
+        ).update(**fresh)
+        if taken:
+            if abandoned:
+                print(f"[Idempotency] Re-running {scope['endpoint']} [{scope['key']}]: previous attempt never finished")
+            return None
+        entry.refresh_from_db()
+    return entry
+
+
+def _wait(entry):
+    """
+    Block while the first request is running. Returns its finished row, the
+    still-unfinished row after IDEMPOTENCY_WAIT_SECONDS, or None when it
+    failed and released the key (the waiter may run the request itself).
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while entry is not None and entry.completed_at is None and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = IdempotencyKey.objects.filter(pk=entry.pk).first()
+    return entry
+
+
+def _replay(request, entry):
+    if entry.fingerprint and fingerprint(request) != entry.fingerprint:
+        return Response(
+            {'error': f'{HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    print(f"[Idempotency] Replaying {entry.endpoint} [{entry.key}] ({entry.response_status})")
+    return Response(entry.response_data, status=entry.response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def _finish(scope, request, response):
+    """
+    Store a deterministic outcome for replay, minus plaintext keys. Server
+    errors (encryption service or IPFS down) release the key instead, so a
+    retry runs again.
+    """
+    if isinstance(response, Response) and response.status_code < 500:
+        IdempotencyKey.objects.filter(**scope).update(
+            completed_at=timezone.now(),
+            response_status=response.status_code,
+            response_data=_stored(response.data),
+            fingerprint=fingerprint(request),
+        )
+    else:
+        IdempotencyKey.objects.filter(**scope, completed_at__isnull=True).delete()
+
+
+def idempotent(view):
+    """
+    Idempotency-Key support for a write endpoint (apply below @api_view).
+    Requests without the header run as before. With it, the first request
+    runs and its response is stored; retries with the same key (per wallet
+    and endpoint) get that response back with Idempotent-Replayed: true, and
+    duplicates arriving while it runs wait for it rather than running the
+    pipeline a second time. Replayed responses omit SECRET_FIELDS.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER, '').strip()
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} too long (max {MAX_KEY_LENGTH} characters)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        scope = {
+            'key': key,
+            'wallet': request.headers.get('X-Wallet-Address', '').lower()[:42],
+            'endpoint': request.path[:200],
+        }
+        _prune()
+
+        # A few rounds: each lost race or released key sends us back to claiming
+        for _ in range(3):
+            entry = _claim(scope)
+            if entry is None:
+                try:
+                    response = view(request, *args, **kwargs)
+                except Exception:
+                    _finish(scope, request, None)
+                    raise
+                _finish(scope, request, response)
+                return response
+            entry = _wait(entry)
+            if entry is not None and entry.completed_at is not None:
+                return _replay(request, entry)
+            if entry is not None:
+                break
+
+        return Response(
+            {'error': f'A request with this {HEADER} is still in progress'},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': str(max(1, int(settings.IDEMPOTENCY_WAIT_SECONDS)))}
+        )
+
+    return wrapper
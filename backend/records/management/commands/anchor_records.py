@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from records import anchoring, chain
+from records.models import AnchorBatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Anchor pending record hashes on-chain as Merkle-batched roots; first settles "
+        "batches submitted earlier whose receipt was never seen"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Max records per batch (default ANCHOR_BATCH_SIZE)')
+        parser.add_argument('--all', action='store_true', help='Keep batching until nothing is pending')
+        parser.add_argument('--dry-run', action='store_true', help='Build batches and proofs without submitting')
+        parser.add_argument('--no-wait', action='store_true', help="Don't wait for transaction receipts")
+
+    def handle(self, *args, **options):
+        if not options['dry_run']:
+            # Batches sent earlier whose outcome was never seen
+            try:
+                settled = anchoring.check_submitted(log=self.stdout.write)
+            except chain.ChainNotConfigured as e:
+                raise CommandError(str(e))
+            for batch_status, count in sorted(settled.items()):
+                self.stdout.write(f"Submitted batches now {batch_status}: {count}")
+            # Batches built earlier but never sent (e.g. chain was unreachable)
+            for batch in AnchorBatch.objects.filter(status='pending'):
+                self._submit(batch, options)
+
+        while True:
+            batch = anchoring.create_batch(options['limit'])
+            if batch is None:
+                self.stdout.write("No records pending anchoring")
+                return
+
+            self.stdout.write(f"Built batch {batch.merkle_root} over {batch.record_count} records")
+            if not options['dry_run']:
+                self._submit(batch, options)
+
+            if not options['all']:
+                return
+
+    def _submit(self, batch, options):
+        try:
+            anchoring.submit_batch(batch, wait=not options['no_wait'])
+        except chain.ChainNotConfigured as e:
+            raise CommandError(f"{e}; batch {batch.merkle_root} left pending")
+        self.stdout.write(self.style.SUCCESS(f"  {batch.merkle_root}: {batch.status}, tx {batch.tx_hash}"))
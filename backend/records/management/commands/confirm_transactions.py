@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from records import chain, confirmations
+
+
+class Command(BaseCommand):
+    help = "Fetch receipts for pending record transactions in batched RPC requests and settle their status"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Transactions per poll (default TX_CONFIRM_BATCH_SIZE)')
+        parser.add_argument('--follow', action='store_true', help='Keep polling')
+        parser.add_argument('--interval', type=float, help='Seconds between polls with --follow (default TX_CONFIRM_INTERVAL)')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] if options['interval'] is not None else settings.TX_CONFIRM_INTERVAL
+        while True:
+            try:
+                summary = confirmations.poll(limit=options['limit'], log=self.stdout.write)
+            except chain.ChainNotConfigured as e:
+                raise CommandError(str(e))
+            except Exception as e:
+                if not options['follow']:
+                    raise CommandError(f'Poll failed: {e}')
+                # RPC hiccups shouldn't kill the follower; the next poll retries
+                self.stderr.write(f"Poll failed: {e}")
+                summary = None
+            if summary:
+                self.stdout.write(f"Confirmation poll: {summary}")
+            if not options['follow']:
+                if summary is not None and not summary:
+                    self.stdout.write("No pending transactions")
+                return
+            time.sleep(interval)
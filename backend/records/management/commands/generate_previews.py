@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from records import previews, storage
+from records.models import MedicalRecord, RecordPreview
+
+
+class Command(BaseCommand):
+    help = "Pre-generate encrypted thumbnails so the first view of a record is instant"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--record-type', default='imaging', help="Record type to cover, or 'all' (default imaging)")
+        parser.add_argument('--size', type=int, action='append', help='Thumbnail size; repeatable (default all PREVIEW_SIZES)')
+        parser.add_argument('--limit', type=int, help='Stop after this many records')
+
+    def handle(self, *args, **options):
+        sizes = options['size'] or settings.PREVIEW_SIZES
+        records = MedicalRecord.objects.exclude(wrapped_key__isnull=True).exclude(wrapped_key='').order_by('record_id')
+        if options['record_type'] != 'all':
+            records = records.filter(record_type=options['record_type'])
+
+        done = 0
+        for record in records.iterator():
+            if not previews.is_previewable(record):
+                continue
+            cached = set(RecordPreview.objects.filter(ipfs_cid=record.ipfs_cid).values_list('size', flat=True))
+            for size in sizes:
+                if size in cached:
+                    continue
+                try:
+                    preview = previews.generate_preview(record, size)
+                except storage.StorageError as e:
+                    self.stderr.write(f"Record {record.record_id}: {e}")
+                    break
+                self.stdout.write(f"Record {record.record_id} @ {size}px: {'ok' if preview.available else 'unavailable'}")
+            done += 1
+            if options['limit'] and done >= options['limit']:
+                break
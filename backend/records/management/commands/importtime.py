@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+BOOT_SNIPPET = "import django; django.setup(); import {root_urlconf}"
+
+
+class Command(BaseCommand):
+    help = "Report the slowest imports of a fresh worker boot (python -X importtime)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Number of modules to show')
+        parser.add_argument(
+            '--self', action='store_true', dest='self_time',
+            help='Sort by self time instead of cumulative time'
+        )
+
+    def handle(self, *args, **options):
+        code = BOOT_SNIPPET.format(root_urlconf=settings.ROOT_URLCONF)
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'medicalchain.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True, cwd=settings.BASE_DIR, env=env
+        )
+        if result.returncode != 0:
+            self.stderr.write(result.stderr)
+            return
+
+        rows = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, module = line[len('import time:'):].split('|')
+            rows.append((int(self_us), int(cumulative_us), module.strip()))
+
+        column = 0 if options['self_time'] else 1
+        rows.sort(key=lambda row: row[column], reverse=True)
+        total_ms = sum(row[0] for row in rows) / 1000
+
+        self.stdout.write(f"{len(rows)} modules, {total_ms:.1f} ms total import time")
+        self.stdout.write(f"{'self ms':>9} {'cumul ms':>9}  module")
+        for self_us, cumulative_us, module in rows[:options['top']]:
+            self.stdout.write(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {module}")
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from records import chain, events
+from records.models import ChainCursor
+
+CURSOR_NAME = 'access_events'
+
+
+class Command(BaseCommand):
+    help = "Index AccessGranted/AccessRevoked events and push them to the patient and doctor over SSE"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-block', type=int, help='Start here instead of the saved cursor')
+        parser.add_argument('--follow', action='store_true', help='Keep polling for new blocks')
+        parser.add_argument('--interval', type=float, default=12, help='Seconds between polls with --follow')
+
+    def handle(self, *args, **options):
+        cursor, _ = ChainCursor.objects.get_or_create(
+            name=CURSOR_NAME, defaults={'block_number': settings.ACCESS_INDEXER_START_BLOCK - 1}
+        )
+        if options['from_block'] is not None:
+            cursor.block_number = options['from_block'] - 1
+
+        while True:
+            try:
+                self._catch_up(cursor)
+            except chain.ChainNotConfigured as e:
+                raise CommandError(str(e))
+            if not options['follow']:
+                return
+            time.sleep(options['interval'])
+
+    def _catch_up(self, cursor):
+        # Stay a few blocks behind the head so reorged-out events aren't pushed
+        head = chain.get_web3().eth.block_number - settings.ACCESS_INDEXER_CONFIRMATIONS
+        while cursor.block_number < head:
+            start = cursor.block_number + 1
+            end = min(start + settings.ACCESS_INDEXER_CHUNK_BLOCKS - 1, head)
+            found = chain.get_access_events(start, end)
+            for event in found:
+                events.publish(event['event'], [event['patient'], event['doctor']], event)
+            cursor.block_number = end
+            cursor.save()
+            self.stdout.write(f"Blocks {start}-{end}: {len(found)} access events")
@@ -0,0 +1,97 @@
+import glob
+import io
+import json
+import os
+import pstats
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "List request profiles captured by the profiling middleware (both services "
+        "write the same format), show one, or merge stack samples into flamegraph input"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_id', nargs='?', help='Show this profile')
+        parser.add_argument('--dir', help='Profile directory (default PROFILE_DIR)')
+        parser.add_argument('--endpoint', help='Only profiles of this URL name / endpoint')
+        parser.add_argument('--service', help="Only profiles from 'backend' or 'encryption'")
+        parser.add_argument('--limit', type=int, default=20, help='Profiles to list')
+        parser.add_argument('--top', type=int, default=30, help='Functions to show for a cProfile profile')
+        parser.add_argument(
+            '--fold', action='store_true',
+            help='Print the matching profiles\' stack samples merged into one folded file '
+                 '(pipe to flamegraph.pl, or load into speedscope)'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or settings.PROFILE_DIR
+        profiles = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.json')), reverse=True):
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue  # trimmed or still being written
+            if options['endpoint'] and meta.get('endpoint') != options['endpoint']:
+                continue
+            if options['service'] and meta.get('service') != options['service']:
+                continue
+            profiles.append(meta)
+
+        if options['profile_id']:
+            self.show(directory, options['profile_id'], options['top'])
+        elif options['fold']:
+            self.fold(directory, profiles)
+        else:
+            self.list(profiles[:options['limit']])
+
+    def list(self, profiles):
+        if not profiles:
+            self.stdout.write("No profiles")
+            return
+        for meta in profiles:
+            peak = meta.get('alloc_peak_bytes')
+            self.stdout.write(
+                f"{meta['id']}  {meta.get('method', '')} {meta.get('endpoint') or meta.get('path')} "
+                f"-> {meta.get('status')}  {meta['duration_ms']:.1f} ms  {meta['mode']}"
+                + (f" ({meta['samples']} samples)" if meta.get('samples') is not None else '')
+                + (f"  peak {peak / 1024:.0f} KiB" if peak is not None else '')
+                + f"  [{meta.get('reason')}]"
+            )
+
+    def show(self, directory, profile_id, top):
+        stem = os.path.join(directory, os.path.basename(profile_id))
+        if not os.path.exists(f'{stem}.json'):
+            raise CommandError(f'No profile {profile_id} in {directory}')
+        with open(f'{stem}.json') as f:
+            self.stdout.write(json.dumps(json.load(f), indent=2))
+        if os.path.exists(f'{stem}.folded'):
+            with open(f'{stem}.folded') as f:
+                self.stdout.write(f.read())
+        if os.path.exists(f'{stem}.pstats'):
+            out = io.StringIO()
+            pstats.Stats(f'{stem}.pstats', stream=out).sort_stats('cumulative').print_stats(top)
+            self.stdout.write(out.getvalue())
+        if os.path.exists(f'{stem}.alloc.txt'):
+            with open(f'{stem}.alloc.txt') as f:
+                self.stdout.write(f.read())
+
+    def fold(self, directory, profiles):
+        stacks = Counter()
+        for meta in profiles:
+            try:
+                with open(os.path.join(directory, f"{meta['id']}.folded")) as f:
+                    for line in f:
+                        stack, _, count = line.rstrip('\n').rpartition(' ')
+                        stacks[stack] += int(count)
+            except FileNotFoundError:
+                continue  # cProfile-mode profile, or trimmed
+        if not stacks:
+            raise CommandError('No stack samples match (profiles need PROFILE_MODE=sample)')
+        for stack, count in stacks.most_common():
+            self.stdout.write(f'{stack} {count}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from records import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-patient record statistics from the records themselves"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--patient', action='append', dest='patients', metavar='WALLET',
+            help='Only this patient (repeatable; default every patient)'
+        )
+        parser.add_argument('--check', action='store_true', help='Report drifted rows without fixing them')
+
+    def handle(self, *args, **options):
+        patients = [wallet.lower() for wallet in options['patients']] if options['patients'] else None
+        drifted = stats.rebuild(patients, check=options['check'])
+        for patient in drifted:
+            self.stdout.write(f"{'Drifted' if options['check'] else 'Rebuilt'}: {patient}")
+        self.stdout.write(
+            f"{len(drifted)} patient row(s) {'out of date' if options['check'] else 'rebuilt'}"
+            if drifted else "All patient stats up to date"
+        )
@@ -0,0 +1,42 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from records import scrubber
+
+
+class Command(BaseCommand):
+    help = "Re-verify stored ciphertext for records due a check (least recently verified first)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Stop after this many records')
+        parser.add_argument('--batch-size', type=int, help='Records per DB batch (default SCRUB_BATCH_SIZE)')
+        parser.add_argument('--stale-hours', type=float, help='Re-verify records older than this (default SCRUB_INTERVAL_HOURS; 0 = all)')
+        parser.add_argument('--status', action='append', help='Only records currently in this status; repeatable')
+        parser.add_argument('--max-bytes-per-second', type=int, help='Storage read limit (default SCRUB_MAX_BYTES_PER_SECOND)')
+        parser.add_argument('--cpu-fraction', type=float, help='Max share of wall time spent working (default SCRUB_CPU_FRACTION)')
+        parser.add_argument('--follow', action='store_true', help='Keep running, sleeping between passes')
+        parser.add_argument('--interval', type=float, default=300, help='Seconds between passes with --follow')
+
+    def handle(self, *args, **options):
+        limiter = scrubber.RateLimiter(
+            options['max_bytes_per_second'] if options['max_bytes_per_second'] is not None else settings.SCRUB_MAX_BYTES_PER_SECOND,
+            options['cpu_fraction'] if options['cpu_fraction'] is not None else settings.SCRUB_CPU_FRACTION,
+        )
+        stale_after = timedelta(hours=options['stale_hours']) if options['stale_hours'] is not None else None
+
+        while True:
+            summary = scrubber.scrub(
+                limit=options['limit'],
+                batch_size=options['batch_size'],
+                stale_after=stale_after,
+                statuses=options['status'],
+                limiter=limiter,
+                log=self.stdout.write,
+            )
+            self.stdout.write(f"Scrub pass: {summary or 'nothing due'}")
+            if not options['follow']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,67 @@
+from medicalchain.startup import lazy_module
+
+keccak = lazy_module('Crypto.Hash.keccak')
+
+
+def keccak256(data):
+    return keccak.new(digest_bits=256, data=data).digest()
+
+
+def to_bytes32(hex_hash):
+    value = bytes.fromhex(hex_hash[2:] if hex_hash.startswith('0x') else hex_hash)
+    if len(value) != 32:
+        raise ValueError(f"Expected a 32-byte hash, got {len(value)} bytes")
+    return value
+
+
+def to_hex(value):
+    return '0x' + value.hex()
+
+
+def leaf_hash(file_hash):
+    """Leaf for a record's 0x-prefixed file hash, as MedicalRecords.verifyRecordInclusion computes it"""
+    return keccak256(to_bytes32(file_hash))
+
+
+def hash_pair(a, b):
+    # Sorted pairs: proofs don't need left/right flags
+    return keccak256(a + b) if a < b else keccak256(b + a)
+
+
+def build_tree(leaves):
+    """
+    Build all levels of the tree, leaves first and the root last. An unpaired
+    node is carried up to the next level unchanged.
+    """
+    if not leaves:
+        raise ValueError("Cannot build a Merkle tree with no leaves")
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def root_of(levels):
+    return levels[-1][0]
+
+
+def proof_for(levels, index):
+    """Sibling hashes from leaf `index` up to (not including) the root"""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, proof, root):
+    computed = leaf
+    for sibling in proof:
+        computed = hash_pair(computed, sibling)
+    return computed == root
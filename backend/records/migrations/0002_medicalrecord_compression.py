@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='compression',
+            field=models.CharField(default='none', max_length=10),
+        ),
+    ]
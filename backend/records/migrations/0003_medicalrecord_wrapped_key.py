@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0002_medicalrecord_compression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='wrapped_key',
+            field=models.CharField(blank=True, max_length=120, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0003_medicalrecord_wrapped_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnchorBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('merkle_root', models.CharField(max_length=66)),
+                ('record_count', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('submitted', 'Submitted'), ('confirmed', 'Confirmed'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('tx_hash', models.CharField(blank=True, max_length=66, null=True)),
+                ('block_number', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('submitted_at', models.DateTimeField(blank=True, null=True)),
+                ('anchored_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'anchor_batches',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='anchorbatch',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'failed'), _negated=True), fields=('merkle_root',), name='anchor_batch_live_root'),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='merkle_proof',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='anchor_batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='records', to='records.anchorbatch'),
+        ),
+    ]
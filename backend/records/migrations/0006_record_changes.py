@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:34
+
+from django.db import migrations, models
+
+
+def backfill_changes(apps, schema_editor):
+    """Seed the log with one upsert per existing record so cursor=0 returns everything"""
+    MedicalRecord = apps.get_model('records', 'MedicalRecord')
+    RecordChange = apps.get_model('records', 'RecordChange')
+    existing = MedicalRecord.objects.order_by('record_id').values_list('record_id', 'patient_id', 'uploaded_by_id')
+    RecordChange.objects.bulk_create([
+        RecordChange(record_id=record_id, patient=patient, uploaded_by=uploaded_by, operation='upsert')
+        for record_id, patient, uploaded_by in existing.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0005_medicalrecord_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordChange',
+            fields=[
+                ('change_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('record_id', models.IntegerField()),
+                ('patient', models.CharField(max_length=42)),
+                ('uploaded_by', models.CharField(max_length=42)),
+                ('operation', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted')], max_length=6)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'record_changes',
+                'indexes': [models.Index(fields=['patient', 'change_id'], name='changes_patient_cursor_idx'), models.Index(fields=['uploaded_by', 'change_id'], name='changes_doctor_cursor_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
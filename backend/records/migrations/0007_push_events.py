@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0006_record_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainCursor',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('block_number', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'chain_cursors',
+            },
+        ),
+        migrations.CreateModel(
+            name='PushEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('wallet', models.CharField(max_length=42)),
+                ('event', models.CharField(max_length=40)),
+                ('data', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'push_events',
+                'indexes': [models.Index(fields=['wallet', 'id'], name='push_events_wallet_idx'), models.Index(fields=['created_at'], name='push_events_created_idx')],
+            },
+        ),
+    ]
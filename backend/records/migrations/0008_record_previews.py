@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0007_push_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordPreview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ipfs_cid', models.CharField(max_length=100)),
+                ('size', models.PositiveSmallIntegerField()),
+                ('available', models.BooleanField(default=True)),
+                ('content_type', models.CharField(blank=True, default='', max_length=30)),
+                ('width', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('height', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('encrypted_content', models.BinaryField(blank=True, default=b'')),
+                ('encryption_iv', models.CharField(blank=True, default='', max_length=50)),
+                ('wrapped_key', models.CharField(blank=True, default='', max_length=120)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'record_previews',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recordpreview',
+            constraint=models.UniqueConstraint(fields=('ipfs_cid', 'size'), name='record_previews_cid_size_uniq'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0008_record_previews'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='ciphertext_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='verify_detail',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='verify_status',
+            field=models.CharField(choices=[('unverified', 'Not yet checked'), ('ok', 'Verified'), ('unverifiable', 'Reachable, no reference hash or key'), ('corrupt', 'Content does not match'), ('missing', 'Not found in storage'), ('error', 'Check failed (transient)')], default='unverified', max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['verified_at'], name='records_verified_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['verify_status'], name='records_verify_status_idx'),
+        ),
+    ]
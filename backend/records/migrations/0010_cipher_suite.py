@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0009_integrity_scrubbing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='cipher_suite',
+            field=models.CharField(default='aes256-cbc-v1', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='recordpreview',
+            name='cipher_suite',
+            field=models.CharField(default='aes256-cbc-v1', max_length=30),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:51
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_pending(apps, schema_editor):
+    """Existing client-reported hashes were never checked; queue them for the poller"""
+    MedicalRecord = apps.get_model('records', 'MedicalRecord')
+    MedicalRecord.objects.filter(tx_hash__regex=r'^0x[0-9a-fA-F]{64}$').update(
+        tx_status='pending', tx_submitted_at=F('updated_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0011_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='tx_block_number',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='tx_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='tx_confirmed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='tx_nonce',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='tx_sender',
+            field=models.CharField(blank=True, default='', max_length=42),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='tx_status',
+            field=models.CharField(choices=[('none', 'No transaction'), ('pending', 'Awaiting receipt'), ('confirmed', 'Mined and succeeded'), ('failed', 'Reverted or not a call to the contract'), ('replaced', 'Nonce used by another transaction'), ('dropped', 'Never seen by the node')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='tx_submitted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['tx_status', 'tx_checked_at'], name='records_tx_status_idx'),
+        ),
+        migrations.RunPython(mark_pending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:00
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    """One row per patient with records, from a grouped pass over medical_records"""
+    MedicalRecord = apps.get_model('records', 'MedicalRecord')
+    PatientRecordStats = apps.get_model('records', 'PatientRecordStats')
+    columns = {field.name for field in PatientRecordStats._meta.fields}
+    records = MedicalRecord.objects.order_by()
+    rows = {}
+    per_type = records.values_list('patient_id', 'record_type').annotate(
+        count=Count('record_id'), size=Sum('file_size'), latest=Max('created_at')
+    )
+    for patient, record_type, count, size, latest in per_type:
+        row = rows.setdefault(patient, PatientRecordStats(patient_id=patient))
+        column = f'{record_type}_count' if f'{record_type}_count' in columns else 'unknown_count'
+        setattr(row, column, getattr(row, column) + count)
+        row.total_records += count
+        row.total_bytes += size or 0
+        if row.last_upload_at is None or latest > row.last_upload_at:
+            row.last_upload_at = latest
+    for patient, doctors in records.values_list('patient_id').annotate(doctors=Count('uploaded_by', distinct=True)):
+        rows[patient].doctor_count = doctors
+    PatientRecordStats.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_updated_at'),
+        ('records', '0012_tx_confirmation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientRecordStats',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='record_stats', serialize=False, to='users.user')),
+                ('total_records', models.IntegerField(default=0)),
+                ('lab_count', models.IntegerField(default=0)),
+                ('imaging_count', models.IntegerField(default=0)),
+                ('prescription_count', models.IntegerField(default=0)),
+                ('discharge_count', models.IntegerField(default=0)),
+                ('referral_count', models.IntegerField(default=0)),
+                ('vaccination_count', models.IntegerField(default=0)),
+                ('ayush_count', models.IntegerField(default=0)),
+                ('unknown_count', models.IntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(default=0)),
+                ('last_upload_at', models.DateTimeField(blank=True, null=True)),
+                ('doctor_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'patient_record_stats',
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
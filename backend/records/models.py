@@ -1,7 +1,39 @@
-from django.db import models
+from django.db import models, transaction
 from users.models import User
 
 
+class AnchorBatch(models.Model):
+    """A Merkle root over many record hashes, anchored on-chain in one transaction"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('submitted', 'Submitted'),
+        ('confirmed', 'Confirmed'),
+        ('failed', 'Failed'),
+    ]
+    
+    merkle_root = models.CharField(max_length=66)
+    record_count = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    tx_hash = models.CharField(max_length=66, null=True, blank=True)
+    block_number = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    submitted_at = models.DateTimeField(null=True, blank=True)
+    anchored_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'anchor_batches'
+        ordering = ['-created_at']
+        constraints = [
+            # A failed batch's records are re-batched, usually into the same root
+            models.UniqueConstraint(
+                fields=['merkle_root'], condition=~models.Q(status='failed'), name='anchor_batch_live_root'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Batch {self.merkle_root[:10]}... ({self.record_count} records, {self.status})"
+
+
 class MedicalRecord(models.Model):
     RECORD_TYPES = [
         ('lab', 'Lab Results'),
@@ -22,17 +54,232 @@ class MedicalRecord(models.Model):
     filename = models.CharField(max_length=255)
     file_size = models.IntegerField()
     encryption_iv = models.CharField(max_length=50, null=True, blank=True)
+    # Per-record data key wrapped under the encryption service's master key
+    wrapped_key = models.CharField(max_length=120, null=True, blank=True)
+    # Codec applied before encryption ('none', 'zlib', 'zstd'); undone on decrypt
+    compression = models.CharField(max_length=10, default='none')
+    # Versioned cipher suite id from the encryption service; rows from before
+    # suites existed are AES-256-CBC
+    cipher_suite = models.CharField(max_length=30, default='aes256-cbc-v1')
     
     # NEW FIELDS
     record_type = models.CharField(max_length=20, choices=RECORD_TYPES, default='unknown')
     description = models.TextField(blank=True, default='')
     
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     tx_hash = models.CharField(max_length=66, null=True, blank=True)
     
+    # Receipt confirmation (records.confirmations): the client-reported
+    # tx_hash stays 'pending' until its receipt is deep enough on chain
+    TX_STATUSES = [
+        ('none', 'No transaction'),
+        ('pending', 'Awaiting receipt'),
+        ('confirmed', 'Mined and succeeded'),
+        ('failed', 'Reverted or not a call to the contract'),
+        ('replaced', 'Nonce used by another transaction'),
+        ('dropped', 'Never seen by the node'),
+    ]
+    tx_status = models.CharField(max_length=10, choices=TX_STATUSES, default='none')
+    tx_block_number = models.BigIntegerField(null=True, blank=True)
+    tx_submitted_at = models.DateTimeField(null=True, blank=True)
+    tx_confirmed_at = models.DateTimeField(null=True, blank=True)
+    tx_checked_at = models.DateTimeField(null=True, blank=True)
+    # Sender and nonce, learned while the tx is in the mempool, to tell a
+    # replaced transaction from a dropped one
+    tx_sender = models.CharField(max_length=42, blank=True, default='')
+    tx_nonce = models.BigIntegerField(null=True, blank=True)
+    
+    # Batched anchoring: the batch whose Merkle root covers this record's
+    # file_hash, and the sibling hashes proving inclusion
+    anchor_batch = models.ForeignKey(AnchorBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='records')
+    merkle_proof = models.JSONField(null=True, blank=True)
+    
+    # Integrity scrubbing (records.scrubber): SHA-256 of the stored ciphertext,
+    # so later passes can check storage without decrypting
+    VERIFY_STATUSES = [
+        ('unverified', 'Not yet checked'),
+        ('ok', 'Verified'),
+        ('unverifiable', 'Reachable, no reference hash or key'),
+        ('corrupt', 'Content does not match'),
+        ('missing', 'Not found in storage'),
+        ('error', 'Check failed (transient)'),
+    ]
+    ciphertext_hash = models.CharField(max_length=64, null=True, blank=True)
+    verify_status = models.CharField(max_length=12, choices=VERIFY_STATUSES, default='unverified')
+    verified_at = models.DateTimeField(null=True, blank=True)
+    verify_detail = models.CharField(max_length=255, blank=True, default='')
+    
     class Meta:
         db_table = 'medical_records'
         ordering = ['-created_at']
+        indexes = [
+            # Per-patient version marker (count, max(updated_at)) for ETags
+            models.Index(fields=['patient', 'updated_at'], name='records_patient_updated_idx'),
+            # Scrubber picks the least recently verified first; re-pin queries filter by status
+            models.Index(fields=['verified_at'], name='records_verified_at_idx'),
+            models.Index(fields=['verify_status'], name='records_verify_status_idx'),
+            # Confirmation poller walks pending transactions, least recently checked first
+            models.Index(fields=['tx_status', 'tx_checked_at'], name='records_tx_status_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        # The post_save handlers (change log, stats, push events) commit with
+        # the row itself, so no reader sees a record its stats don't count yet
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"Record {self.record_id} for {self.patient_id}"
+
+
+class RecordChange(models.Model):
+    """
+    Append-only change log behind the delta-sync endpoint. change_id is the
+    sync cursor. Wallets are stored as plain strings (not foreign keys) so
+    tombstones outlive the rows they describe.
+    """
+    OPERATIONS = [
+        ('upsert', 'Created or updated'),
+        ('delete', 'Deleted'),
+    ]
+    
+    change_id = models.BigAutoField(primary_key=True)
+    record_id = models.IntegerField()
+    patient = models.CharField(max_length=42)
+    uploaded_by = models.CharField(max_length=42)
+    operation = models.CharField(max_length=6, choices=OPERATIONS)
+    changed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'record_changes'
+        indexes = [
+            models.Index(fields=['patient', 'change_id'], name='changes_patient_cursor_idx'),
+            models.Index(fields=['uploaded_by', 'change_id'], name='changes_doctor_cursor_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Change {self.change_id}: {self.operation} record {self.record_id}"
+
+
+class PushEvent(models.Model):
+    """
+    Event bus between processes: any worker appends rows, every worker with
+    open SSE connections polls for new ids and fans them out. The id doubles
+    as the SSE event id, so reconnecting clients resume via Last-Event-ID.
+    """
+    id = models.BigAutoField(primary_key=True)
+    wallet = models.CharField(max_length=42)
+    event = models.CharField(max_length=40)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'push_events'
+        indexes = [
+            models.Index(fields=['wallet', 'id'], name='push_events_wallet_idx'),
+            models.Index(fields=['created_at'], name='push_events_created_idx'),
+        ]
+
+
+class ChainCursor(models.Model):
+    """Last block a chain indexer has processed, so restarts resume where they stopped"""
+    name = models.CharField(max_length=50, primary_key=True)
+    block_number = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'chain_cursors'
+
+
+class RecordPreview(models.Model):
+    """
+    Encrypted thumbnail of an image/PDF record, keyed by the source CID so
+    identical uploads share one. `available=False` remembers that a file
+    could not be previewed, so it isn't fetched and decoded again.
+    """
+    ipfs_cid = models.CharField(max_length=100)
+    size = models.PositiveSmallIntegerField()
+    available = models.BooleanField(default=True)
+    content_type = models.CharField(max_length=30, blank=True, default='')
+    width = models.PositiveSmallIntegerField(null=True, blank=True)
+    height = models.PositiveSmallIntegerField(null=True, blank=True)
+    encrypted_content = models.BinaryField(blank=True, default=b'')
+    encryption_iv = models.CharField(max_length=50, blank=True, default='')
+    wrapped_key = models.CharField(max_length=120, blank=True, default='')
+    cipher_suite = models.CharField(max_length=30, default='aes256-cbc-v1')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'record_previews'
+        constraints = [
+            models.UniqueConstraint(fields=['ipfs_cid', 'size'], name='record_previews_cid_size_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"Preview {self.size}px of {self.ipfs_cid}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Result of a write request sent with an Idempotency-Key header
+    (records.idempotency). A retry with the same key, wallet and endpoint
+    gets the stored response instead of running the pipeline again; while
+    the first request is still running, `completed_at` is null and the row
+    doubles as its lock.
+    """
+    key = models.CharField(max_length=255)
+    wallet = models.CharField(max_length=42, blank=True, default='')
+    endpoint = models.CharField(max_length=200)
+    # SHA-256 of the request's fields, to reject a key reused for a different request
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True)
+    locked_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'wallet', 'endpoint'], name='idempotency_keys_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_keys_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.endpoint} [{self.key}]"
+
+
+class PatientRecordStats(models.Model):
+    """
+    Denormalized per-patient summary behind the stats endpoint, so a
+    dashboard reads one row instead of the patient's whole history. Kept
+    current by records.stats (incremental on create, recomputed on other
+    changes); `manage.py rebuild_patient_stats` recomputes it from scratch.
+    One count column per MedicalRecord.RECORD_TYPES value.
+    """
+    patient = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='record_stats', to_field='wallet_address'
+    )
+    total_records = models.IntegerField(default=0)
+    lab_count = models.IntegerField(default=0)
+    imaging_count = models.IntegerField(default=0)
+    prescription_count = models.IntegerField(default=0)
+    discharge_count = models.IntegerField(default=0)
+    referral_count = models.IntegerField(default=0)
+    vaccination_count = models.IntegerField(default=0)
+    ayush_count = models.IntegerField(default=0)
+    unknown_count = models.IntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+    last_upload_at = models.DateTimeField(null=True, blank=True)
+    # Distinct wallets that uploaded records for this patient
+    doctor_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'patient_record_stats'
     
     def __str__(self):
-        return f"Record {self.record_id} for {self.patient_id}"
\ No newline at end of file
+        return f"Stats for {self.patient_id}: {self.total_records} records"
@@ -0,0 +1,78 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_upload_pipeline(items, encrypt, pin, encrypt_workers=4, pin_workers=4, max_in_flight=8):
+    """
+    Run encrypt -> pin for many files with the two stages overlapped.
+
+    File N+1 is encrypted while file N is being pinned. Each stage has its own
+    bounded worker pool, and at most `max_in_flight` files may be between
+    "encryption started" and "pin finished" at once, so a slow pinning service
+    applies backpressure instead of letting ciphertext pile up in memory.
+
+    `encrypt(item)` returns whatever `pin(item, encrypted)` needs; `pin` returns
+    the per-file result dict. Returns one result per item, in input order.
+    Failures are reported per file and never abort the rest of the batch.
+    """
+    results = [None] * len(items)
+    slots = threading.BoundedSemaphore(max_in_flight)
+
+    def pin_stage(index, encrypted):
+        try:
+            results[index] = {'status': 'pinned', **pin(items[index], encrypted)}
+        except Exception as e:
+            results[index] = {'status': 'failed', 'stage': 'pin', 'error': str(e)}
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=encrypt_workers) as encrypt_pool, \
+            ThreadPoolExecutor(max_workers=pin_workers) as pin_pool:
+
+        def hand_off(index, future):
+            error = future.exception()
+            if error is not None:
+                results[index] = {'status': 'failed', 'stage': 'encrypt', 'error': str(error)}
+                slots.release()
+                return
+            pin_pool.submit(pin_stage, index, future.result())
+
+        for index, item in enumerate(items):
+            slots.acquire()
+            future = encrypt_pool.submit(encrypt, item)
+            future.add_done_callback(lambda f, i=index: hand_off(i, f))
+
+        # Every slot is released only once its file has left the pin stage,
+        # so reclaiming all of them means the whole batch has drained.
+        for _ in range(max_in_flight):
+            slots.acquire()
+
+    return results
+
+
+def ordered_prefetch(items, fetch, workers=4):
+    """
+    Yield (item, result) in input order while up to `workers` later items are
+    fetched in the background. At most `workers` results are ever held, so
+    memory stays bounded however many items there are. A failed fetch yields
+    its exception as the result instead of raising.
+    """
+    items = iter(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            pending.append((item, pool.submit(fetch, item)))
+            if len(pending) >= workers:
+                break
+        while pending:
+            item, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            # Refill before handing the result out, keeping the pool busy
+            for next_item in items:
+                pending.append((next_item, pool.submit(fetch, next_item)))
+                break
+            yield item, result
@@ -0,0 +1,115 @@
+import base64
+import importlib.util
+import io
+import os
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from medicalchain.startup import lazy_module
+from . import storage
+from .models import RecordPreview
+
+Image = lazy_module('PIL.Image')
+ImageOps = lazy_module('PIL.ImageOps')
+# Optional: renders any PDF page; without it only PDFs with an embedded JPEG
+# (typical of scanned reports) get a preview
+HAS_PDFIUM = importlib.util.find_spec('pypdfium2') is not None
+pdfium = lazy_module('pypdfium2') if HAS_PDFIUM else None
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+PREVIEW_CONTENT_TYPE = 'image/jpeg'
+# First image in the PDF that is a plain JPEG stream
+PDF_JPEG_STREAM = re.compile(rb'/Filter\s*/DCTDecode[^>]*>>\s*stream\r?\n', re.S)
+
+
+class PreviewUnavailable(Exception):
+    """The record can't be previewed (unsupported type, too large, undecodable)"""
+
+
+def is_previewable(record):
+    ext = os.path.splitext(record.filename.lower())[1]
+    return ext in IMAGE_EXTENSIONS or ext == '.pdf'
+
+
+def _pdf_page_image(content):
+    if HAS_PDFIUM:
+        document = pdfium.PdfDocument(content)
+        try:
+            return document[0].render(scale=1).to_pil()
+        finally:
+            document.close()
+    match = PDF_JPEG_STREAM.search(content)
+    if not match:
+        raise PreviewUnavailable('PDF has no embedded JPEG to preview')
+    end = content.find(b'endstream', match.end())
+    return Image.open(io.BytesIO(content[match.end():end]))
+
+
+def render_thumbnail(content, filename, size):
+    """JPEG thumbnail bytes fitting in size x size, plus its (width, height)"""
+    try:
+        if filename.lower().endswith('.pdf') or content[:5] == b'%PDF-':
+            image = _pdf_page_image(content)
+        else:
+            image = Image.open(io.BytesIO(content))
+            # JPEG only: decode at a reduced scale instead of full resolution
+            image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=settings.PREVIEW_JPEG_QUALITY, optimize=True)
+    except PreviewUnavailable:
+        raise
+    except Exception as e:  # Pillow raises a zoo of errors for bad/bomb input
+        raise PreviewUnavailable(f'Could not decode {filename}: {e}')
+    return out.getvalue(), image.size
+
+
+def _store(record, size, **fields):
+    try:
+        with transaction.atomic():
+            return RecordPreview.objects.create(ipfs_cid=record.ipfs_cid, size=size, **fields)
+    except IntegrityError:  # a concurrent request generated it first
+        return RecordPreview.objects.get(ipfs_cid=record.ipfs_cid, size=size)
+
+
+def generate_preview(record, size, key=None):
+    """
+    Fetch and decrypt the record once, thumbnail it and store the thumbnail
+    encrypted under its own data key. Unpreviewable files are remembered
+    too. Raises storage.StorageError when IPFS or the encryption service
+    can't be reached (nothing is cached then).
+    """
+    if not is_previewable(record) or record.file_size > settings.PREVIEW_MAX_SOURCE_BYTES:
+        return _store(record, size, available=False)
+
+    content = storage.read_record(record, key=key)
+    try:
+        thumbnail, (width, height) = render_thumbnail(content, record.filename, size)
+    except PreviewUnavailable as e:
+        print(f"[Preview] Record {record.record_id}: {e}")
+        return _store(record, size, available=False)
+
+    encrypted = storage.encrypt_content(f'preview-{size}.jpg', thumbnail, PREVIEW_CONTENT_TYPE)
+    print(f"[Preview] Record {record.record_id}: {len(content)} -> {len(thumbnail)} bytes at {size}px")
+    return _store(
+        record, size,
+        content_type=PREVIEW_CONTENT_TYPE,
+        width=width,
+        height=height,
+        encrypted_content=base64.b64decode(encrypted['encrypted_content']),
+        encryption_iv=encrypted['iv'],
+        wrapped_key=encrypted['wrapped_key'],
+        cipher_suite=encrypted.get('suite', 'aes256-cbc-v1'),
+    )
+
+
+def decrypt_preview(preview):
+    return storage.decrypt_content(
+        bytes(preview.encrypted_content), preview.encryption_iv,
+        wrapped_key=preview.wrapped_key, suite=preview.cipher_suite,
+    )
@@ -0,0 +1,145 @@
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import storage
+from .http import get_session
+from .models import MedicalRecord
+
+AES_BLOCK_SIZE = 16
+AEAD_TAG_SIZE = 16
+CHUNK_SIZE = 64 * 1024
+
+
+class RateLimiter:
+    """
+    Keeps the scrubber in the background: at most `bytes_per_second` read
+    from storage, and busy at most `cpu_fraction` of wall time (it sleeps
+    in proportion to the work it just did). 0 disables a limit.
+    """
+
+    def __init__(self, bytes_per_second=0, cpu_fraction=0):
+        self.bytes_per_second = bytes_per_second
+        self.cpu_fraction = cpu_fraction
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+
+    def consumed(self, nbytes):
+        if not self.bytes_per_second:
+            return
+        self._window_bytes += nbytes
+        ahead = self._window_bytes / self.bytes_per_second - (time.monotonic() - self._window_start)
+        if ahead > 0:
+            time.sleep(ahead)
+        if time.monotonic() - self._window_start > 10:  # don't bank unused budget forever
+            self._window_start, self._window_bytes = time.monotonic(), 0
+
+    def worked(self, seconds):
+        if 0 < self.cpu_fraction < 1:
+            time.sleep(seconds * (1 - self.cpu_fraction) / self.cpu_fraction)
+
+
+class Missing(storage.StorageError):
+    """Storage answered, but doesn't have the CID"""
+
+
+def stream_ciphertext(cid, limiter, keep=False):
+    """
+    SHA-256 and length of a stored ciphertext, hashed as it streams in, plus
+    the ciphertext itself only when `keep` is set (for a one-off decryption)
+    """
+    try:
+        response = get_session().get(storage.ipfs_url(cid), stream=True, timeout=settings.SCRUB_FETCH_TIMEOUT)
+    except Exception as e:
+        raise storage.StorageError(f'Fetch failed: {e}')
+    with response:
+        if response.status_code in (404, 410):
+            raise Missing(f'Storage returned {response.status_code}')
+        if response.status_code >= 400:
+            raise storage.StorageError(f'Storage returned {response.status_code}')
+        digest, size, kept = hashlib.sha256(), 0, []
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                if keep:
+                    kept.append(chunk)
+                limiter.consumed(len(chunk))
+        except Exception as e:
+            raise storage.StorageError(f'Fetch interrupted: {e}')
+    return digest.hexdigest(), size, b''.join(kept) if keep else None
+
+
+def check_record(record, limiter):
+    """
+    Returns (status, detail, fields to save). Records with a reference
+    ciphertext hash are checked on ciphertext alone. Others are decrypted
+    once (when a wrapped key allows it) to confirm the plaintext hash, and
+    the ciphertext hash is recorded so later passes need no decryption.
+    """
+    decrypt = not record.ciphertext_hash and bool(record.wrapped_key)
+    try:
+        digest, size, ciphertext = stream_ciphertext(record.ipfs_cid, limiter, keep=decrypt)
+        if decrypt:
+            storage.decrypt_and_verify(record, ciphertext)
+            return 'ok', 'Plaintext hash verified', {'ciphertext_hash': digest}
+    except Missing as e:
+        return 'missing', str(e), {}
+    except storage.HashMismatch as e:
+        return 'corrupt', str(e), {}
+    except storage.StorageError as e:
+        return 'error', str(e)[:255], {}
+
+    # Catches truncation even without a reference hash: CBC output is whole
+    # blocks, AEAD output at least carries its tag
+    if record.cipher_suite == 'aes256-cbc-v1':
+        if size % AES_BLOCK_SIZE or size == 0:
+            return 'corrupt', f'Length {size} is not a whole number of cipher blocks', {}
+    elif size < AEAD_TAG_SIZE:
+        return 'corrupt', f'Length {size} is shorter than the authentication tag', {}
+    if record.ciphertext_hash:
+        if digest != record.ciphertext_hash:
+            return 'corrupt', 'Ciphertext hash mismatch', {}
+        return 'ok', 'Ciphertext hash verified', {}
+    return 'unverifiable', 'Reachable; no wrapped key to verify content', {}
+
+
+def due_records(cutoff, statuses=None):
+    """Never-checked records first, then those last verified before `cutoff`"""
+    records = MedicalRecord.objects.filter(Q(verified_at__isnull=True) | Q(verified_at__lt=cutoff))
+    if statuses:
+        records = records.filter(verify_status__in=statuses)
+    return records.order_by(F('verified_at').asc(nulls_first=True), 'record_id')
+
+
+def scrub(limit=None, batch_size=None, stale_after=None, statuses=None, limiter=None, log=print):
+    """Verify due records in batches; returns a {status: count} summary"""
+    batch_size = batch_size or settings.SCRUB_BATCH_SIZE
+    stale_after = stale_after if stale_after is not None else timedelta(hours=settings.SCRUB_INTERVAL_HOURS)
+    limiter = limiter or RateLimiter(settings.SCRUB_MAX_BYTES_PER_SECOND, settings.SCRUB_CPU_FRACTION)
+    # Fixed for the whole run, so records verified during it are never due again
+    cutoff = timezone.now() - stale_after
+    summary, seen = {}, 0
+
+    while limit is None or seen < limit:
+        size = batch_size if limit is None else min(batch_size, limit - seen)
+        batch = list(due_records(cutoff, statuses)[:size])
+        if not batch:
+            break
+        for record in batch:
+            started = time.monotonic()
+            verify_status, detail, fields = check_record(record, limiter)
+            # update(), not save(): no updated_at bump, change-log entry or push event
+            MedicalRecord.objects.filter(pk=record.pk).update(
+                verify_status=verify_status, verify_detail=detail, verified_at=timezone.now(), **fields
+            )
+            summary[verify_status] = summary.get(verify_status, 0) + 1
+            if verify_status != 'ok':
+                log(f"[Scrub] Record {record.record_id} ({record.ipfs_cid}): {verify_status} - {detail}")
+            limiter.worked(time.monotonic() - started)
+        seen += len(batch)
+    return summary
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import MedicalRecord
+from .models import MedicalRecord, PatientRecordStats
 
 
 class MedicalRecordSerializer(serializers.ModelSerializer):
@@ -10,10 +10,29 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
         model = MedicalRecord
         fields = [
             'record_id', 'patient_address', 'doctor_address', 'ipfs_cid',
-            'file_hash', 'filename', 'file_size', 'created_at', 'tx_hash'
+            'file_hash', 'filename', 'file_size', 'created_at', 'tx_hash',
+            'tx_status', 'tx_block_number'
         ]
 
 
+class PatientRecordStatsSerializer(serializers.ModelSerializer):
+    patient_address = serializers.CharField(source='patient_id', read_only=True)
+    by_type = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = PatientRecordStats
+        fields = [
+            'patient_address', 'total_records', 'by_type', 'total_bytes',
+            'last_upload_at', 'doctor_count', 'updated_at'
+        ]
+    
+    def get_by_type(self, stats):
+        return {
+            record_type: getattr(stats, f'{record_type}_count')
+            for record_type, _ in MedicalRecord.RECORD_TYPES
+        }
+
+
 class RecordUploadSerializer(serializers.Serializer):
     patient_address = serializers.CharField(max_length=42)
     encrypted_file = serializers.FileField()
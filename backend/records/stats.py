@@ -0,0 +1,150 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateTimeField, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MedicalRecord, PatientRecordStats
+
+RECORD_TYPES = [value for value, _ in MedicalRecord.RECORD_TYPES]
+# Saves that touch none of these (tx status, scrubber, anchoring) can't change the stats
+STAT_FIELDS = {'patient', 'patient_id', 'uploaded_by', 'uploaded_by_id', 'record_type', 'file_size', 'created_at'}
+
+
+def type_column(record_type):
+    return f'{record_type}_count' if record_type in RECORD_TYPES else 'unknown_count'
+
+
+def _empty():
+    return {
+        'total_records': 0,
+        **{type_column(record_type): 0 for record_type in RECORD_TYPES},
+        'total_bytes': 0,
+        'last_upload_at': None,
+        'doctor_count': 0,
+    }
+
+
+def _computed(patient_ids=None):
+    """{patient: stats fields} from the records themselves, for `patient_ids` or every patient"""
+    records = MedicalRecord.objects.order_by()
+    if patient_ids is not None:
+        records = records.filter(patient_id__in=patient_ids)
+    values = {}
+    per_type = records.values_list('patient_id', 'record_type').annotate(
+        count=Count('record_id'), size=Sum('file_size'), latest=Max('created_at')
+    )
+    for patient, record_type, count, size, latest in per_type:
+        row = values.setdefault(patient, _empty())
+        row[type_column(record_type)] += count
+        row['total_records'] += count
+        row['total_bytes'] += size or 0
+        if row['last_upload_at'] is None or latest > row['last_upload_at']:
+            row['last_upload_at'] = latest
+    for patient, doctors in records.values_list('patient_id').annotate(doctors=Count('uploaded_by', distinct=True)):
+        values[patient]['doctor_count'] = doctors
+    return values
+
+
+def _write(patient, fields, create=True):
+    updated = PatientRecordStats.objects.filter(patient_id=patient).update(**fields, updated_at=timezone.now())
+    if not updated and create:
+        try:
+            with transaction.atomic():
+                PatientRecordStats.objects.create(patient_id=patient, **fields)
+        except IntegrityError:  # created concurrently; ours is just as fresh
+            PatientRecordStats.objects.filter(patient_id=patient).update(**fields, updated_at=timezone.now())
+
+
+def recompute(patient_ids, create=True):
+    """Recompute the given patients' rows from their records (one grouped query)"""
+    with transaction.atomic():
+        # Lock first: an increment committing between our read and write would be lost
+        list(PatientRecordStats.objects.select_for_update().filter(patient_id__in=patient_ids).values_list('pk'))
+        computed = _computed(patient_ids)
+        for patient in patient_ids:
+            _write(patient, computed.get(patient, _empty()), create=create)
+
+
+def records_created(records):
+    """
+    Fold newly created records into their patients' rows with in-place
+    increments, no history scan: only "has this doctor uploaded for this
+    patient before" reads existing records. Called from post_save, and
+    explicitly after bulk_create (which skips signals).
+    """
+    by_patient = {}
+    for record in records:
+        by_patient.setdefault(record.patient_id, []).append(record)
+
+    for patient, batch in by_patient.items():
+        with transaction.atomic():
+            # Locked before the returning-doctor check, so concurrent first
+            # uploads by one doctor see each other and count them once
+            stats, created = PatientRecordStats.objects.select_for_update().get_or_create(patient_id=patient)
+            if created:
+                # First row for this patient: start from the truth, which includes the batch
+                recompute([patient])
+                continue
+            doctors = {record.uploaded_by_id for record in batch}
+            returning = set(
+                MedicalRecord.objects.filter(patient_id=patient, uploaded_by_id__in=doctors)
+                .exclude(record_id__in=[record.record_id for record in batch])
+                .values_list('uploaded_by_id', flat=True).distinct()
+            )
+            latest = Value(max(record.created_at for record in batch), output_field=DateTimeField())
+            PatientRecordStats.objects.filter(patient_id=patient).update(
+                total_records=F('total_records') + len(batch),
+                total_bytes=F('total_bytes') + sum(record.file_size for record in batch),
+                doctor_count=F('doctor_count') + len(doctors - returning),
+                # SQLite's MAX() is NULL if any argument is; Postgres ignores NULLs
+                last_upload_at=Greatest(Coalesce('last_upload_at', latest), latest),
+                updated_at=timezone.now(),
+                **{
+                    column: F(column) + count
+                    for column, count in Counter(type_column(record.record_type) for record in batch).items()
+                },
+            )
+
+
+def rebuild(patient_ids=None, check=False):
+    """
+    Recompute rows from scratch (every patient by default) and return the
+    patients whose stored row was missing or wrong; with `check`, only
+    report them. Rows only drift through writes that skip MedicalRecord.save
+    (queryset update() or raw SQL); this corrects them.
+    """
+    computed = _computed(patient_ids)
+    stored_rows = PatientRecordStats.objects.all()
+    if patient_ids is not None:
+        stored_rows = stored_rows.filter(patient_id__in=patient_ids)
+    stored = {row.pop('patient_id'): row for row in stored_rows.values('patient_id', *_empty())}
+
+    drifted = sorted(
+        patient for patient in set(computed) | set(stored)
+        if stored.get(patient) != computed.get(patient, _empty())
+    )
+    if not check:
+        for patient in drifted:
+            # Patients with records always have a user to point at; the rest only get zeroed
+            _write(patient, computed.get(patient, _empty()), create=patient in computed)
+    return drifted
+
+
+@receiver(post_save, sender=MedicalRecord, dispatch_uid='records_stats_save')
+def _record_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        records_created([instance])
+    elif update_fields is None or STAT_FIELDS & set(update_fields):
+        recompute([instance.patient_id])
+
+
+@receiver(post_delete, sender=MedicalRecord, dispatch_uid='records_stats_delete')
+def _record_deleted(sender, instance, **kwargs):
+    # No create: when the patient's user is being deleted, its row goes too
+    recompute([instance.patient_id], create=False)
@@ -0,0 +1,79 @@
+import base64
+import hashlib
+
+from django.conf import settings
+
+from .http import get_session
+
+
+class StorageError(Exception):
+    """IPFS or the encryption service failed while reading a record back"""
+
+
+class HashMismatch(StorageError):
+    """Decrypted content doesn't match the record's file_hash"""
+
+
+def ipfs_url(cid):
+    return settings.IPFS_GATEWAY.rstrip('/') + '/' + cid
+
+
+def fetch_encrypted(cid, timeout=30):
+    """Ciphertext of a record from the IPFS gateway"""
+    try:
+        response = get_session().get(ipfs_url(cid), timeout=timeout)
+        response.raise_for_status()
+    except Exception as e:
+        raise StorageError(f'Failed to fetch from IPFS: {str(e)}')
+    return response.content
+
+
+def decrypt_content(encrypted_bytes, iv, compression='none', key=None, wrapped_key=None, suite='aes256-cbc-v1'):
+    """Decrypt through the encryption service with a client key or a stored wrapped key"""
+    data = {
+        'encrypted_content': base64.b64encode(encrypted_bytes).decode('utf-8'),
+        'iv': iv,
+        'compression': compression,
+        'suite': suite,
+    }
+    if key:
+        data['key'] = key
+    else:
+        data['wrapped_key'] = wrapped_key
+    try:
+        response = get_session().post(settings.ENCRYPTION_SERVICE_URL + '/decrypt', data=data, timeout=30)
+        response.raise_for_status()
+    except Exception as e:
+        raise StorageError(f'Decryption service error: {str(e)}')
+    return base64.b64decode(response.json()['content_base64'])
+
+
+def decrypt_and_verify(record, encrypted_bytes, key=None):
+    """Decrypt a record's ciphertext and check it against the record's file_hash"""
+    content = decrypt_content(
+        encrypted_bytes, record.encryption_iv, record.compression,
+        key=key, wrapped_key=record.wrapped_key, suite=record.cipher_suite,
+    )
+    if hashlib.sha256(content).hexdigest() != record.file_hash.replace('0x', '').lower():
+        raise HashMismatch('File integrity check failed - possible tampering')
+    return content
+
+
+def read_record(record, key=None):
+    """Fetch, decrypt and hash-check a record's plaintext"""
+    return decrypt_and_verify(record, fetch_encrypted(record.ipfs_cid), key=key)
+
+
+def encrypt_content(filename, content, content_type):
+    """Encrypt small derived artifacts (previews) under a fresh wrapped data key"""
+    try:
+        response = get_session().post(
+            settings.ENCRYPTION_SERVICE_URL + '/encrypt',
+            files={'file': (filename, content, content_type)},
+            data={'compression': 'none'},
+            timeout=30,
+        )
+        response.raise_for_status()
+    except Exception as e:
+        raise StorageError(f'Encryption service error: {str(e)}')
+    return response.json()
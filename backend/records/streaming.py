@@ -0,0 +1,301 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from medicalchain.startup import lazy_module
+from medichain_shared.codecs import CODECS, choose_codec, compressor
+
+from .http import get_session
+
+AES = lazy_module('Crypto.Cipher.AES')
+ChaCha20_Poly1305 = lazy_module('Crypto.Cipher.ChaCha20_Poly1305')
+Random = lazy_module('Crypto.Random')
+
+BLOCK_SIZE = 16
+# Cipher suite ids shared with the encryption service (crypto_utils.CIPHER_SUITES)
+LEGACY_SUITE = 'aes256-cbc-v1'
+AEAD_SUITES = {
+    'aes256-gcm-v1': lambda key, nonce: AES.new(key, AES.MODE_GCM, nonce=nonce),
+    'chacha20-poly1305-v1': lambda key, nonce: ChaCha20_Poly1305.new(key=key, nonce=nonce),
+}
+AEAD_NONCE_SIZE = 12
+
+
+class EncryptionServiceError(Exception):
+    """The encryption service could not issue a data key"""
+
+
+class EmptyUpload(Exception):
+    """The file field had no content; the service's /encrypt refuses these too"""
+
+
+def request_data_key():
+    """Ask the encryption service for a fresh data key, its wrapped form and the suite to use"""
+    try:
+        response = get_session().post(
+            settings.ENCRYPTION_SERVICE_URL + '/datakey', headers={'X-Service-Token': settings.SERVICE_TOKEN}, timeout=10
+        )
+        response.raise_for_status()
+    except Exception as e:
+        raise EncryptionServiceError(f'Encryption service unavailable: {str(e)}')
+    return response.json()
+
+
+def nonce_size(suite):
+    return AEAD_NONCE_SIZE if suite in AEAD_SUITES else BLOCK_SIZE
+
+
+class StreamingEncryptor:
+    """
+    Incremental compress -> encrypt over a stream of plaintext chunks, hashing
+    the plaintext as it goes. Produces exactly what
+    EncryptionService.encrypt_file would for the same key, IV, codec and
+    suite, so the encryption service's /decrypt works unchanged. AEAD suites
+    stream straight through and append the tag on finalize; legacy CBC holds
+    back a partial block and pads at the end.
+    """
+
+    def __init__(self, key, iv, compression='none', suite=LEGACY_SUITE):
+        self.compression = compression
+        self.suite = suite
+        if suite in AEAD_SUITES:
+            self._cipher = AEAD_SUITES[suite](key, iv)
+            self._cipher.update(suite.encode())  # authenticated, like the service does
+        elif suite == LEGACY_SUITE:
+            self._cipher = AES.new(key, AES.MODE_CBC, iv)
+        else:
+            raise EncryptionServiceError(f'Unknown cipher suite: {suite}')
+        self._compressor = _compressor(compression)
+        self._hash = hashlib.sha256()
+        self._cipher_hash = hashlib.sha256()  # of the output, for integrity scrubbing
+        self._pending = b''
+        self.plaintext_size = 0
+
+    def update(self, chunk):
+        self._hash.update(chunk)
+        self.plaintext_size += len(chunk)
+        if self._compressor is not None:
+            chunk = self._compressor.compress(chunk)
+        return self._encrypt_aligned(chunk)
+
+    def finalize(self):
+        tail = self._compressor.flush() if self._compressor is not None else b''
+        if self.suite in AEAD_SUITES:
+            out = self._cipher.encrypt(tail) + self._cipher.digest()
+            self._cipher_hash.update(out)
+            return out
+        data = self._pending + tail
+        padding = BLOCK_SIZE - len(data) % BLOCK_SIZE
+        self._pending = b''
+        out = self._cipher.encrypt(data + bytes([padding]) * padding)
+        self._cipher_hash.update(out)
+        return out
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def ciphertext_hexdigest(self):
+        return self._cipher_hash.hexdigest()
+
+    def _encrypt_aligned(self, data):
+        if self.suite in AEAD_SUITES:
+            out = self._cipher.encrypt(data)
+            self._cipher_hash.update(out)
+            return out
+        data = self._pending + data
+        aligned = len(data) - len(data) % BLOCK_SIZE
+        self._pending = data[aligned:]
+        if not aligned:
+            return b''
+        out = self._cipher.encrypt(data[:aligned])
+        self._cipher_hash.update(out)
+        return out
+
+
+def _compressor(codec):
+    """The service's compressor for `codec` (medichain_shared.codecs), so ciphertext decrypts the same way"""
+    try:
+        return compressor(codec)
+    except ValueError as e:
+        raise EncryptionServiceError(str(e))
+
+
+def choose_stream_codec(first_chunk, record_type=None):
+    """
+    RECORD_COMPRESSION, with 'auto' decided by the service's own policy. The
+    first chunk is the only part seen up front; at the upload handler's chunk
+    size it is the whole sample the policy looks at.
+    """
+    mode = settings.RECORD_COMPRESSION
+    if mode == 'auto':
+        return choose_codec(first_chunk, record_type)
+    if mode not in CODECS:
+        raise EncryptionServiceError(f'Unknown compression codec: {mode}')
+    return mode
+
+
+class EncryptedUpload(UploadedFile):
+    """An upload that only ever existed on this server as ciphertext in a spool file"""
+
+    def __init__(self, file, name, content_type, size, file_hash, iv, key, wrapped_key, compression,
+                 ciphertext_hash=None, cipher_suite=LEGACY_SUITE):
+        super().__init__(file, name, content_type, size)
+        self.file_hash = file_hash
+        self.ciphertext_hash = ciphertext_hash
+        self.iv = iv
+        self.key = key
+        self.wrapped_key = wrapped_key
+        self.compression = compression
+        self.cipher_suite = cipher_suite
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            pass
+
+
+class EncryptingUploadHandler(FileUploadHandler):
+    """
+    Encrypts the `file` field chunk by chunk as the multipart parser reads it
+    off the socket, writing only ciphertext to a spool file. Plaintext is never
+    assembled in memory or written to disk. Other file fields fall through to
+    Django's default handlers.
+    """
+
+    field_name_to_encrypt = 'file'
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        # Upload handlers don't see form fields, so the codec policy takes the
+        # record type from a header (or the query string) instead
+        self.record_type = None
+        if request is not None:
+            self.record_type = request.headers.get('X-Record-Type') or request.GET.get('record_type')
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = field_name == self.field_name_to_encrypt
+        if not self.active:
+            return
+
+        data_key = request_data_key()
+        self.key = data_key['key']
+        self.wrapped_key = data_key['wrapped_key']
+        # Services from before cipher suites don't send one
+        self.suite = data_key.get('suite', LEGACY_SUITE)
+        self.iv = Random.get_random_bytes(nonce_size(self.suite))
+        self.encryptor = None
+        self.spool = tempfile.NamedTemporaryFile(
+            suffix='.encrypted', dir=settings.FILE_UPLOAD_TEMP_DIR
+        )
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.encryptor is None:
+            self.encryptor = StreamingEncryptor(
+                base64.b64decode(self.key), self.iv, choose_stream_codec(raw_data, self.record_type),
+                suite=self.suite
+            )
+        self.spool.write(self.encryptor.update(raw_data))
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if self.encryptor is None:  # no chunk ever arrived
+            self.upload_interrupted()
+            raise EmptyUpload('Empty file')
+        self.spool.write(self.encryptor.finalize())
+        self.spool.flush()
+        self.spool.seek(0)
+        self.active = False
+        return EncryptedUpload(
+            file=self.spool,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=os.path.getsize(self.spool.name),
+            file_hash=self.encryptor.hexdigest(),
+            iv=base64.b64encode(self.iv).decode('utf-8'),
+            key=self.key,
+            wrapped_key=self.wrapped_key,
+            compression=self.encryptor.compression,
+            ciphertext_hash=self.encryptor.ciphertext_hexdigest(),
+            cipher_suite=self.suite,
+        )
+
+    def upload_interrupted(self):
+        if getattr(self, 'active', False):
+            self.active = False
+            self.spool.close()  # NamedTemporaryFile removes itself on close
+
+
+def _quoted(value):
+    """
+    A header parameter as a quoted-string, escaped the way Django's
+    parse_header_parameters reads it back. Line breaks and other control
+    characters can't appear in a header at all, so they become spaces.
+    """
+    value = re.sub(r'[\x00-\x1f\x7f]', ' ', value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{value}"'
+
+
+class MultipartFileStream:
+    """
+    File-like multipart/form-data body for a single file field, read lazily
+    from disk. Sized up front so requests sends a Content-Length instead of
+    buffering the whole body to encode it.
+    """
+
+    def __init__(self, field_name, filename, fileobj, size):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name={_quoted(field_name)}; filename={_quoted(filename)}\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self._parts = [head, fileobj, tail]
+        self._length = len(head) + size + len(tail)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size=-1):
+        out = b''
+        while self._parts and (size < 0 or len(out) < size):
+            part = self._parts[0]
+            want = -1 if size < 0 else size - len(out)
+            if isinstance(part, bytes):
+                piece = part if want < 0 else part[:want]
+                rest = part[len(piece):]
+                if rest:
+                    self._parts[0] = rest
+                else:
+                    self._parts.pop(0)
+            else:
+                piece = part.read(want)
+                if not piece or want < 0:
+                    self._parts.pop(0)
+            out += piece
+        return out
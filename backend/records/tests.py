@@ -0,0 +1,821 @@
+import base64
+import hashlib
+import os
+import queue
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from medicalchain import admission, fastjson
+from users.models import User
+
+from . import anchoring, chain, confirmations, events, merkle, stats
+from .models import IdempotencyKey, MedicalRecord, PatientRecordStats, PushEvent
+from .serializers import MedicalRecordSerializer
+
+PATIENT = '0x' + 'a' * 40
+DOCTOR = '0x' + 'b' * 40
+
+
+@override_settings(FAST_SERIALIZATION=True, FAST_SERIALIZATION_VERIFY=False)
+class FastRecordListTests(TestCase):
+    """The fast JSON path of get_patient_records must match MedicalRecordSerializer byte for byte"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create(wallet_address=PATIENT, role='patient')
+        cls.doctor = User.objects.create(wallet_address=DOCTOR, role='doctor')
+        records = [
+            # Nullable columns left empty, plain ASCII
+            {'filename': 'lab.pdf', 'record_type': 'lab'},
+            # Confirmed, big block number, non-ASCII and JS line separators in the name
+            {
+                'filename': 'rapport médical \u2028\u2029 检查.pdf', 'record_type': 'imaging',
+                'tx_hash': '0x' + '1' * 64, 'tx_status': 'confirmed', 'tx_block_number': 2 ** 40,
+            },
+            # Characters JSON must escape
+            {'filename': 'quote " back\\slash \t tab.txt', 'record_type': 'unknown', 'tx_status': 'failed'},
+        ]
+        for i, fields in enumerate(records):
+            MedicalRecord.objects.create(
+                patient=cls.patient, uploaded_by=cls.doctor, ipfs_cid=f'Qm{i}', file_hash='0x' + f'{i:064x}',
+                file_size=1024 * i, encryption_iv='iv', **fields
+            )
+        # Whole-second and microsecond timestamps render differently in ISO 8601
+        MedicalRecord.objects.filter(ipfs_cid='Qm0').update(
+            created_at=datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc)
+        )
+        MedicalRecord.objects.filter(ipfs_cid='Qm1').update(
+            created_at=datetime(2024, 6, 30, 23, 59, 59, 123456, tzinfo=dt_timezone.utc)
+        )
+
+    def url(self):
+        return f'/api/records/patient/{PATIENT}/'
+
+    def expected(self):
+        records = MedicalRecord.objects.filter(patient=self.patient)
+        return JSONRenderer().render(MedicalRecordSerializer(records, many=True).data)
+
+    def test_matches_serializer(self):
+        render = mock.patch.object(
+            fastjson.ValuesRenderer, 'render', autospec=True, side_effect=fastjson.ValuesRenderer.render
+        )
+        with render as fast_render:
+            response = self.client.get(self.url())
+        fast_render.assert_called_once()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, self.expected())
+
+    def test_matches_serializer_without_orjson(self):
+        with mock.patch.object(fastjson, 'orjson', None):
+            response = self.client.get(self.url())
+        self.assertEqual(response.content, self.expected())
+
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_matches_serializer_in_other_timezone(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response.content, self.expected())
+
+    def test_matches_serializer_path(self):
+        fast = self.client.get(self.url())
+        with override_settings(FAST_SERIALIZATION=False):
+            slow = self.client.get(self.url())
+        self.assertEqual(fast.content, slow.content)
+        self.assertEqual(fast['ETag'], slow['ETag'])
+
+    def test_indented_request_uses_serializer(self):
+        response = self.client.get(self.url(), HTTP_ACCEPT='application/json; indent=2')
+        records = MedicalRecord.objects.filter(patient=self.patient)
+        expected = JSONRenderer().render(
+            MedicalRecordSerializer(records, many=True).data, 'application/json; indent=2'
+        )
+        self.assertEqual(response.content, expected)
+
+    def test_not_modified(self):
+        first = self.client.get(self.url())
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response['Cache-Control'], first['Cache-Control'])
+
+    def test_change_invalidates_etag(self):
+        first = self.client.get(self.url())
+        record = MedicalRecord.objects.get(ipfs_cid='Qm0')
+        record.tx_status = 'pending'
+        record.save()
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.expected())
+
+    def test_verify_mode(self):
+        with override_settings(FAST_SERIALIZATION_VERIFY=True), mock.patch('builtins.print') as log:
+            response = self.client.get(self.url())
+        self.assertEqual(response.content, self.expected())
+        self.assertFalse(any('[FastJSON]' in str(call) for call in log.call_args_list))
+
+
+@override_settings(SSE_SETTLE_SECONDS=1)
+class PushEventOrderTests(TestCase):
+    """An event whose transaction commits after a higher id must still reach open streams"""
+
+    def setUp(self):
+        self.hub = events.EventHub()
+        self.subscriber = queue.Queue()
+        self.subscriber.overflowed = False
+        self.hub._subscribers[PATIENT] = {self.subscriber}
+
+    def later(self):
+        return mock.patch('records.events.timezone.now', return_value=timezone.now() + timedelta(seconds=2))
+
+    def received(self):
+        ids = []
+        while not self.subscriber.empty():
+            ids.append(self.subscriber.get_nowait()['id'])
+        return ids
+
+    def test_hub_delivers_late_commit(self):
+        # id 1 was allocated first, but id 2's transaction commits first
+        PushEvent.objects.create(id=2, wallet=PATIENT, event='record.created')
+        self.hub._dispatch()
+        PushEvent.objects.create(id=1, wallet=PATIENT, event='record.created')
+        with self.later():
+            self.hub._dispatch()
+        self.assertEqual(self.received(), [1, 2])
+        self.assertEqual(self.hub.last_id, 2)
+
+    def test_catch_up_delivers_late_commit(self):
+        PushEvent.objects.create(id=2, wallet=PATIENT, event='record.created')
+        self.assertEqual([row['id'] for row in events._catch_up(PATIENT, self.subscriber, 0)], [])
+        PushEvent.objects.create(id=1, wallet=PATIENT, event='record.created')
+        with self.later():
+            self.assertEqual([row['id'] for row in events._catch_up(PATIENT, self.subscriber, 0)], [1, 2])
+
+
+@override_settings(ADMISSION_CONTROL=False, UPLOAD_PIPELINE_MAX_IN_FLIGHT=2)
+class BatchUploadTests(TestCase):
+    """One file failing to encrypt or pin must not take the rest of the batch down with it"""
+
+    def encrypt(self, filename, content, content_type, record_type=None):
+        if filename == 'unreadable.pdf':
+            raise ValueError('Encryption service returned 500')
+        return {
+            'encrypted_content': base64.b64encode(b'cipher:' + content).decode(),
+            'hash': hashlib.sha256(content).hexdigest(), 'iv': 'iv', 'key': 'key', 'compression': 'none',
+        }
+
+    def pin(self, content, filename, size=None):
+        if filename == 'unpinnable.pdf.encrypted':
+            raise Exception('Pinata upload failed: 502')
+        return 'Qm' + hashlib.sha256(content).hexdigest()[:16]
+
+    def upload(self, *names):
+        files = [SimpleUploadedFile(name, f'contents of {name}'.encode()) for name in names]
+        with mock.patch('records.views.encrypt_with_service', side_effect=self.encrypt), \
+                mock.patch('records.views.upload_to_pinata', side_effect=self.pin):
+            return self.client.post(
+                '/api/records/upload-batch/',
+                {'patient_address': PATIENT, 'record_type': 'lab', 'files': files},
+                HTTP_X_WALLET_ADDRESS=DOCTOR,
+            )
+
+    def test_partial_failure(self):
+        response = self.upload('first.pdf', 'unreadable.pdf', 'unpinnable.pdf', 'last.pdf')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertFalse(body['success'])
+        self.assertEqual((body['stored'], body['failed']), (2, 2))
+
+        results = body['results']
+        self.assertEqual([r['filename'] for r in results], ['first.pdf', 'unreadable.pdf', 'unpinnable.pdf', 'last.pdf'])
+        self.assertEqual([r['status'] for r in results], ['pinned', 'failed', 'failed', 'pinned'])
+        self.assertEqual((results[1]['stage'], results[2]['stage']), ('encrypt', 'pin'))
+        self.assertIn('500', results[1]['error'])
+        self.assertNotIn('wrapped_key', results[0])
+
+        records = MedicalRecord.objects.filter(patient__wallet_address=PATIENT).order_by('record_id')
+        self.assertEqual([r.filename for r in records], ['first.pdf', 'last.pdf'])
+        self.assertEqual([r.record_id for r in records], [results[0]['record_id'], results[3]['record_id']])
+        self.assertEqual(PatientRecordStats.objects.get(patient__wallet_address=PATIENT).total_records, 2)
+
+    def test_all_failed(self):
+        response = self.upload('unreadable.pdf', 'unpinnable.pdf')
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual((response.json()['stored'], response.json()['failed']), (0, 2))
+        self.assertFalse(MedicalRecord.objects.exists())
+        self.assertFalse(User.objects.filter(wallet_address=PATIENT).exists())
+
+
+class ConcurrentWriteTests(TransactionTestCase):
+    """
+    Several workers creating records at once must all succeed on the configured
+    engine: WAL plus busy_timeout on SQLite, row locks on Postgres.
+    Run with DB_ENGINE=postgres to check the production mode.
+    """
+    WRITERS = 8
+    RECORDS_EACH = 5
+
+    def setUp(self):
+        self.patient = User.objects.create(wallet_address=PATIENT, role='patient')
+        self.doctors = [
+            User.objects.create(wallet_address='0x' + f'{i + 1:040x}', role='doctor') for i in range(self.WRITERS)
+        ]
+
+    def write(self, doctor):
+        try:
+            for i in range(self.RECORDS_EACH):
+                MedicalRecord.objects.create(
+                    patient=self.patient, uploaded_by=doctor, ipfs_cid=f'Qm{doctor.wallet_address}{i}',
+                    file_hash='0x' + '0' * 64, filename=f'{i}.pdf', file_size=100, encryption_iv='iv',
+                )
+        finally:
+            connections.close_all()
+
+    def test_concurrent_creates(self):
+        with ThreadPoolExecutor(max_workers=self.WRITERS) as pool:
+            for future in [pool.submit(self.write, doctor) for doctor in self.doctors]:
+                future.result()
+        total = self.WRITERS * self.RECORDS_EACH
+        self.assertEqual(MedicalRecord.objects.count(), total)
+        # Every increment landed exactly once
+        self.assertEqual(stats.rebuild(check=True), [])
+        row = PatientRecordStats.objects.get(patient=self.patient)
+        self.assertEqual((row.total_records, row.doctor_count), (total, self.WRITERS))
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite profile')
+    def test_sqlite_profile(self):
+        with connection.cursor() as cursor:
+            journal_mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+            busy_timeout = cursor.execute('PRAGMA busy_timeout').fetchone()[0]
+        self.assertEqual(journal_mode.upper(), settings.DATABASES['default']['JOURNAL_MODE'].upper())
+        self.assertEqual(busy_timeout, settings.DATABASES['default']['OPTIONS']['timeout'] * 1000)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Postgres profile')
+    def test_postgres_connection_persists(self):
+        connection.ensure_connection()
+        conn = connection.connection
+        request_finished.send(sender=self.__class__)
+        request_started.send(sender=self.__class__)
+        self.assertIs(connection.connection, conn)
+
+
+class MerkleAnchorTests(TestCase):
+    """Proofs stored by anchoring.create_batch must verify against the batch root, as the contract checks them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create(wallet_address=PATIENT, role='patient')
+        cls.doctor = User.objects.create(wallet_address=DOCTOR, role='doctor')
+
+    def file_hash(self, i):
+        return '0x' + hashlib.sha256(str(i).encode()).hexdigest()
+
+    def create_records(self, count):
+        return [
+            MedicalRecord.objects.create(
+                patient=self.patient, uploaded_by=self.doctor, ipfs_cid=f'Qm{i}', file_hash=self.file_hash(i),
+                filename=f'{i}.pdf', file_size=100, encryption_iv='iv',
+            )
+            for i in range(count)
+        ]
+
+    def test_leaf_matches_contract(self):
+        # keccak256(abi.encodePacked(bytes32(0)))
+        self.assertEqual(
+            merkle.to_hex(merkle.leaf_hash('0x' + '00' * 32)),
+            '0x290decd9548b62a8d60345a988386fc84ba6bc95484008f6362f93160ef3e563',
+        )
+        a, b = merkle.leaf_hash(self.file_hash(0)), merkle.leaf_hash(self.file_hash(1))
+        self.assertEqual(merkle.root_of(merkle.build_tree([a, b])), merkle.keccak256(min(a, b) + max(a, b)))
+
+    def test_proofs_round_trip(self):
+        # Odd sizes carry an unpaired node up a level
+        for size in range(1, 10):
+            leaves = [merkle.leaf_hash(self.file_hash(i)) for i in range(size)]
+            levels = merkle.build_tree(leaves)
+            root = merkle.root_of(levels)
+            for index, leaf in enumerate(leaves):
+                proof = merkle.proof_for(levels, index)
+                self.assertTrue(merkle.verify_proof(leaf, proof, root), (size, index))
+                other = merkle.leaf_hash(self.file_hash(size + index))
+                self.assertFalse(merkle.verify_proof(other, proof, root), (size, index))
+
+    def test_empty_tree(self):
+        with self.assertRaises(ValueError):
+            merkle.build_tree([])
+
+    def test_batch_proofs_verify(self):
+        records = self.create_records(5)
+        MedicalRecord.objects.filter(record_id=records[2].record_id).update(tx_hash='0x' + '1' * 64)
+
+        batch = anchoring.create_batch()
+        self.assertEqual(batch.record_count, 4)
+        self.assertEqual(batch.records.count(), 4)
+        for record in records:
+            body = self.client.get(f'/api/records/{record.record_id}/anchor/').json()
+            if record is records[2]:
+                # Anchored individually with addRecord, so not batched
+                self.assertEqual(body['anchored'], False)
+                self.assertNotIn('verified', body)
+                continue
+            self.assertTrue(body['verified'])
+            self.assertEqual(body['merkle_root'], batch.merkle_root)
+            self.assertEqual(body['batch_status'], 'pending')
+
+        self.assertIsNone(anchoring.create_batch())
+
+    def test_failed_batch_rebatches(self):
+        self.create_records(3)
+        failed = anchoring.create_batch()
+        anchoring._settle(failed, 0, 100)
+        self.assertFalse(MedicalRecord.objects.filter(anchor_batch=failed).exists())
+
+        # Same records, same root: allowed because the first batch failed
+        batch = anchoring.create_batch()
+        self.assertNotEqual(batch.pk, failed.pk)
+        self.assertEqual(batch.merkle_root, failed.merkle_root)
+        for record in MedicalRecord.objects.all():
+            self.assertTrue(anchoring.verify_record(record)['verified'])
+
+
+@override_settings(RECORD_CHANGES_SETTLE_SECONDS=0)
+class RecordChangesTests(TestCase):
+    """Delta sync pages the change log by cursor and turns deletes into tombstones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create(wallet_address=PATIENT, role='patient')
+        cls.doctor = User.objects.create(wallet_address=DOCTOR, role='doctor')
+        cls.other_doctor = User.objects.create(wallet_address='0x' + 'c' * 40, role='doctor')
+
+    def create(self, name, doctor=None):
+        return MedicalRecord.objects.create(
+            patient=self.patient, uploaded_by=doctor or self.doctor, ipfs_cid=f'Qm{name}',
+            file_hash='0x' + '0' * 64, filename=name, file_size=100, encryption_iv='iv',
+        )
+
+    def changes(self, wallet=PATIENT, **params):
+        response = self.client.get(f'/api/records/changes/{wallet}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, body):
+        return sorted(row['record_id'] for row in body['records'])
+
+    def test_cursor_pages(self):
+        records = [self.create(f'{i}.pdf') for i in range(3)]
+        first = self.changes(cursor=0, limit=2)
+        self.assertEqual(self.ids(first), [records[0].record_id, records[1].record_id])
+        self.assertTrue(first['has_more'])
+
+        second = self.changes(cursor=first['cursor'], limit=2)
+        self.assertEqual(self.ids(second), [records[2].record_id])
+        self.assertFalse(second['has_more'])
+
+        # Nothing new: the cursor stays put
+        third = self.changes(cursor=second['cursor'])
+        self.assertEqual((third['records'], third['deleted'], third['cursor']), ([], [], second['cursor']))
+
+    def test_updates_collapse(self):
+        record = self.create('a.pdf')
+        record.tx_status = 'confirmed'
+        record.save()
+        body = self.changes(cursor=0)
+        self.assertEqual(len(body['records']), 1)
+        self.assertEqual(body['records'][0]['tx_status'], 'confirmed')
+
+    def test_tombstones(self):
+        kept, deleted = self.create('kept.pdf'), self.create('deleted.pdf')
+        synced = self.changes(cursor=0)['cursor']
+        deleted_id = deleted.record_id
+        deleted.delete()
+
+        body = self.changes(cursor=synced)
+        self.assertEqual((body['records'], body['deleted']), ([], [deleted_id]))
+
+        # A client starting from scratch never sees the deleted record's row
+        body = self.changes(cursor=0)
+        self.assertEqual(self.ids(body), [kept.record_id])
+        self.assertEqual(body['deleted'], [deleted_id])
+
+    def test_doctor_sees_own_uploads(self):
+        own = self.create('own.pdf')
+        self.create('other.pdf', doctor=self.other_doctor)
+        self.assertEqual(self.ids(self.changes(DOCTOR, cursor=0)), [own.record_id])
+        self.assertEqual(len(self.changes(DOCTOR, cursor=0, **{'as': 'patient'})['records']), 0)
+
+    @override_settings(RECORD_CHANGES_SETTLE_SECONDS=1)
+    def test_settle_window(self):
+        record = self.create('new.pdf')
+        body = self.changes(cursor=0)
+        self.assertEqual((body['records'], body['cursor']), ([], 0))
+
+        later = timezone.now() + timedelta(seconds=2)
+        with mock.patch('records.changes.timezone.now', return_value=later):
+            self.assertEqual(self.ids(self.changes(cursor=0)), [record.record_id])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get(f'/api/records/changes/{PATIENT}/', {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/records/changes/{PATIENT}/', {'cursor': -1}).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/records/changes/{PATIENT}/', {'as': 'admin'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/records/changes/0x' + 'd' * 40 + '/').status_code, 404)
+
+
+@override_settings(ADMISSION_CONTROL=False, IDEMPOTENCY_WAIT_SECONDS=0)
+class IdempotencyTests(TestCase):
+    """A retried Idempotency-Key replays the stored response; a reused one for another request is refused"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create(wallet_address=PATIENT, role='patient')
+        cls.doctor = User.objects.create(wallet_address=DOCTOR, role='doctor')
+        cls.record = MedicalRecord.objects.create(
+            patient=cls.patient, uploaded_by=cls.doctor, ipfs_cid='Qm0', file_hash='0x' + '0' * 64,
+            filename='a.pdf', file_size=100, encryption_iv='iv',
+        )
+
+    def url(self):
+        return f'/api/records/{self.record.record_id}/tx/'
+
+    def submit_tx(self, tx_hash, key='retry-1', wallet=DOCTOR):
+        with mock.patch('records.confirmations.submit', wraps=confirmations.submit) as submit:
+            response = self.client.post(
+                self.url(), {'tx_hash': tx_hash}, content_type='application/json',
+                HTTP_IDEMPOTENCY_KEY=key, HTTP_X_WALLET_ADDRESS=wallet,
+            )
+        return response, submit.call_count
+
+    def encrypt(self, filename, content, content_type, record_type=None):
+        return {'encrypted_content': base64.b64encode(content).decode(), 'hash': '0' * 64, 'iv': 'iv', 'key': 'secret'}
+
+    def upload(self, encrypt, key='batch-1'):
+        pin = mock.patch('records.views.upload_to_pinata', return_value='QmPinned')
+        with mock.patch('records.views.encrypt_with_service', side_effect=encrypt) as encrypted, pin:
+            response = self.client.post(
+                '/api/records/upload-batch/',
+                {'patient_address': PATIENT, 'files': [SimpleUploadedFile('lab.pdf', b'results')]},
+                HTTP_IDEMPOTENCY_KEY=key, HTTP_X_WALLET_ADDRESS=DOCTOR,
+            )
+        return response, encrypted.call_count
+
+    def test_retry_replays(self):
+        tx_hash = '0x' + '1' * 64
+        first, runs = self.submit_tx(tx_hash)
+        self.assertEqual((first.status_code, runs), (200, 1))
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        retry, runs = self.submit_tx(tx_hash)
+        self.assertEqual((retry.status_code, runs), (200, 0))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+
+    def test_reused_key_rejected(self):
+        self.submit_tx('0x' + '1' * 64)
+        response, runs = self.submit_tx('0x' + '2' * 64)
+        self.assertEqual((response.status_code, runs), (422, 0))
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.tx_hash, '0x' + '1' * 64)
+
+    def test_key_scoped_to_wallet(self):
+        self.submit_tx('0x' + '1' * 64)
+        response, runs = self.submit_tx('0x' + '1' * 64, wallet='0x' + 'c' * 40)
+        self.assertEqual((response.status_code, runs), (200, 1))
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_replay_omits_plaintext_key(self):
+        first, runs = self.upload(self.encrypt)
+        self.assertEqual((first.status_code, runs), (201, 1))
+        self.assertEqual(first.json()['results'][0]['encryption_key'], 'secret')
+
+        retry, runs = self.upload(self.encrypt)
+        self.assertEqual((retry.status_code, runs), (201, 0))
+        self.assertNotIn('encryption_key', retry.json()['results'][0])
+        self.assertEqual(retry.json()['results'][0]['record_id'], first.json()['results'][0]['record_id'])
+        self.assertEqual(MedicalRecord.objects.filter(filename='lab.pdf').count(), 1)
+
+    def test_server_error_releases_key(self):
+        response, runs = self.upload(mock.Mock(side_effect=ValueError('Encryption service down')))
+        self.assertEqual((response.status_code, runs), (502, 1))
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response, runs = self.upload(self.encrypt)
+        self.assertEqual((response.status_code, runs), (201, 1))
+
+    def lock(self, locked_at):
+        IdempotencyKey.objects.create(
+            key='retry-1', wallet=DOCTOR, endpoint=self.url(), locked_at=locked_at,
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def test_in_progress_conflict(self):
+        self.lock(timezone.now())
+        response, runs = self.submit_tx('0x' + '1' * 64)
+        self.assertEqual((response.status_code, runs), (409, 0))
+        self.assertIn('Retry-After', response)
+
+    @override_settings(IDEMPOTENCY_LOCK_SECONDS=600)
+    def test_abandoned_lock_reruns(self):
+        self.lock(timezone.now() - timedelta(hours=1))
+        response, runs = self.submit_tx('0x' + '1' * 64)
+        self.assertEqual((response.status_code, runs), (200, 1))
+        self.assertIsNotNone(IdempotencyKey.objects.get().completed_at)
+
+
+UPLOAD_LIMITS = {'wallet_concurrency': 0, 'global_concurrency': 0, 'rate': 0, 'burst': 0, 'max_body_bytes': 1024}
+
+
+@override_settings(ADMISSION_CONTROL=True)
+class AdmissionTests(TestCase):
+    """Upload endpoints shed load per wallet (429) and per host (503) before the view runs"""
+    URL = '/api/records/upload-batch/'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = override_settings(ADMISSION_STORE=os.path.join(directory.name, 'admission.sqlite3'))
+        store.enable()
+        self.addCleanup(store.disable)
+
+    def limited(self, **limits):
+        return override_settings(ADMISSION_LIMITS={'upload': dict(UPLOAD_LIMITS, **limits)})
+
+    def post(self, wallet=DOCTOR, **extra):
+        # No files: admitted requests get the view's 400
+        return self.client.post(self.URL, {}, HTTP_X_WALLET_ADDRESS=wallet, **extra)
+
+    def test_rate_limit_per_wallet(self):
+        with self.limited(rate=0.01, burst=2):
+            self.assertEqual([self.post().status_code for _ in range(2)], [400, 400])
+            response = self.post()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.json()['error'], 'Rate limit exceeded')
+            self.assertGreaterEqual(int(response['Retry-After']), 90)
+            # Another wallet has its own bucket
+            self.assertEqual(self.post(wallet='0x' + 'c' * 40).status_code, 400)
+
+    def test_wallet_concurrency(self):
+        with self.limited(wallet_concurrency=1):
+            held = admission.get_store().acquire('upload', DOCTOR, settings.ADMISSION_LIMITS['upload'])
+            response = self.post()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.json()['error'], 'Too many concurrent requests')
+            self.assertEqual(self.post(wallet='0x' + 'c' * 40).status_code, 400)
+
+            admission.get_store().release(held)
+            self.assertEqual(self.post().status_code, 400)
+
+    def test_global_concurrency(self):
+        with self.limited(global_concurrency=1):
+            admission.get_store().acquire('upload', '0x' + 'c' * 40, settings.ADMISSION_LIMITS['upload'])
+            response = self.post()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], str(settings.ADMISSION_RETRY_AFTER))
+
+    def test_slot_released_after_response(self):
+        with self.limited(wallet_concurrency=1):
+            self.assertEqual([self.post().status_code for _ in range(3)], [400, 400, 400])
+            self.assertEqual(admission.get_store().running('upload'), 0)
+
+    def test_body_too_large(self):
+        with self.limited():
+            response = self.client.post(
+                self.URL, b'x' * 2048, content_type='application/octet-stream', HTTP_X_WALLET_ADDRESS=DOCTOR
+            )
+            self.assertEqual(response.status_code, 413)
+
+    def test_chunked_body_needs_length(self):
+        # The test client always sets Content-Length, so call the middleware directly
+        request = RequestFactory().post(self.URL, b'x', content_type='application/octet-stream')
+        del request.META['CONTENT_LENGTH']
+        request.META['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        request.resolver_match = resolve(self.URL)
+        with self.limited():
+            response = admission.AdmissionMiddleware(None).process_view(request, None, (), {})
+        self.assertEqual(response.status_code, 411)
+
+
+CONTRACT = '0x' + 'e' * 40
+SENDER = '0x' + 'f' * 40
+
+
+@override_settings(TX_CONFIRMATIONS=2, TX_DROP_AFTER_SECONDS=600, CONTRACT_ADDRESS=CONTRACT)
+class ConfirmationTests(TestCase):
+    """confirmations.poll moves pending transactions on from batched receipts, with the node stubbed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create(wallet_address=PATIENT, role='patient')
+        cls.doctor = User.objects.create(wallet_address=DOCTOR, role='doctor')
+
+    def setUp(self):
+        # What the stub node knows: chain head, receipts and mempool entries by hash, nonces by sender
+        self.head = 100
+        self.receipts = {}
+        self.transactions = {}
+        self.nonces = {}
+        self.errors = {}
+
+    def rpc_batch(self, calls):
+        results = []
+        for method, params in calls:
+            if params and params[0] in self.errors:
+                results.append(chain.ChainCallError(self.errors[params[0]]))
+            elif method == 'eth_blockNumber':
+                results.append(hex(self.head))
+            elif method == 'eth_getTransactionReceipt':
+                results.append(self.receipts.get(params[0]))
+            elif method == 'eth_getTransactionByHash':
+                results.append(self.transactions.get(params[0]))
+            elif method == 'eth_getTransactionCount':
+                results.append(hex(self.nonces[params[0]]))
+        return results
+
+    def submitted(self, n, submitted_at=None):
+        record = MedicalRecord.objects.create(
+            patient=self.patient, uploaded_by=self.doctor, ipfs_cid=f'Qm{n}', file_hash='0x' + '0' * 64,
+            filename=f'{n}.pdf', file_size=100, encryption_iv='iv',
+        )
+        tx_hash = '0x' + f'{n:064x}'
+        confirmations.submit(record, tx_hash)
+        if submitted_at is not None:
+            MedicalRecord.objects.filter(pk=record.pk).update(tx_submitted_at=submitted_at)
+        return record, tx_hash
+
+    def receipt(self, block, status=1, to=CONTRACT):
+        return {'blockNumber': hex(block), 'status': hex(status), 'to': to}
+
+    def poll(self):
+        # Push events are written on commit
+        with mock.patch('records.confirmations.chain.rpc_batch', side_effect=self.rpc_batch), \
+                self.captureOnCommitCallbacks(execute=True):
+            return confirmations.poll(log=lambda message: None)
+
+    def status_of(self, record):
+        record.refresh_from_db()
+        return record.tx_status
+
+    def test_confirmed_after_enough_blocks(self):
+        record, tx_hash = self.submitted(1)
+        self.receipts[tx_hash] = self.receipt(100)
+        self.assertEqual(self.poll(), {'pending': 1})
+        self.assertEqual(self.status_of(record), 'pending')
+        self.assertEqual(record.tx_block_number, 100)
+        self.assertIsNotNone(record.tx_checked_at)
+
+        self.head = 101
+        self.assertEqual(self.poll(), {'confirmed': 1})
+        self.assertEqual(self.status_of(record), 'confirmed')
+        self.assertIsNotNone(record.tx_confirmed_at)
+        self.assertTrue(PushEvent.objects.filter(event='record.confirmed').exists())
+        # Settled records are no longer polled
+        self.assertEqual(self.poll(), {})
+
+    def test_failed(self):
+        reverted, reverted_hash = self.submitted(1)
+        elsewhere, elsewhere_hash = self.submitted(2)
+        self.receipts[reverted_hash] = self.receipt(90, status=0)
+        # Succeeded, but not against our contract
+        self.receipts[elsewhere_hash] = self.receipt(90, to='0x' + '9' * 40)
+        self.assertEqual(self.poll(), {'failed': 2})
+        self.assertEqual((self.status_of(reverted), self.status_of(elsewhere)), ('failed', 'failed'))
+        self.assertTrue(PushEvent.objects.filter(event='record.tx_failed').exists())
+
+    def test_in_mempool(self):
+        record, tx_hash = self.submitted(1)
+        self.transactions[tx_hash] = {'from': '0x' + 'F' * 40, 'nonce': hex(7)}
+        self.assertEqual(self.poll(), {'pending': 1})
+        self.assertEqual(self.status_of(record), 'pending')
+        self.assertEqual((record.tx_sender, record.tx_nonce), (SENDER, 7))
+
+    def test_replaced_or_dropped(self):
+        replaced, replaced_hash = self.submitted(1)
+        MedicalRecord.objects.filter(pk=replaced.pk).update(tx_sender=SENDER, tx_nonce=7)
+        self.nonces[SENDER] = 8
+        dropped, _ = self.submitted(2, submitted_at=timezone.now() - timedelta(seconds=601))
+        recent, _ = self.submitted(3)
+        self.assertEqual(self.poll(), {'replaced': 1, 'dropped': 1, 'pending': 1})
+        self.assertEqual(
+            [self.status_of(record) for record in (replaced, dropped, recent)], ['replaced', 'dropped', 'pending']
+        )
+
+    def test_rpc_error_stays_pending(self):
+        record, tx_hash = self.submitted(1)
+        self.errors[tx_hash] = 'header not found'
+        self.assertEqual(self.poll(), {'pending': 1})
+        self.assertEqual(self.status_of(record), 'pending')
+
+    @override_settings(ADMISSION_CONTROL=False)
+    def test_resubmit(self):
+        record, tx_hash = self.submitted(1)
+        self.receipts[tx_hash] = self.receipt(90, status=0)
+        self.poll()
+        new_hash = '0x' + 'a' * 64
+        url = f'/api/records/{record.record_id}/tx/'
+        response = self.client.post(url, {'tx_hash': new_hash}, content_type='application/json')
+        self.assertEqual(response.json()['tx_status'], 'pending')
+        record.refresh_from_db()
+        self.assertEqual((record.tx_hash, record.tx_block_number), (new_hash, None))
+
+        self.receipts[new_hash] = self.receipt(95)
+        self.poll()
+        # Confirmed is final
+        response = self.client.post(url, {'tx_hash': tx_hash}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+
+class PatientStatsTests(TestCase):
+    """Incrementally maintained stats rows must equal what rebuild computes from the records"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create(wallet_address=PATIENT, role='patient')
+        cls.doctor = User.objects.create(wallet_address=DOCTOR, role='doctor')
+        cls.other_doctor = User.objects.create(wallet_address='0x' + 'c' * 40, role='doctor')
+
+    def create(self, name, record_type='lab', doctor=None, size=100):
+        return MedicalRecord.objects.create(
+            patient=self.patient, uploaded_by=doctor or self.doctor, ipfs_cid=f'Qm{name}',
+            file_hash='0x' + '0' * 64, filename=name, file_size=size, encryption_iv='iv', record_type=record_type,
+        )
+
+    def row(self):
+        return PatientRecordStats.objects.get(patient=self.patient)
+
+    def assertUpToDate(self):
+        self.assertEqual(stats.rebuild(check=True), [])
+
+    def test_incremental_matches_rebuild(self):
+        first = self.create('a.pdf', size=100)
+        self.create('b.pdf', record_type='imaging', size=1000)
+        self.create('c.pdf', record_type='referral', doctor=self.other_doctor, size=10)
+        # A doctor returning to the patient doesn't count twice
+        latest = self.create('d.pdf', record_type='mystery', size=1)
+        self.assertUpToDate()
+
+        row = self.row()
+        self.assertEqual((row.total_records, row.total_bytes, row.doctor_count), (4, 1111, 2))
+        self.assertEqual((row.lab_count, row.imaging_count, row.referral_count, row.unknown_count), (1, 1, 1, 1))
+        self.assertEqual(row.last_upload_at, latest.created_at)
+
+        first.record_type = 'prescription'
+        first.save()
+        self.assertUpToDate()
+        self.assertEqual((self.row().lab_count, self.row().prescription_count), (0, 1))
+
+        MedicalRecord.objects.filter(uploaded_by=self.other_doctor).delete()
+        self.assertUpToDate()
+        self.assertEqual((self.row().total_records, self.row().doctor_count), (3, 1))
+
+    def test_bulk_create(self):
+        self.create('a.pdf')
+        records = MedicalRecord.objects.bulk_create([
+            MedicalRecord(
+                patient=self.patient, uploaded_by=doctor, ipfs_cid=f'Qm{i}', file_hash='0x' + '0' * 64,
+                filename=f'{i}.pdf', file_size=50, encryption_iv='iv', record_type='vaccination',
+            )
+            for i, doctor in enumerate([self.doctor, self.other_doctor, self.other_doctor])
+        ])
+        stats.records_created(records)
+        self.assertUpToDate()
+        self.assertEqual((self.row().total_records, self.row().vaccination_count, self.row().doctor_count), (4, 3, 2))
+
+    def test_tx_updates_leave_row_alone(self):
+        record = self.create('a.pdf')
+        PatientRecordStats.objects.filter(patient=self.patient).update(total_bytes=0)
+        record.tx_status = 'confirmed'
+        record.save(update_fields=['tx_status', 'updated_at'])
+        # Not a stats field, so no recompute: the planted drift survives
+        self.assertEqual(self.row().total_bytes, 0)
+
+    def test_rebuild_fixes_drift(self):
+        self.create('a.pdf')
+        PatientRecordStats.objects.filter(patient=self.patient).update(total_records=7, doctor_count=0)
+        self.assertEqual(stats.rebuild(check=True), [PATIENT])
+        self.assertEqual(self.row().total_records, 7)
+
+        self.assertEqual(stats.rebuild(), [PATIENT])
+        self.assertEqual((self.row().total_records, self.row().doctor_count), (1, 1))
+        self.assertUpToDate()
+
+    def test_rebuild_creates_missing_row(self):
+        self.create('a.pdf')
+        PatientRecordStats.objects.all().delete()
+        self.assertEqual(stats.rebuild(), [PATIENT])
+        self.assertEqual(self.row().total_records, 1)
+
+    def test_stats_endpoint(self):
+        self.create('a.pdf', size=100)
+        self.create('b.pdf', record_type='imaging', size=200)
+        body = self.client.get(f'/api/records/stats/{PATIENT}/').json()
+        self.assertEqual((body['total_records'], body['total_bytes']), (2, 300))
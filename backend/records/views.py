@@ -1,23 +1,44 @@
-import requests
 import hashlib
 import base64
 import os
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from io import BytesIO
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from rest_framework import status
-from rest_framework.decorators import api_view, parser_classes
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import api_view, authentication_classes, parser_classes, permission_classes
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
-from .models import MedicalRecord
-from .serializers import MedicalRecordSerializer, RecordUploadSerializer
+from . import anchoring, chain, confirmations, events, export, previews, stats, storage
+from .changes import changes_since, log_changes
+from .chain import ChainCallError, ChainNotConfigured
+from .http import get_session, requests
+from .idempotency import idempotent
+from medicalchain.conditional import conditional_response, etag_matches, make_etag
+from medicalchain.fastjson import ValuesRenderer, render_list
+from .models import MedicalRecord, PatientRecordStats, RecordPreview
+from .pipeline import run_upload_pipeline
+from .serializers import MedicalRecordSerializer, PatientRecordStatsSerializer, RecordUploadSerializer
+from .streaming import (
+    EmptyUpload, EncryptedUpload, EncryptingUploadHandler, EncryptionServiceError, MultipartFileStream
+)
 from users.models import User
 
+RECORD_LIST = ValuesRenderer(MedicalRecordSerializer)
 
-def upload_to_pinata(file_content, filename):
-    """Upload file to IPFS via Pinata"""
+
+def upload_to_pinata(file_content, filename, size=None):
+    """
+    Upload file to IPFS via Pinata.
+    file_content is bytes, or an open file plus its size to stream it from disk
+    """
     url = "https://api.pinata.cloud/pinning/pinFileToIPFS"
     
     headers = {
@@ -25,11 +46,15 @@ def upload_to_pinata(file_content, filename):
         "pinata_secret_api_key": settings.PINATA_SECRET_KEY,
     }
     
-    files = {
-        'file': (filename, file_content)
-    }
-    
-    response = requests.post(url, files=files, headers=headers)
+    if hasattr(file_content, 'read'):
+        body = MultipartFileStream('file', filename, file_content, size)
+        headers['Content-Type'] = body.content_type
+        response = get_session().post(url, data=body, headers=headers)
+    else:
+        files = {
+            'file': (filename, file_content)
+        }
+        response = get_session().post(url, files=files, headers=headers)
     
     if response.status_code == 200:
         return response.json()['IpfsHash']
@@ -37,6 +62,30 @@ def upload_to_pinata(file_content, filename):
         raise Exception(f"Pinata upload failed: {response.text}")
 
 
+def encrypt_with_service(filename, content, content_type, record_type=None):
+    """
+    Send plaintext to the encryption service and return its JSON result.
+    The service compresses first when worthwhile for the record type; the codec
+    it used comes back as 'compression' and must be stored with the record.
+    """
+    encrypt_url = settings.ENCRYPTION_SERVICE_URL + '/encrypt'
+    files = {'file': (filename, content, content_type)}
+    data = {'compression': settings.RECORD_COMPRESSION, 'record_type': record_type or 'unknown'}
+    
+    encrypt_response = get_session().post(encrypt_url, files=files, data=data, timeout=30)
+    encrypt_response.raise_for_status()
+    return encrypt_response.json()
+
+
+def get_or_create_role_user(wallet_address, role):
+    """Fetch a user by wallet and role, creating a bare one if missing"""
+    try:
+        return User.objects.get(wallet_address=wallet_address, role=role)
+    except User.DoesNotExist:
+        print(f"[Users] Creating new {role}: {wallet_address}")
+        return User.objects.create(wallet_address=wallet_address, role=role)
+
+
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
 def upload_record(request):
@@ -47,11 +96,18 @@ def upload_record(request):
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
+@idempotent
 def upload_record_complete(request):
     """
     Complete upload pipeline: Encrypt → IPFS → DB
     Frontend only sends: patient_address, file, record_type, description
     Returns data needed for blockchain transaction
+    
+    With STREAMING_UPLOAD_ENCRYPTION the file is encrypted while the body is
+    still being received (records.streaming), so only ciphertext is spooled
+    
+    Retries sent with the same Idempotency-Key header get the first
+    attempt's response instead of a second record and pin (records.idempotency)
     """
     try:
         # Get doctor from header
@@ -59,6 +115,18 @@ def upload_record_complete(request):
         if not doctor_address:
             return Response({'error': 'Doctor address required'}, status=status.HTTP_400_BAD_REQUEST)
         
+        # Must be installed before request.data is first touched
+        if settings.STREAMING_UPLOAD_ENCRYPTION:
+            request.upload_handlers.insert(0, EncryptingUploadHandler(request))
+        
+        try:
+            request.data
+        except EmptyUpload as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except EncryptionServiceError as e:
+            print(f"[UploadComplete] Encryption service error: {e}")
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        
         patient_address = request.data.get('patient_address', '').lower()
         uploaded_file = request.FILES.get('file')
         record_type = request.data.get('record_type', 'unknown')
@@ -69,35 +137,49 @@ def upload_record_complete(request):
         
         if not uploaded_file:
             return Response({'error': 'File required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not uploaded_file.size:
+            return Response({'error': 'Empty file'}, status=status.HTTP_400_BAD_REQUEST)
         
         print(f"[UploadComplete] Doctor: {doctor_address}, Patient: {patient_address}, File: {uploaded_file.name}")
         
-        # Step 1: Encrypt via encryption service
-        print("[UploadComplete] Step 1: Encrypting file...")
-        encrypt_url = settings.ENCRYPTION_SERVICE_URL + '/encrypt'
-        
-        files = {'file': (uploaded_file.name, uploaded_file.read(), uploaded_file.content_type)}
-        
-        try:
-            encrypt_response = requests.post(encrypt_url, files=files, timeout=30)
-            encrypt_response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            print(f"[UploadComplete] Encryption service error: {e}")
-            return Response({'error': f'Encryption service unavailable: {str(e)}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-        
-        encrypt_data = encrypt_response.json()
-        encrypted_content_b64 = encrypt_data['encrypted_content']
-        iv = encrypt_data['iv']
-        encryption_key = encrypt_data['key']
-        file_hash = encrypt_data['hash']
-        
-        print(f"[UploadComplete] Encrypted. Hash: {file_hash[:20]}...")
+        # Step 1: Encrypt (already done while receiving, for streamed uploads)
+        if isinstance(uploaded_file, EncryptedUpload):
+            print("[UploadComplete] Step 1: Encrypted while receiving")
+            encrypted_content = uploaded_file.file
+            encrypted_size = uploaded_file.size
+            iv = uploaded_file.iv
+            encryption_key = uploaded_file.key
+            file_hash = uploaded_file.file_hash
+            compression = uploaded_file.compression
+            cipher_suite = uploaded_file.cipher_suite
+            wrapped_key = uploaded_file.wrapped_key
+            ciphertext_hash = uploaded_file.ciphertext_hash
+        else:
+            print("[UploadComplete] Step 1: Encrypting file...")
+            try:
+                encrypt_data = encrypt_with_service(
+                    uploaded_file.name, uploaded_file.read(), uploaded_file.content_type, record_type
+                )
+            except requests.exceptions.RequestException as e:
+                print(f"[UploadComplete] Encryption service error: {e}")
+                return Response({'error': f'Encryption service unavailable: {str(e)}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            
+            encrypted_content = base64.b64decode(encrypt_data['encrypted_content'])
+            encrypted_size = len(encrypted_content)
+            iv = encrypt_data['iv']
+            encryption_key = encrypt_data['key']
+            file_hash = encrypt_data['hash']
+            compression = encrypt_data.get('compression', 'none')
+            cipher_suite = encrypt_data.get('suite', 'aes256-cbc-v1')
+            wrapped_key = encrypt_data.get('wrapped_key')
+            ciphertext_hash = hashlib.sha256(encrypted_content).hexdigest()
+        
+        print(f"[UploadComplete] Encrypted ({cipher_suite}, {compression}). Hash: {file_hash[:20]}...")
         
         # Step 2: Upload encrypted file to IPFS
         print("[UploadComplete] Step 2: Uploading to IPFS...")
         try:
-            encrypted_bytes = base64.b64decode(encrypted_content_b64)
-            cid = upload_to_pinata(encrypted_bytes, f"{uploaded_file.name}.encrypted")
+            cid = upload_to_pinata(encrypted_content, f"{uploaded_file.name}.encrypted", encrypted_size)
             print(f"[UploadComplete] IPFS CID: {cid}")
         except Exception as e:
             print(f"[UploadComplete] IPFS upload failed: {e}")
@@ -125,8 +207,12 @@ def upload_record_complete(request):
             ipfs_cid=cid,
             file_hash=f"0x{file_hash}",
             filename=uploaded_file.name,
-            file_size=len(encrypted_bytes),
+            file_size=encrypted_size,
             encryption_iv=iv,
+            wrapped_key=wrapped_key,
+            ciphertext_hash=ciphertext_hash,
+            compression=compression,
+            cipher_suite=cipher_suite,
             record_type=record_type,
             description=description
         )
@@ -141,7 +227,10 @@ def upload_record_complete(request):
             'file_hash': f"0x{file_hash}",
             'encryption_iv': iv,
             'encryption_key': encryption_key,  # Frontend uses this temporarily
+            'compression': compression,
+            'cipher_suite': cipher_suite,
             'patient_address': patient_address,
+            'anchor_mode': settings.ANCHOR_MODE,
             'message': 'Now sign blockchain transaction with MetaMask'
         }, status=status.HTTP_201_CREATED)
         
@@ -152,6 +241,125 @@ def upload_record_complete(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+@idempotent
+def upload_records_batch(request):
+    """
+    Multi-file upload pipeline: Encrypt → IPFS for every file, then one DB insert
+    Frontend sends: patient_address, files (repeated), record_type, description
+    Encryption of file N+1 overlaps with pinning of file N; see records.pipeline.
+    Returns a result per file plus the data needed for blockchain transactions
+    """
+    try:
+        doctor_address = request.headers.get('X-Wallet-Address', '').lower()
+        if not doctor_address:
+            return Response({'error': 'Doctor address required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        patient_address = request.data.get('patient_address', '').lower()
+        uploaded_files = request.FILES.getlist('files')
+        record_type = request.data.get('record_type', 'unknown')
+        description = request.data.get('description', '')
+        
+        if not patient_address:
+            return Response({'error': 'Patient address required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not uploaded_files:
+            return Response({'error': 'At least one file required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(uploaded_files) > settings.UPLOAD_BATCH_MAX_FILES:
+            return Response(
+                {'error': f'Too many files (max {settings.UPLOAD_BATCH_MAX_FILES})'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        print(f"[UploadBatch] Doctor: {doctor_address}, Patient: {patient_address}, Files: {len(uploaded_files)}")
+        
+        def encrypt(uploaded_file):
+            return encrypt_with_service(
+                uploaded_file.name, uploaded_file.read(), uploaded_file.content_type, record_type
+            )
+        
+        def pin(uploaded_file, encrypt_data):
+            encrypted_bytes = base64.b64decode(encrypt_data['encrypted_content'])
+            cid = upload_to_pinata(encrypted_bytes, f"{uploaded_file.name}.encrypted")
+            print(f"[UploadBatch] Pinned {uploaded_file.name}: {cid}")
+            return {
+                'ipfs_cid': cid,
+                'file_hash': f"0x{encrypt_data['hash']}",
+                'file_size': len(encrypted_bytes),
+                'ciphertext_hash': hashlib.sha256(encrypted_bytes).hexdigest(),
+                'encryption_iv': encrypt_data['iv'],
+                'encryption_key': encrypt_data['key'],
+                'wrapped_key': encrypt_data.get('wrapped_key'),
+                'compression': encrypt_data.get('compression', 'none'),
+                'cipher_suite': encrypt_data.get('suite', 'aes256-cbc-v1'),
+            }
+        
+        results = run_upload_pipeline(
+            uploaded_files, encrypt, pin,
+            encrypt_workers=settings.UPLOAD_PIPELINE_ENCRYPT_WORKERS,
+            pin_workers=settings.UPLOAD_PIPELINE_PIN_WORKERS,
+            max_in_flight=settings.UPLOAD_PIPELINE_MAX_IN_FLIGHT,
+        )
+        
+        pinned = [
+            (uploaded_file, result)
+            for uploaded_file, result in zip(uploaded_files, results)
+            if result['status'] == 'pinned'
+        ]
+        
+        if pinned:
+            with transaction.atomic():
+                patient = get_or_create_role_user(patient_address, 'patient')
+                doctor = get_or_create_role_user(doctor_address, 'doctor')
+                records = MedicalRecord.objects.bulk_create([
+                    MedicalRecord(
+                        patient=patient,
+                        uploaded_by=doctor,
+                        ipfs_cid=result['ipfs_cid'],
+                        file_hash=result['file_hash'],
+                        filename=uploaded_file.name,
+                        file_size=result['file_size'],
+                        encryption_iv=result['encryption_iv'],
+                        wrapped_key=result.pop('wrapped_key'),
+                        ciphertext_hash=result.pop('ciphertext_hash'),
+                        compression=result['compression'],
+                        cipher_suite=result['cipher_suite'],
+                        record_type=record_type,
+                        description=description
+                    )
+                    for uploaded_file, result in pinned
+                ])
+                # bulk_create skips post_save, so log, count and announce explicitly
+                log_changes(records)
+                stats.records_created(records)
+                events.records_created(records)
+            for (_, result), record in zip(pinned, records):
+                result['record_id'] = record.record_id
+        
+        for uploaded_file, result in zip(uploaded_files, results):
+            result['filename'] = uploaded_file.name
+        
+        failed = len(results) - len(pinned)
+        print(f"[UploadBatch] Done: {len(pinned)} stored, {failed} failed")
+        
+        return Response({
+            'success': failed == 0,
+            'patient_address': patient_address,
+            'stored': len(pinned),
+            'failed': failed,
+            'results': results,
+            'message': 'Now sign blockchain transactions with MetaMask'
+        }, status=status.HTTP_201_CREATED if pinned else status.HTTP_502_BAD_GATEWAY)
+        
+    except Exception as e:
+        import traceback
+        print(f"[UploadBatch] Error: {str(e)}")
+        print(traceback.format_exc())
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 def download_record(request):
     """
@@ -187,7 +395,7 @@ def download_record(request):
         ipfs_url = f"https://gateway.pinata.cloud/ipfs/{record.ipfs_cid}"
         
         try:
-            ipfs_response = requests.get(ipfs_url, timeout=30)
+            ipfs_response = get_session().get(ipfs_url, timeout=30)
             ipfs_response.raise_for_status()
         except requests.exceptions.RequestException as e:
             print(f"[Download] IPFS fetch failed: {e}")
@@ -199,9 +407,9 @@ def download_record(request):
         # Step 2: Decrypt via encryption service
         print("[Download] Step 2: Decrypting...")
         
-        # For demo: if no key provided, return encrypted (patient must provide)
-        if not encryption_key:
-            # In production, use secure key retrieval from KMS
+        # Records stored with a wrapped key decrypt without a client-held key;
+        # older records still need the key handed out at upload time
+        if not encryption_key and not record.wrapped_key:
             return Response({
                 'error': 'Decryption key required',
                 'message': 'Please provide encryption key or use key management service',
@@ -216,11 +424,16 @@ def download_record(request):
         decrypt_data = {
             'encrypted_content': encrypted_b64,
             'iv': record.encryption_iv,
-            'key': encryption_key
+            'compression': record.compression,
+            'suite': record.cipher_suite
         }
+        if encryption_key:
+            decrypt_data['key'] = encryption_key
+        else:
+            decrypt_data['wrapped_key'] = record.wrapped_key
         
         try:
-            decrypt_response = requests.post(encrypt_url, data=decrypt_data, timeout=30)
+            decrypt_response = get_session().post(encrypt_url, data=decrypt_data, timeout=30)
             decrypt_response.raise_for_status()
         except requests.exceptions.RequestException as e:
             print(f"[Download] Decryption failed: {e}")
@@ -257,49 +470,373 @@ def download_record(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+def get_record_preview(request, record_id):
+    """
+    Small JPEG thumbnail of an image/PDF record (?size=128|256|512).
+    Generated on first request and cached encrypted per CID, so browsing
+    studies moves kilobytes instead of whole files. Same access rule as
+    download_record; legacy records without a wrapped key need the
+    X-Encryption-Key header on first generation.
+    """
+    user_address = request.headers.get('X-Wallet-Address', '').lower()
+    try:
+        size = int(request.query_params.get('size', settings.PREVIEW_SIZES[0]))
+    except ValueError:
+        size = None
+    if size not in settings.PREVIEW_SIZES:
+        return Response({'error': f'size must be one of {settings.PREVIEW_SIZES}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        record = MedicalRecord.objects.get(record_id=record_id)
+    except MedicalRecord.DoesNotExist:
+        return Response({'error': 'Record not found'}, status=status.HTTP_404_NOT_FOUND)
+    if user_address not in (record.patient_id.lower(), record.uploaded_by_id.lower()):
+        return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    # The preview of a CID never changes, so repeat views are answered from the browser cache
+    etag = make_etag('preview', record.ipfs_cid, size)
+    if etag_matches(request, etag):  # 304 without touching storage
+        return conditional_response(request, etag, settings.HTTP_CACHE_CONTROL['preview'], build=None)
+    
+    key = request.headers.get('X-Encryption-Key')
+    try:
+        preview = RecordPreview.objects.filter(ipfs_cid=record.ipfs_cid, size=size).first()
+        if preview is None:
+            if not key and not record.wrapped_key:
+                return Response({'error': 'Decryption key required'}, status=status.HTTP_400_BAD_REQUEST)
+            preview = previews.generate_preview(record, size, key=key)
+        if not preview.available:
+            return Response({'error': 'No preview available for this record'}, status=status.HTTP_404_NOT_FOUND)
+        thumbnail = previews.decrypt_preview(preview)
+    except storage.HashMismatch as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except storage.StorageError as e:
+        print(f"[Preview] Record {record_id}: {e}")
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    return conditional_response(
+        request, etag, settings.HTTP_CACHE_CONTROL['preview'], lambda: thumbnail,
+        content_type=preview.content_type
+    )
+
+
 @api_view(['GET'])
 def get_patient_records(request, patient_address):
-    """Get all records for a patient"""
+    """Get all records for a patient (ETag from the patient's record count and latest change)"""
     try:
         patient = User.objects.get(wallet_address=patient_address.lower())
         records = MedicalRecord.objects.filter(patient=patient)
-        return Response(MedicalRecordSerializer(records, many=True).data)
+        marker = records.order_by().aggregate(count=Count('record_id'), latest=Max('updated_at'))
+        etag = make_etag('patient-records', patient.wallet_address, marker['count'], marker['latest'])
+        return conditional_response(
+            request, etag, settings.HTTP_CACHE_CONTROL['patient_records'],
+            lambda: render_list(request, RECORD_LIST, records)
+        )
     except User.DoesNotExist:
         return Response({'error': 'Patient not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+def get_record_changes(request, wallet_address):
+    """
+    Delta sync: records created or updated since ?cursor=N, plus ids of
+    deleted records. Start with cursor=0 and pass back the returned cursor;
+    keep paging while has_more is true. ?as=patient|doctor picks whose
+    records (uploads for doctors), defaulting to the wallet's role.
+    """
+    try:
+        user = User.objects.get(wallet_address=wallet_address.lower())
+    except User.DoesNotExist:
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    role = request.query_params.get('as', user.role)
+    if role not in ('patient', 'doctor'):
+        return Response({'error': 'as must be patient or doctor'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        cursor = int(request.query_params.get('cursor', 0))
+        limit = min(int(request.query_params.get('limit', settings.RECORD_CHANGES_PAGE_MAX)),
+                    settings.RECORD_CHANGES_PAGE_MAX)
+    except ValueError:
+        return Response({'error': 'cursor and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if cursor < 0 or limit < 1:
+        return Response({'error': 'cursor must be >= 0 and limit >= 1'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    records, deleted, next_cursor, has_more = changes_since(
+        user.wallet_address, role, cursor, limit, RECORD_LIST.rows
+    )
+    return Response({
+        'records': records,
+        'deleted': deleted,
+        'cursor': next_cursor,
+        'has_more': has_more,
+    })
+
+
+@require_GET
+def export_records(request, patient_address):
+    """
+    Stream all of a patient's records as one archive (?format=zip|tar) with a
+    manifest.json of hashes and tx hashes. Optional ?record_type=lab,imaging.
+    Resume an interrupted export with ?after=<last record id received>&until=<X-Export-Until>.
+    A plain Django view: DRF would reject Accept: application/zip.
+    """
+    patient_address = patient_address.lower()
+    if request.headers.get('X-Wallet-Address', '').lower() != patient_address:
+        return JsonResponse({'error': 'Only the patient can export their records'}, status=status.HTTP_403_FORBIDDEN)
+    
+    archive_format = request.GET.get('format', 'zip')
+    if archive_format not in export.FORMATS:
+        return JsonResponse({'error': f'format must be one of {sorted(export.FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        after = int(request.GET.get('after', 0))
+        until = int(request.GET['until']) if request.GET.get('until') else None
+    except ValueError:
+        return JsonResponse({'error': 'after and until must be record ids'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    records = MedicalRecord.objects.filter(patient_id=patient_address, record_id__gt=after)
+    if request.GET.get('record_type'):
+        records = records.filter(record_type__in=request.GET['record_type'].split(','))
+    if until is None:
+        # Pin the export to the records that exist now, so a resume covers the same set
+        until = records.order_by('-record_id').values_list('record_id', flat=True).first() or after
+    records = records.filter(record_id__lte=until).order_by('record_id')
+    
+    print(f"[Export] {patient_address}: records {after + 1}..{until} as {archive_format}")
+    response = StreamingHttpResponse(
+        export.stream_archive(patient_address, records.iterator(chunk_size=100), archive_format),
+        content_type=export.FORMATS[archive_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="medichain-export-{patient_address[:10]}-{until}.{archive_format}"'
+    response['X-Export-Until'] = str(until)
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+def event_stream(request, wallet_address):
+    """
+    Server-Sent Events for one wallet: record.created, record.confirmed,
+    access.granted and access.revoked. A plain Django view because DRF's
+    content negotiation has no text/event-stream renderer.
+    Only the wallet itself (X-Wallet-Address) may subscribe.
+    """
+    if request.headers.get('X-Wallet-Address', '').lower() != wallet_address.lower():
+        return JsonResponse({'error': 'X-Wallet-Address must match the subscribed wallet'}, status=status.HTTP_403_FORBIDDEN)
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    response = StreamingHttpResponse(
+        events.stream(wallet_address.lower(), last_event_id), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: don't buffer the stream
+    return response
+
+
 @api_view(['POST'])
+@idempotent
 def update_tx_hash(request, record_id):
-    """Update transaction hash after blockchain confirmation"""
+    """
+    Record the transaction hash the client sent. It stays 'pending' until
+    the confirmation poller (manage.py confirm_transactions) finds its receipt.
+    Failed, replaced and dropped transactions may be resubmitted; confirmed ones not.
+    """
     try:
         record = MedicalRecord.objects.get(record_id=record_id)
         tx_hash = request.data.get('tx_hash')
         
         if not tx_hash:
             return Response({'error': 'Transaction hash required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not confirmations.is_tx_hash(tx_hash):
+            return Response({'error': 'Invalid transaction hash'}, status=status.HTTP_400_BAD_REQUEST)
+        # Confirmed metadata is cached as immutable (get_record_by_cid)
+        if record.tx_status == 'confirmed':
+            if tx_hash.lower() != (record.tx_hash or '').lower():
+                return Response({'error': 'Record transaction already confirmed'}, status=status.HTTP_409_CONFLICT)
+            return Response({'message': 'Transaction already confirmed', 'record_id': record_id, 'tx_status': 'confirmed'})
         
-        record.tx_hash = tx_hash
-        record.save()
+        confirmations.submit(record, tx_hash)
         
         print(f"[UpdateTx] Record {record_id} updated with tx: {tx_hash[:20]}...")
         
-        return Response({'message': 'Transaction hash updated', 'record_id': record_id})
+        return Response({'message': 'Transaction hash updated', 'record_id': record_id, 'tx_status': record.tx_status})
+    except MedicalRecord.DoesNotExist:
+        return Response({'error': 'Record not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+def verify_record_anchor(request, record_id):
+    """
+    Verify a record's Merkle inclusion proof against its batch root.
+    ?onchain=true also asks the contract (verifyRecordInclusion).
+    """
+    try:
+        record = MedicalRecord.objects.select_related('anchor_batch').get(record_id=record_id)
     except MedicalRecord.DoesNotExist:
         return Response({'error': 'Record not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    onchain = request.query_params.get('onchain', '').lower() in ('1', 'true')
+    try:
+        result = anchoring.verify_record(record, onchain=onchain)
+    except ChainNotConfigured as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    result['record_id'] = record.record_id
+    result['file_hash'] = record.file_hash
+    return Response(result)
+
+
+@api_view(['GET'])
+def get_chain_records(request, patient_address):
+    """
+    Page through a patient's on-chain records (getRecordsRange).
+    ?offset=0&limit=50; ?pages=N fetches N consecutive pages in one batched RPC request
+    """
+    try:
+        offset = int(request.query_params.get('offset', 0))
+        limit = min(int(request.query_params.get('limit', 50)), settings.CHAIN_PAGE_MAX)
+        pages = min(int(request.query_params.get('pages', 1)), 10)
+    except ValueError:
+        return Response({'error': 'offset, limit and pages must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if offset < 0 or limit < 1 or pages < 1:
+        return Response(
+            {'error': 'offset must be >= 0, limit and pages >= 1'}, status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Read as the requesting wallet, never as the patient: getRecordsRange checks access against it
+    caller = request.headers.get('X-Wallet-Address', '').lower()
+    if not caller:
+        return Response({'error': 'Wallet address required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        results = chain.get_records_pages(
+            patient_address, [(offset + i * limit, limit) for i in range(pages)], caller=caller
+        )
+    except ChainNotConfigured as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        print(f"[ChainRecords] RPC error: {e}")
+        return Response({'error': f'Chain read failed: {str(e)}'}, status=status.HTTP_502_BAD_GATEWAY)
+    
+    if isinstance(results[0], ChainCallError) and results[0].revert_reason == chain.ACCESS_DENIED:
+        return Response({'error': "No access to this patient's records"}, status=status.HTTP_403_FORBIDDEN)
+    if isinstance(results[0], Exception):
+        print(f"[ChainRecords] RPC error: {results[0]}")
+        return Response({'error': f'Chain read failed: {str(results[0])}'}, status=status.HTTP_502_BAD_GATEWAY)
+    
+    records = []
+    for result in results:
+        if isinstance(result, Exception):
+            break
+        records.extend(result['page'])
+    
+    total = results[0]['total']
+    return Response({
+        'records': records,
+        'offset': offset,
+        'limit': limit * pages,
+        'total': total,
+        'next_offset': offset + len(records) if offset + len(records) < total else None,
+    })
+
+
+@api_view(['POST'])
+def check_access_batch(request):
+    """Check which of many doctors can access a patient's records (hasAccessBatch)"""
+    patient_address = request.data.get('patient_address', '')
+    doctors = request.data.get('doctors', [])
+    
+    if not patient_address or not isinstance(doctors, list):
+        return Response({'error': 'patient_address and a doctors list are required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        access = chain.has_access_batch(patient_address, doctors)
+    except ChainNotConfigured as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        print(f"[AccessBatch] RPC error: {e}")
+        return Response({'error': f'Chain read failed: {str(e)}'}, status=status.HTTP_502_BAD_GATEWAY)
+    
+    return Response({'patient_address': patient_address.lower(), 'access': access})
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication])
+@permission_classes([IsAdminUser])
+def get_integrity_report(request):
+    """
+    Integrity scrubber results: counts per status, and the records in
+    ?status=corrupt,missing (the default) for proactive re-pinning.
+    Staff only (Django admin session): it names CIDs and files of any patient.
+    """
+    statuses = request.query_params.get('status', 'corrupt,missing').split(',')
+    try:
+        limit = min(int(request.query_params.get('limit', 500)), 5000)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    summary = dict(
+        MedicalRecord.objects.order_by().values_list('verify_status').annotate(count=Count('record_id'))
+    )
+    records = (
+        MedicalRecord.objects.filter(verify_status__in=statuses).order_by('verified_at')
+        .values('record_id', 'ipfs_cid', 'filename', 'verify_status', 'verified_at', 'verify_detail')[:limit]
+    )
+    return Response({'summary': summary, 'records': list(records)})
+
+
+@api_view(['GET'])
+def get_tx_metrics(request):
+    """Confirmation lag: counts per tx status, pending backlog age, submit -> confirm latency"""
+    return Response(confirmations.lag_metrics())
+
+
+@api_view(['GET'])
+def get_patient_stats(request, patient_address):
+    """
+    Dashboard summary for a patient - record counts per type, total size,
+    last upload, distinct uploading doctors - from one precomputed row
+    """
+    try:
+        patient = User.objects.get(wallet_address=patient_address.lower())
+    except User.DoesNotExist:
+        return Response({'error': 'Patient not found'}, status=status.HTTP_404_NOT_FOUND)
+    # No row yet means no records yet
+    row = PatientRecordStats.objects.filter(patient=patient).first() or PatientRecordStats(patient=patient)
+    return conditional_response(
+        request, make_etag('patient-stats', patient.wallet_address, row.updated_at),
+        settings.HTTP_CACHE_CONTROL['patient_stats'],
+        lambda: PatientRecordStatsSerializer(row).data
+    )
 
 
 @api_view(['GET'])
 def get_record_by_cid(request, cid):
-    """Get record metadata by IPFS CID"""
+    """
+    Get record metadata by IPFS CID.
+    Content at a CID never changes, so once its transaction is confirmed on
+    chain the metadata is final and served as immutable. Failed, replaced
+    and dropped transactions can still be resubmitted, so those revalidate.
+    """
     try:
         record = MedicalRecord.objects.get(ipfs_cid=cid)
-        return Response(MedicalRecordSerializer(record).data)
+        etag = make_etag('record', record.record_id, record.updated_at)
+        policy = 'record_final' if record.tx_status == 'confirmed' else 'record_pending'
+        return conditional_response(
+            request, etag, settings.HTTP_CACHE_CONTROL[policy],
+            lambda: MedicalRecordSerializer(record).data
+        )
     except MedicalRecord.DoesNotExist:
         return Response({'error': 'Record not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
+@idempotent
 def sync_blockchain_record(request):
     """
     Sync a record that exists on blockchain but not in backend DB.
@@ -318,7 +855,11 @@ def sync_blockchain_record(request):
         record_type = request.data.get('record_type', 'unknown')
         description = request.data.get('description', '')
         tx_hash = request.data.get('tx_hash', '')
+        has_tx = confirmations.is_tx_hash(tx_hash)
         encryption_iv = request.data.get('encryption_iv', '')
+        compression = request.data.get('compression', 'none')
+        cipher_suite = request.data.get('cipher_suite') or 'aes256-cbc-v1'
+        wrapped_key = request.data.get('wrapped_key') or None
         
         # Check if already exists
         existing = MedicalRecord.objects.filter(ipfs_cid=cid).first()
@@ -353,9 +894,15 @@ def sync_blockchain_record(request):
             filename=filename,
             file_size=file_size,
             encryption_iv=encryption_iv,
+            wrapped_key=wrapped_key,
+            compression=compression,
+            cipher_suite=cipher_suite,
             record_type=record_type,
             description=description,
-            tx_hash=tx_hash
+            tx_hash=tx_hash,
+            # Confirmed by the poller like any other client-reported hash
+            tx_status='pending' if has_tx else 'none',
+            tx_submitted_at=timezone.now() if has_tx else None
         )
         
         print(f"[SyncBlockchain] Created record {record.record_id} for CID {cid}")
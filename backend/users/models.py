@@ -18,6 +18,7 @@ class User(models.Model):
     specialty = models.CharField(max_length=255, blank=True, default='')  # For doctors
     
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     
     class Meta:
@@ -0,0 +1,177 @@
+import os
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from medicalchain import db_router, fastjson
+
+from .models import User
+from .serializers import UserSerializer
+
+
+@override_settings(FAST_SERIALIZATION=True, FAST_SERIALIZATION_VERIFY=False)
+class FastDoctorListTests(TestCase):
+    """The fast JSON path of the doctor lists must match UserSerializer byte for byte"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Empty profile fields, a full profile with non-ASCII text, and an inactive doctor
+        User.objects.create(wallet_address='0x' + '1' * 40, role='doctor')
+        User.objects.create(
+            wallet_address='0x' + '2' * 40, role='doctor', name='Dr. Zoë "Ng" 王',
+            email='zoe@example.com', phone='+91 98765 43210', hospital='Hôpital   Central',
+            specialty='Cardiology\\Imaging',
+        )
+        User.objects.create(wallet_address='0x' + '3' * 40, role='doctor', name='Retired', is_active=False)
+        User.objects.create(wallet_address='0x' + '4' * 40, role='patient', name='Not listed')
+        User.objects.filter(wallet_address='0x' + '1' * 40).update(
+            created_at=datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc)
+        )
+
+    def expected(self, doctors):
+        return JSONRenderer().render(UserSerializer(doctors, many=True).data)
+
+    def test_list_matches_serializer(self):
+        render = mock.patch.object(
+            fastjson.ValuesRenderer, 'render', autospec=True, side_effect=fastjson.ValuesRenderer.render
+        )
+        with render as fast_render:
+            response = self.client.get('/api/users/doctors/list/')
+        fast_render.assert_called_once()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, self.expected(User.objects.filter(role='doctor', is_active=True)))
+
+    def test_list_matches_serializer_without_orjson(self):
+        with mock.patch.object(fastjson, 'orjson', None):
+            response = self.client.get('/api/users/doctors/list/')
+        self.assertEqual(response.content, self.expected(User.objects.filter(role='doctor', is_active=True)))
+
+    def test_list_matches_serializer_path(self):
+        fast = self.client.get('/api/users/doctors/list/')
+        with override_settings(FAST_SERIALIZATION=False):
+            slow = self.client.get('/api/users/doctors/list/')
+        self.assertEqual(fast.content, slow.content)
+        self.assertEqual(fast['ETag'], slow['ETag'])
+
+    def test_search_matches_serializer(self):
+        response = self.client.get('/api/users/doctors/search/', {'hospital': 'hôpital'})
+        doctors = User.objects.filter(role='doctor', is_active=True, hospital__icontains='hôpital')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Hôpital'.encode(), response.content)
+        self.assertEqual(response.content, self.expected(doctors))
+
+    def test_not_modified(self):
+        first = self.client.get('/api/users/doctors/list/')
+        response = self.client.get('/api/users/doctors/list/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response['Cache-Control'], first['Cache-Control'])
+
+    def test_profile_change_invalidates_etag(self):
+        first = self.client.get('/api/users/doctors/list/')
+        doctor = User.objects.get(wallet_address='0x' + '1' * 40)
+        doctor.name = 'Dr. New'
+        doctor.save()
+        response = self.client.get('/api/users/doctors/list/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.expected(User.objects.filter(role='doctor', is_active=True)))
+
+
+PATIENT = '0x' + 'a' * 40
+DOCTOR = '0x' + 'b' * 40
+
+
+@override_settings(DB_REPLICAS=['replica_0'], DB_REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(TestCase):
+    """Safe reads of replica views go to a healthy replica, except for wallets that just wrote"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(wallet_address=PATIENT, role='patient', name='Asha')
+        User.objects.create(wallet_address=DOCTOR, role='doctor', name='Dr. Rao')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.sticky_store = os.path.join(directory.name, 'sticky.sqlite3')
+        store = override_settings(DB_STICKY_STORE=self.sticky_store)
+        store.enable()
+        self.addCleanup(store.disable)
+        healthy = mock.patch('medicalchain.db_router.healthy_replicas', return_value=['replica_0'])
+        self.healthy = healthy.start()
+        self.addCleanup(healthy.stop)
+
+    def read_from(self, url, **extra):
+        """The alias the request read from, None for the primary"""
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        return getattr(response.wsgi_request, '_db_replica', None)
+
+    def update(self, wallet, **extra):
+        return self.client.post(
+            f'/api/users/{wallet}/update/', {'name': 'New'}, content_type='application/json', **extra
+        )
+
+    def test_read_uses_replica(self):
+        self.assertEqual(self.read_from(f'/api/users/{PATIENT}/'), 'replica_0')
+        self.assertEqual(self.read_from('/api/users/doctors/list/'), 'replica_0')
+
+    def test_write_sticks_to_primary(self):
+        self.assertEqual(self.update(PATIENT).status_code, 200)
+        self.assertIsNone(self.read_from(f'/api/users/{PATIENT}/'))
+        # Only the wallet that wrote
+        self.assertEqual(self.read_from(f'/api/users/{DOCTOR}/'), 'replica_0')
+
+        later = time.time() + 11
+        with mock.patch('medicalchain.db_router.time.time', return_value=later):
+            self.assertEqual(self.read_from(f'/api/users/{PATIENT}/'), 'replica_0')
+
+    def test_caller_sticks_to_primary(self):
+        # The doctor edits a patient, then lists doctors as themselves
+        self.update(PATIENT, HTTP_X_WALLET_ADDRESS=DOCTOR)
+        self.assertIsNone(self.read_from('/api/users/doctors/list/', HTTP_X_WALLET_ADDRESS=DOCTOR))
+        self.assertEqual(self.read_from('/api/users/doctors/list/'), 'replica_0')
+
+    def test_failed_write_does_not_stick(self):
+        response = self.client.post(
+            '/api/users/register/', {}, content_type='application/json', HTTP_X_WALLET_ADDRESS=PATIENT
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.read_from(f'/api/users/{PATIENT}/', HTTP_X_WALLET_ADDRESS=PATIENT), 'replica_0')
+
+    def test_no_healthy_replica(self):
+        self.healthy.return_value = []
+        self.assertIsNone(self.read_from(f'/api/users/{PATIENT}/'))
+
+    def test_sticky_store_unavailable(self):
+        # A directory can't be opened as a database: can't tell, so read from the primary
+        with override_settings(DB_STICKY_STORE=os.path.dirname(self.sticky_store)):
+            self.assertIsNone(self.read_from(f'/api/users/{PATIENT}/'))
+
+    def test_other_views_use_primary(self):
+        self.assertIsNone(self.read_from(f'/api/records/changes/{PATIENT}/'))
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """Reads follow the replica the middleware picked, unless inside a transaction; writes and migrations don't"""
+
+    def test_routes_reads_to_chosen_replica(self):
+        router = db_router.ReplicaRouter()
+        self.assertEqual(router.db_for_read(User), 'default')
+        token = db_router._replica.set('replica_0')
+        try:
+            self.assertEqual(router.db_for_read(User), 'replica_0')
+            self.assertEqual(router.db_for_write(User), 'default')
+            with mock.patch.object(connections['default'], 'in_atomic_block', True):
+                self.assertEqual(router.db_for_read(User), 'default')
+        finally:
+            db_router._replica.reset(token)
+        self.assertTrue(router.allow_migrate('default', 'users'))
+        self.assertFalse(router.allow_migrate('replica_0', 'users'))
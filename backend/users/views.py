@@ -1,11 +1,17 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Count, Max, Q
+from medicalchain import db_router
+from medicalchain.conditional import conditional_response, make_etag
+from medicalchain.fastjson import ValuesRenderer, list_response, render_list
 from .models import User
 from .serializers import UserSerializer, UserRegistrationSerializer, UserProfileUpdateSerializer
 
+USER_LIST = ValuesRenderer(UserSerializer)
+
 
 @api_view(['POST'])
 def register_user(request):
@@ -28,6 +34,8 @@ def register_user(request):
                 'specialty': serializer.validated_data.get('specialty', ''),
             }
         )
+        # Registration usually comes before the client sends X-Wallet-Address
+        db_router.stick(wallet_address)
         
         if not created:
             # Update existing user with new profile data if provided
@@ -60,7 +68,11 @@ def get_user(request, wallet_address):
     # First try to get existing user
     try:
         user = User.objects.get(wallet_address=wallet_address)
-        return Response(UserSerializer(user).data)
+        return conditional_response(
+            request, make_etag('user', user.wallet_address, user.updated_at),
+            settings.HTTP_CACHE_CONTROL['user'],
+            lambda: UserSerializer(user).data
+        )
     except User.DoesNotExist:
         pass  # Will auto-create below
     
@@ -83,6 +95,8 @@ def get_user(request, wallet_address):
         )
         
         if created:
+            # A GET that wrote: the client's next reads must see this user
+            db_router.stick(wallet_address)
             logger.info(f'[GetUser] Successfully created user: {wallet_address}')
         else:
             logger.info(f'[GetUser] User was created by another request: {wallet_address}')
@@ -151,9 +165,14 @@ def update_profile(request, wallet_address):
 
 @api_view(['GET'])
 def list_doctors(request):
-    """List all registered doctors"""
+    """List all registered doctors (ETag from the doctor count and latest profile change)"""
+    marker = User.objects.filter(role='doctor').aggregate(count=Count('wallet_address'), latest=Max('updated_at'))
     doctors = User.objects.filter(role='doctor', is_active=True)
-    return Response(UserSerializer(doctors, many=True).data)
+    return conditional_response(
+        request, make_etag('doctors', marker['count'], marker['latest']),
+        settings.HTTP_CACHE_CONTROL['doctors'],
+        lambda: render_list(request, USER_LIST, doctors)
+    )
 
 
 @api_view(['GET'])
@@ -172,7 +191,7 @@ def search_doctors(request):
     if hospital:
         doctors = doctors.filter(hospital__icontains=hospital)
     
-    return Response(UserSerializer(doctors, many=True).data)
+    return list_response(request, USER_LIST, doctors)
 
 
 @api_view(['GET'])
@@ -227,6 +246,7 @@ def sync_user_from_blockchain(request):
                     'is_active': True
                 }
             )
+            db_router.stick(wallet_address)
             
             # If user existed but was soft-deleted, reactivate
             if not user.is_active:
@@ -24,6 +24,18 @@ contract MedicalRecords {
     // patient => doctor => index in authorizedDoctors array (for efficient removal)
     mapping(address => mapping(address => uint256)) private doctorIndex;
     
+    // Batched anchoring: Merkle root of many record hashes => anchor details
+    struct Anchor {
+        address anchoredBy;
+        uint256 recordCount;
+        uint256 timestamp;
+    }
+    
+    mapping(bytes32 => Anchor) private anchors;
+    
+    // Account allowed to anchor batches (the backend's anchoring key)
+    address public anchorer;
+    
     // Events
     event RecordAdded(
         address indexed patient,
@@ -45,6 +57,19 @@ contract MedicalRecords {
         uint256 timestamp
     );
     
+    event BatchAnchored(
+        bytes32 indexed merkleRoot,
+        address indexed anchoredBy,
+        uint256 recordCount,
+        uint256 timestamp
+    );
+    
+    event AnchorerChanged(address indexed previousAnchorer, address indexed newAnchorer);
+    
+    constructor() {
+        anchorer = msg.sender;
+    }
+    
     // Modifier: Only patient themselves
     modifier onlyPatient(address _patient) {
         require(msg.sender == _patient, "Not the patient");
@@ -104,6 +129,15 @@ contract MedicalRecords {
         return accessRights[_patient][_doctor];
     }
     
+    // Check many doctors' access to a patient in one call
+    function hasAccessBatch(address _patient, address[] calldata _doctors) external view returns (bool[] memory) {
+        bool[] memory result = new bool[](_doctors.length);
+        for (uint256 i = 0; i < _doctors.length; i++) {
+            result[i] = accessRights[_patient][_doctors[i]];
+        }
+        return result;
+    }
+    
     // Get list of authorized doctors for a patient
     function getAuthorizedDoctors(address _patient) external view returns (address[] memory) {
         return authorizedDoctors[_patient];
@@ -144,6 +178,31 @@ contract MedicalRecords {
         return patientRecords[_patient];
     }
     
+    // Get one page of a patient's records (requires access), oldest first.
+    // Returns the page plus the total count so callers can keep paging.
+    function getRecordsRange(
+        address _patient,
+        uint256 _offset,
+        uint256 _limit
+    ) external view requiresAccess(_patient) returns (Record[] memory page, uint256 total) {
+        Record[] storage records = patientRecords[_patient];
+        total = records.length;
+        
+        if (_offset >= total) {
+            return (new Record[](0), total);
+        }
+        
+        uint256 end = _offset + _limit;
+        if (end > total) {
+            end = total;
+        }
+        
+        page = new Record[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = records[i];
+        }
+    }
+    
     // ==================== VIEW FUNCTIONS ====================
     
     // Get record count for patient
@@ -155,4 +214,61 @@ contract MedicalRecords {
     function hasRecords(address _patient) external view returns (bool) {
         return patientRecords[_patient].length > 0;
     }
+    
+    // ==================== BATCH ANCHORING ====================
+    // Instead of one addRecord transaction per upload, the backend anchors a
+    // Merkle root over many record hashes in a single transaction.
+    // Leaves are keccak256(fileHash); parents hash the sorted pair of children,
+    // so a proof is just the list of sibling hashes.
+    
+    modifier onlyAnchorer() {
+        require(msg.sender == anchorer, "Not the anchorer");
+        _;
+    }
+    
+    function setAnchorer(address _anchorer) external onlyAnchorer {
+        require(_anchorer != address(0), "Invalid address");
+        emit AnchorerChanged(anchorer, _anchorer);
+        anchorer = _anchorer;
+    }
+    
+    // Anchor the Merkle root of a batch of record hashes
+    function anchorBatch(bytes32 _merkleRoot, uint256 _recordCount) external onlyAnchorer {
+        require(_merkleRoot != bytes32(0), "Invalid root");
+        require(_recordCount > 0, "Empty batch");
+        require(anchors[_merkleRoot].timestamp == 0, "Root already anchored");
+        
+        anchors[_merkleRoot] = Anchor({
+            anchoredBy: msg.sender,
+            recordCount: _recordCount,
+            timestamp: block.timestamp
+        });
+        
+        emit BatchAnchored(_merkleRoot, msg.sender, _recordCount, block.timestamp);
+    }
+    
+    // Get anchor details for a root (timestamp 0 means not anchored)
+    function getAnchor(bytes32 _merkleRoot) external view returns (Anchor memory) {
+        return anchors[_merkleRoot];
+    }
+    
+    // Check that a record hash is included in an anchored batch
+    function verifyRecordInclusion(
+        bytes32 _fileHash,
+        bytes32[] calldata _proof,
+        bytes32 _merkleRoot
+    ) external view returns (bool) {
+        if (anchors[_merkleRoot].timestamp == 0) {
+            return false;
+        }
+        
+        bytes32 computed = keccak256(abi.encodePacked(_fileHash));
+        for (uint256 i = 0; i < _proof.length; i++) {
+            bytes32 sibling = _proof[i];
+            computed = computed < sibling
+                ? keccak256(abi.encodePacked(computed, sibling))
+                : keccak256(abi.encodePacked(sibling, computed));
+        }
+        return computed == _merkleRoot;
+    }
 }
\ No newline at end of file
@@ -13,9 +13,10 @@ async function main() {
   console.log(`MedicalRecords deployed to: ${address}`);
   console.log(`Transaction hash: ${medicalRecords.deploymentTransaction().hash}`);
 
-  // Wait for block confirmations for verification
+  // Wait for block confirmations for verification (a local node only mines on demand)
+  const isLocal = ["hardhat", "localhost"].includes(hre.network.name);
   console.log("Waiting for block confirmations...");
-  await medicalRecords.deploymentTransaction().wait(5);
+  await medicalRecords.deploymentTransaction().wait(isLocal ? 1 : 5);
   
   console.log("Deployment confirmed!");
   
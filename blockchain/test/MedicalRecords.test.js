@@ -69,4 +69,134 @@ describe("MedicalRecords", function () {
       ).to.be.revertedWith("Not authorized to access these records");
     });
   });
-});
\ No newline at end of file
+
+  describe("Batch Anchoring", function () {
+    // Mirrors backend/records/merkle.py: leaf = keccak256(fileHash),
+    // parent = keccak256(sorted pair), unpaired nodes carried up.
+    const leafOf = (fileHash) => ethers.keccak256(fileHash);
+    const hashPair = (a, b) =>
+      a.toLowerCase() < b.toLowerCase()
+        ? ethers.keccak256(ethers.concat([a, b]))
+        : ethers.keccak256(ethers.concat([b, a]));
+
+    function buildTree(leaves) {
+      const levels = [leaves];
+      while (levels[levels.length - 1].length > 1) {
+        const level = levels[levels.length - 1];
+        const parents = [];
+        for (let i = 0; i + 1 < level.length; i += 2) {
+          parents.push(hashPair(level[i], level[i + 1]));
+        }
+        if (level.length % 2) parents.push(level[level.length - 1]);
+        levels.push(parents);
+      }
+      return levels;
+    }
+
+    function proofFor(levels, index) {
+      const proof = [];
+      for (const level of levels.slice(0, -1)) {
+        const sibling = index ^ 1;
+        if (sibling < level.length) proof.push(level[sibling]);
+        index = Math.floor(index / 2);
+      }
+      return proof;
+    }
+
+    const fileHashes = [1, 2, 3, 4, 5].map((i) =>
+      ethers.keccak256(ethers.toUtf8Bytes(`record ${i}`))
+    );
+
+    it("Should anchor a batch root and verify every record's proof", async function () {
+      const levels = buildTree(fileHashes.map(leafOf));
+      const root = levels[levels.length - 1][0];
+
+      await expect(medicalRecords.connect(owner).anchorBatch(root, fileHashes.length))
+        .to.emit(medicalRecords, "BatchAnchored");
+
+      const anchor = await medicalRecords.getAnchor(root);
+      expect(anchor.recordCount).to.equal(fileHashes.length);
+
+      for (let i = 0; i < fileHashes.length; i++) {
+        expect(
+          await medicalRecords.verifyRecordInclusion(fileHashes[i], proofFor(levels, i), root)
+        ).to.be.true;
+      }
+    });
+
+    it("Should reject proofs for records outside the batch", async function () {
+      const levels = buildTree(fileHashes.map(leafOf));
+      const root = levels[levels.length - 1][0];
+      await medicalRecords.connect(owner).anchorBatch(root, fileHashes.length);
+
+      const outsider = ethers.keccak256(ethers.toUtf8Bytes("not in batch"));
+      expect(
+        await medicalRecords.verifyRecordInclusion(outsider, proofFor(levels, 0), root)
+      ).to.be.false;
+    });
+
+    it("Should not verify against a root that was never anchored", async function () {
+      const levels = buildTree(fileHashes.map(leafOf));
+      const root = levels[levels.length - 1][0];
+      expect(
+        await medicalRecords.verifyRecordInclusion(fileHashes[0], proofFor(levels, 0), root)
+      ).to.be.false;
+    });
+
+    it("Should only let the anchorer anchor batches", async function () {
+      const root = ethers.keccak256(ethers.toUtf8Bytes("root"));
+      await expect(
+        medicalRecords.connect(other).anchorBatch(root, 1)
+      ).to.be.revertedWith("Not the anchorer");
+
+      await medicalRecords.connect(owner).setAnchorer(other.address);
+      await expect(medicalRecords.connect(other).anchorBatch(root, 1))
+        .to.emit(medicalRecords, "BatchAnchored");
+    });
+
+    it("Should not anchor the same root twice", async function () {
+      const root = ethers.keccak256(ethers.toUtf8Bytes("root"));
+      await medicalRecords.connect(owner).anchorBatch(root, 1);
+      await expect(
+        medicalRecords.connect(owner).anchorBatch(root, 1)
+      ).to.be.revertedWith("Root already anchored");
+    });
+  });
+
+  describe("Paginated and Batched Reads", function () {
+    beforeEach(async function () {
+      for (let i = 0; i < 5; i++) {
+        const hash = ethers.keccak256(ethers.toUtf8Bytes(`content ${i}`));
+        await medicalRecords.connect(patient).addRecord(patient.address, `QmRecord${i}`, hash);
+      }
+    });
+
+    it("Should return a page of records with the total count", async function () {
+      const [page, total] = await medicalRecords.connect(patient).getRecordsRange(patient.address, 1, 2);
+      expect(total).to.equal(5);
+      expect(page).to.have.lengthOf(2);
+      expect(page[0].ipfsCID).to.equal("QmRecord1");
+      expect(page[1].ipfsCID).to.equal("QmRecord2");
+    });
+
+    it("Should clamp the last page and return nothing past the end", async function () {
+      let [page] = await medicalRecords.connect(patient).getRecordsRange(patient.address, 4, 10);
+      expect(page).to.have.lengthOf(1);
+
+      [page] = await medicalRecords.connect(patient).getRecordsRange(patient.address, 5, 10);
+      expect(page).to.have.lengthOf(0);
+    });
+
+    it("Should require access for paginated reads", async function () {
+      await expect(
+        medicalRecords.connect(other).getRecordsRange(patient.address, 0, 10)
+      ).to.be.revertedWith("No access");
+    });
+
+    it("Should check access for many doctors at once", async function () {
+      await medicalRecords.connect(patient).grantAccess(doctor.address);
+      const result = await medicalRecords.hasAccessBatch(patient.address, [doctor.address, other.address]);
+      expect(result).to.deep.equal([true, false]);
+    });
+  });
+});
@@ -1,56 +1,255 @@
+import abc
 import hashlib
 import base64
-from Crypto.Cipher import AES
-from Crypto.Random import get_random_bytes
-from Crypto.Util.Padding import pad, unpad
+import os
+import threading
+import time
+
+from key_management import KeyManager, get_key_manager
+from medichain_shared import codecs
+from medichain_shared.codecs import CHUNK_SIZE, CODECS, choose_codec, compressor
+from startup import lazy_module
+
+# Deferred until first use to keep worker cold start cheap (see startup.py)
+AES = lazy_module('Crypto.Cipher.AES')
+ChaCha20_Poly1305 = lazy_module('Crypto.Cipher.ChaCha20_Poly1305')
+Random = lazy_module('Crypto.Random')
+Padding = lazy_module('Crypto.Util.Padding')
+
+
+# Compression runs before encryption; the codec policy and settings are shared
+# with the backend's streaming uploads (medichain_shared.codecs).
+
+# Largest plaintext /decrypt will decompress a record to, so a small crafted
+# ciphertext can't expand into all of the worker's memory
+MAX_DECOMPRESSED_SIZE = int(os.getenv('MAX_DECOMPRESSED_BYTES', str(1024 * 1024 * 1024)))
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    """Compress in CHUNK_SIZE pieces so large files aren't copied wholesale"""
+    if codec == 'none':
+        return data
+    stream = compressor(codec)
+    view = memoryview(data)
+    parts = [stream.compress(view[i:i + CHUNK_SIZE]) for i in range(0, len(view), CHUNK_SIZE)]
+    parts.append(stream.flush())
+    return b''.join(parts)
+
+
+def decompress(data: bytes, codec: str, max_size: int = None) -> bytes:
+    """Refuses (ValueError) to expand past max_size, MAX_DECOMPRESSED_SIZE by default"""
+    return codecs.decompress(data, codec, max_size or MAX_DECOMPRESSED_SIZE)
+
+
+# ---------------------------------------------------------------------------
+# Cipher suites. The id is stored with every record, so an id never changes
+# meaning: a new construction gets a new id (or a bumped -vN) and old ids stay
+# decryptable forever.
+# ---------------------------------------------------------------------------
+
+class CipherSuite(abc.ABC):
+    id = None
+    nonce_size = 16
+    aead = False
+
+    @abc.abstractmethod
+    def encryptor(self, key: bytes, nonce: bytes):
+        """Incremental encryptor with encrypt(chunk) and finalize() -> trailing bytes"""
+
+    def encrypt(self, key: bytes, nonce: bytes, data: bytes) -> bytes:
+        encryptor = self.encryptor(key, nonce)
+        return encryptor.encrypt(data) + encryptor.finalize()
+
+    @abc.abstractmethod
+    def decrypt(self, key: bytes, nonce: bytes, data: bytes) -> bytes:
+        """Plaintext, or ValueError if `data` doesn't decrypt (or authenticate)"""
+
+
+class _CBCEncryptor:
+    def __init__(self, key, nonce):
+        self._cipher = AES.new(key, AES.MODE_CBC, nonce)
+        self._pending = b''
+
+    def encrypt(self, data):
+        data = self._pending + data
+        aligned = len(data) - len(data) % AES.block_size
+        self._pending = data[aligned:]
+        return self._cipher.encrypt(data[:aligned]) if aligned else b''
+
+    def finalize(self):
+        return self._cipher.encrypt(Padding.pad(self._pending, AES.block_size))
+
+
+class AESCBCSuite(CipherSuite):
+    """Legacy: AES-256-CBC + PKCS7. Unauthenticated; integrity relies on the separate SHA-256"""
+    id = 'aes256-cbc-v1'
+
+    def encryptor(self, key, nonce):
+        return _CBCEncryptor(key, nonce)
+
+    def decrypt(self, key, nonce, data):
+        return Padding.unpad(AES.new(key, AES.MODE_CBC, nonce).decrypt(data), AES.block_size)
+
+
+class _AEADEncryptor:
+    def __init__(self, cipher):
+        self._cipher = cipher
+
+    def encrypt(self, data):
+        return self._cipher.encrypt(data)
+
+    def finalize(self):
+        return self._cipher.digest()
+
+
+class AEADSuite(CipherSuite):
+    """Ciphertext || 16-byte tag; the suite id is authenticated as associated data"""
+    nonce_size = 12
+    aead = True
+    tag_size = 16
+
+    @abc.abstractmethod
+    def _cipher(self, key, nonce):
+        """A fresh pycryptodome AEAD cipher object for `key` and `nonce`"""
+
+    def encryptor(self, key, nonce):
+        cipher = self._cipher(key, nonce)
+        cipher.update(self.id.encode())
+        return _AEADEncryptor(cipher)
+
+    def decrypt(self, key, nonce, data):
+        if len(data) < self.tag_size:
+            raise ValueError("Ciphertext shorter than its authentication tag")
+        cipher = self._cipher(key, nonce)
+        cipher.update(self.id.encode())
+        # Raises ValueError("MAC check failed") on any tampering
+        return cipher.decrypt_and_verify(data[:-self.tag_size], data[-self.tag_size:])
+
+
+class AESGCMSuite(AEADSuite):
+    id = 'aes256-gcm-v1'
+
+    def _cipher(self, key, nonce):
+        return AES.new(key, AES.MODE_GCM, nonce=nonce)
+
+
+class ChaCha20Poly1305Suite(AEADSuite):
+    id = 'chacha20-poly1305-v1'
+
+    def _cipher(self, key, nonce):
+        return ChaCha20_Poly1305.new(key=key, nonce=nonce)
+
+
+CIPHER_SUITES = {suite.id: suite for suite in (AESCBCSuite(), AESGCMSuite(), ChaCha20Poly1305Suite())}
+LEGACY_SUITE = AESCBCSuite.id
+# Candidates for automatic selection; CBC is decrypt-only in practice
+AEAD_SUITES = (AESGCMSuite.id, ChaCha20Poly1305Suite.id)
+
+_benchmark = {}
+_benchmark_lock = threading.Lock()
+
+
+def get_suite(suite_id: str = None) -> CipherSuite:
+    try:
+        return CIPHER_SUITES[suite_id or LEGACY_SUITE]
+    except KeyError:
+        raise ValueError(f"Unknown cipher suite: {suite_id}")
+
+
+def benchmark_suites(size: int = 1024 * 1024, rounds: int = 3) -> dict:
+    """
+    MB/s per AEAD suite on this machine. AES-GCM wins by a wide margin when
+    the CPU has AES-NI/CLMUL; without them ChaCha20-Poly1305 is faster. Runs
+    once per process.
+    """
+    with _benchmark_lock:
+        if not _benchmark:
+            key, nonce, data = os.urandom(32), os.urandom(12), os.urandom(size)
+            for suite_id in AEAD_SUITES:
+                suite = CIPHER_SUITES[suite_id]
+                best = min(_timed(suite.encrypt, key, nonce, data) for _ in range(rounds))
+                _benchmark[suite_id] = round(size / best / 1e6, 1)
+        return dict(_benchmark)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return max(time.perf_counter() - started, 1e-9)
+
+
+def preferred_suite() -> str:
+    """CIPHER_SUITE if set to a suite id, else the fastest AEAD suite here ('auto')"""
+    configured = os.getenv('CIPHER_SUITE', 'auto')
+    if configured != 'auto':
+        return get_suite(configured).id
+    speeds = benchmark_suites()
+    return max(speeds, key=speeds.get)
 
 
 class EncryptionService:
-    def __init__(self, key: bytes = None):
-        """Initialize with 32-byte key for AES-256"""
-        if key is None:
-            self.key = get_random_bytes(32)
-        else:
-            if len(key) != 32:
-                raise ValueError("Key must be 32 bytes for AES-256")
-            self.key = key
+    def __init__(self, key_manager: KeyManager):
+        """Initialize with the key manager that issues and unwraps per-record data keys"""
+        self.key_manager = key_manager
     
-    def encrypt_file(self, file_content: bytes) -> dict:
+    def encrypt_file(self, file_content: bytes, compression: str = 'none', record_type: str = None,
+                     suite: str = None) -> dict:
         """
-        Encrypt file using AES-256-CBC
+        Optionally compress, then encrypt file with a cipher suite
+        compression: 'none', 'zlib', 'zstd' or 'auto' (choose by record type / sampling)
+        suite: a CIPHER_SUITES id; defaults to preferred_suite()
         Returns: {
-            'encrypted_content': base64_encoded,
-            'iv': base64_encoded,
-            'key': base64_encoded  # In production, use secure key management
+            'encrypted_content': base64_encoded (AEAD suites append the tag),
+            'iv': base64_encoded IV / nonce,
+            'key': base64_encoded,  # Raw data key, for legacy client-side decryption
+            'wrapped_key': data key wrapped under the master key (store with the record),
+            'hash': sha256 of the original (uncompressed) content,
+            'compression': codec actually applied,
+            'suite': cipher suite id (store with the record)
         }
         """
-        # Generate random IV
-        iv = get_random_bytes(16)
+        codec = choose_codec(file_content, record_type) if compression == 'auto' else compression
+        if codec not in CODECS:
+            raise ValueError(f"Unknown compression codec: {codec}")
+        
+        # Fresh data key per file, plus its wrapped form for storage
+        data_key, wrapped_key = self.key_manager.generate_data_key()
         
-        # Create cipher
-        cipher = AES.new(self.key, AES.MODE_CBC, iv)
+        cipher_suite = get_suite(suite or preferred_suite())
+        # Random IV / nonce; data keys are single-use, so nonce reuse can't happen
+        iv = Random.get_random_bytes(cipher_suite.nonce_size)
         
-        # Pad and encrypt
-        padded_data = pad(file_content, AES.block_size)
-        encrypted = cipher.encrypt(padded_data)
+        # Compress and encrypt
+        encrypted = cipher_suite.encrypt(data_key, iv, compress(file_content, codec))
         
         return {
             'encrypted_content': base64.b64encode(encrypted).decode('utf-8'),
             'iv': base64.b64encode(iv).decode('utf-8'),
-            'key': base64.b64encode(self.key).decode('utf-8'),
-            'hash': self.compute_hash(file_content)
+            'key': base64.b64encode(data_key).decode('utf-8'),
+            'wrapped_key': wrapped_key,
+            'hash': self.compute_hash(file_content),
+            'compression': codec,
+            'suite': cipher_suite.id
         }
     
-    def decrypt_file(self, encrypted_content: str, iv: str, key: str) -> bytes:
-        """Decrypt file content"""
+    def decrypt_file(self, encrypted_content: str, iv: str, key: str = None,
+                     compression: str = 'none', wrapped_key: str = None, suite: str = None) -> bytes:
+        """
+        Decrypt file content, undoing any compression applied before encryption.
+        Takes either the raw base64 data key or the wrapped key stored with the record.
+        Records without a suite id predate the registry and are legacy CBC.
+        """
         encrypted_bytes = base64.b64decode(encrypted_content)
         iv_bytes = base64.b64decode(iv)
-        key_bytes = base64.b64decode(key)
-        
-        cipher = AES.new(key_bytes, AES.MODE_CBC, iv_bytes)
-        decrypted = cipher.decrypt(encrypted_bytes)
+        if wrapped_key:
+            key_bytes = self.key_manager.unwrap(wrapped_key)
+        elif key:
+            key_bytes = base64.b64decode(key)
+        else:
+            raise ValueError("Either key or wrapped_key is required")
         
-        return unpad(decrypted, AES.block_size)
+        decrypted = get_suite(suite).decrypt(key_bytes, iv_bytes, encrypted_bytes)
+        return decompress(decrypted, compression)
     
     @staticmethod
     def compute_hash(file_content: bytes) -> str:
@@ -71,6 +270,5 @@ class EncryptionService:
 
 def get_encryption_service():
     """Factory function to get encryption service instance"""
-    # In production, load key from secure environment/secrets manager
-    key = get_random_bytes(32)
-    return EncryptionService(key)
\ No newline at end of file
+    # Master key comes from MASTER_KEY / MASTER_KEY_FILE; see key_management
+    return EncryptionService(get_key_manager())
\ No newline at end of file
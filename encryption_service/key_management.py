@@ -0,0 +1,173 @@
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from startup import lazy_module
+
+AES = lazy_module('Crypto.Cipher.AES')
+Random = lazy_module('Crypto.Random')
+
+
+WRAP_FORMAT_VERSION = 'v1'
+MASTER_KEY_SIZE = 32
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+class KeyCache:
+    """Bounded LRU of unwrapped data keys, each entry expiring after `ttl` seconds"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, wrapped_key: str):
+        with self._lock:
+            entry = self._entries.get(wrapped_key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[wrapped_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(wrapped_key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, wrapped_key: str, data_key: bytes):
+        with self._lock:
+            self._entries[wrapped_key] = (data_key, time.monotonic() + self.ttl)
+            self._entries.move_to_end(wrapped_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class KeyManager:
+    """
+    Envelope encryption: every record gets its own random data key, which is
+    stored wrapped (AES-256-GCM) under a master key that never leaves the
+    service. Any replica holding the same master key can unwrap, so records
+    no longer depend on the process that encrypted them.
+
+    Wrapped keys look like 'v1:<master key id>:<base64 nonce|tag|ciphertext>'.
+    """
+
+    def __init__(self, master_key: bytes, cache: KeyCache = None):
+        if len(master_key) != MASTER_KEY_SIZE:
+            raise ValueError("Master key must be 32 bytes for AES-256")
+        self._master_key = master_key
+        self.key_id = hashlib.sha256(master_key).hexdigest()[:8]
+        self.cache = cache or KeyCache()
+
+    def generate_data_key(self) -> tuple:
+        """Return (data_key, wrapped_key) for a new record"""
+        data_key = Random.get_random_bytes(32)
+        return data_key, self.wrap(data_key)
+
+    def wrap(self, data_key: bytes) -> str:
+        nonce = Random.get_random_bytes(NONCE_SIZE)
+        cipher = AES.new(self._master_key, AES.MODE_GCM, nonce=nonce)
+        ciphertext, tag = cipher.encrypt_and_digest(data_key)
+        blob = base64.b64encode(nonce + tag + ciphertext).decode('utf-8')
+        return f"{WRAP_FORMAT_VERSION}:{self.key_id}:{blob}"
+
+    def unwrap(self, wrapped_key: str) -> bytes:
+        """Unwrap a data key, serving repeat requests for hot records from the cache"""
+        data_key = self.cache.get(wrapped_key)
+        if data_key is not None:
+            return data_key
+
+        try:
+            version, key_id, blob = wrapped_key.split(':', 2)
+        except ValueError:
+            raise ValueError("Malformed wrapped key")
+        if version != WRAP_FORMAT_VERSION:
+            raise ValueError(f"Unsupported wrapped key version: {version}")
+        if key_id != self.key_id:
+            raise ValueError(f"Wrapped under unknown master key: {key_id}")
+
+        raw = base64.b64decode(blob)
+        nonce, tag, ciphertext = raw[:NONCE_SIZE], raw[NONCE_SIZE:NONCE_SIZE + TAG_SIZE], raw[NONCE_SIZE + TAG_SIZE:]
+        cipher = AES.new(self._master_key, AES.MODE_GCM, nonce=nonce)
+        data_key = cipher.decrypt_and_verify(ciphertext, tag)
+
+        self.cache.put(wrapped_key, data_key)
+        return data_key
+
+
+def load_master_key() -> bytes:
+    """
+    Load the master key from the environment (KMS stand-in) or a local key file.
+    MASTER_KEY: base64 32-byte key, takes precedence.
+    MASTER_KEY_FILE: path to a raw 32-byte key; created on first start if missing.
+    With neither set, encryption_service/master.key is generated: it exists on
+    this host only, so replicas elsewhere can't unwrap what this one wraps.
+    Raises ValueError for a key that isn't 32 bytes, failing startup.
+    """
+    env_key = os.getenv('MASTER_KEY')
+    if env_key:
+        try:
+            return _checked(base64.b64decode(env_key, validate=True), 'MASTER_KEY')
+        except binascii.Error:
+            raise ValueError("MASTER_KEY is not valid base64")
+
+    path = os.getenv('MASTER_KEY_FILE')
+    if not path:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'master.key')
+        print(
+            f"[KeyManager] WARNING: neither MASTER_KEY nor MASTER_KEY_FILE is set; using the host-local key "
+            f"{path}. Other replicas cannot unwrap keys wrapped with it - configure a shared master key."
+        )
+    if not os.path.exists(path):
+        _create_key_file(path)
+        print(f"[KeyManager] Generated a new master key in {path}")
+
+    with open(path, 'rb') as f:
+        return _checked(f.read(), path)
+
+
+def _checked(key: bytes, source: str) -> bytes:
+    if len(key) != MASTER_KEY_SIZE:
+        raise ValueError(f"Master key from {source} must be {MASTER_KEY_SIZE} bytes, got {len(key)}")
+    return key
+
+
+def _create_key_file(path: str):
+    """
+    Write a new key to a temporary file, fsync it, then hard-link it into
+    place: a worker racing this one sees either no key file or a complete
+    one, never an empty file. If another worker's link lands first, theirs is
+    the key and ours is dropped.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.master.key-')
+    try:
+        with os.fdopen(fd, 'wb') as f:  # mkstemp creates it 0600
+            f.write(Random.get_random_bytes(MASTER_KEY_SIZE))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(tmp_path)
+
+
+def get_key_manager() -> KeyManager:
+    cache = KeyCache(
+        max_entries=int(os.getenv('KEY_CACHE_MAX_ENTRIES', '1024')),
+        ttl=float(os.getenv('KEY_CACHE_TTL', '300')),
+    )
+    return KeyManager(load_master_key(), cache)
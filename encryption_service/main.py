@@ -1,11 +1,25 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+import sys
+from pathlib import Path
+
+# The shared package (../shared), first on the path so a checkout runs even
+# before `pip install -r requirements.txt` has picked it up
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'shared'))
+
+import startup  # noqa: E402  first, so startup timing covers the framework imports
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
 import base64
+import hmac
 import io
+import os
+import time
 
-from crypto_utils import EncryptionService, get_encryption_service
+import profiling
+from crypto_utils import (
+    CIPHER_SUITES, LEGACY_SUITE, EncryptionService, benchmark_suites, get_encryption_service, preferred_suite
+)
 
 app = FastAPI(title="Medical Records Encryption Service")
 
@@ -18,15 +32,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in request profiling; not installed at all when off
+if profiling.PROFILING:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
 # Initialize service
 encryption_service = get_encryption_service()
+# Shared with the backend, which sends it as X-Service-Token to get data keys;
+# /datakey issues nothing while it's unset
+SERVICE_TOKEN = os.getenv('SERVICE_TOKEN', '')
+warmup_seconds = None
 
 
 class EncryptResponse(BaseModel):
     encrypted_content: str
     iv: str
     key: str
+    wrapped_key: str
     hash: str
+    compression: str = 'none'
+    suite: str
     success: bool
 
 
@@ -44,9 +69,18 @@ class VerifyResponse(BaseModel):
 
 
 @app.post("/encrypt", response_model=EncryptResponse)
-async def encrypt_file(file: UploadFile = File(...)):
+async def encrypt_file(
+    file: UploadFile = File(...),
+    compression: str = Form('none'),
+    record_type: Optional[str] = Form(None),
+    suite: Optional[str] = Form(None)
+):
     """
     Encrypt uploaded file and return encrypted content + hash
+    compression='auto' compresses before encrypting when record_type or a
+    sample of the content says it's worthwhile; the codec used is returned.
+    The cipher suite defaults to the fastest AEAD suite on this host and is
+    returned too; store it with the record.
     """
     try:
         content = await file.read()
@@ -55,7 +89,9 @@ async def encrypt_file(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Empty file")
         
         # Encrypt
-        result = encryption_service.encrypt_file(content)
+        result = encryption_service.encrypt_file(
+            content, compression=compression, record_type=record_type, suite=suite
+        )
         result['success'] = True
         
         return EncryptResponse(**result)
@@ -64,6 +100,25 @@ async def encrypt_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Encryption failed: {str(e)}")
 
 
+@app.post("/datakey")
+async def generate_data_key(x_service_token: str = Header('')):
+    """
+    Issue a fresh data key plus its wrapped form, for callers that encrypt
+    locally as data streams in (the backend's streaming upload handler),
+    and the cipher suite they should encrypt with. Only for callers holding
+    SERVICE_TOKEN: anyone else could produce ciphertext the backend would
+    take for the service's own.
+    """
+    if not SERVICE_TOKEN or not hmac.compare_digest(x_service_token.encode(), SERVICE_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Data keys are only issued to the backend")
+    data_key, wrapped_key = encryption_service.key_manager.generate_data_key()
+    return {
+        "key": base64.b64encode(data_key).decode('utf-8'),
+        "wrapped_key": wrapped_key,
+        "suite": preferred_suite()
+    }
+
+
 @app.post("/verify", response_model=VerifyResponse)
 async def verify_file(
     file: UploadFile = File(...),
@@ -95,13 +150,26 @@ async def verify_file(
 async def decrypt_file(
     encrypted_content: str = Form(...),
     iv: str = Form(...),
-    key: str = Form(...)
+    key: Optional[str] = Form(None),
+    wrapped_key: Optional[str] = Form(None),
+    compression: str = Form('none'),
+    suite: str = Form(LEGACY_SUITE)
 ):
     """
     Decrypt file content (for authorized access)
+    Pass either the raw key or the record's wrapped_key; wrapped keys are
+    unwrapped with the master key, so any replica can serve the request.
+    suite is the id stored with the record; records without one are legacy CBC.
     """
+    if suite not in CIPHER_SUITES:
+        raise HTTPException(status_code=400, detail=f"Unknown cipher suite: {suite}")
+    if not key and not wrapped_key:
+        raise HTTPException(status_code=400, detail="key or wrapped_key required")
+    
     try:
-        decrypted = encryption_service.decrypt_file(encrypted_content, iv, key)
+        decrypted = encryption_service.decrypt_file(
+            encrypted_content, iv, key, compression=compression, wrapped_key=wrapped_key, suite=suite
+        )
         
         return {
             "success": True,
@@ -113,9 +181,51 @@ async def decrypt_file(
         raise HTTPException(status_code=500, detail=f"Decryption failed: {str(e)}")
 
 
+def warm_up() -> float:
+    """
+    Load the deferred crypto modules and exercise every code path once
+    (data key wrap/unwrap, compress + encrypt, decrypt) so the first real
+    request doesn't pay for it. Only the first call does any work.
+    """
+    global warmup_seconds
+    if warmup_seconds is None:
+        started = time.perf_counter()
+        sample = b"warm-up" * 256
+        result = encryption_service.encrypt_file(sample, compression='auto', record_type='lab')
+        encryption_service.decrypt_file(
+            result['encrypted_content'], result['iv'],
+            compression=result['compression'], wrapped_key=result['wrapped_key'], suite=result['suite']
+        )
+        warmup_seconds = round(time.perf_counter() - started, 4)
+    return warmup_seconds
+
+
+@app.on_event("startup")
+async def warm_up_on_start():
+    if os.getenv('WARMUP_ON_START', 'False') == 'True':
+        warm_up()
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: warms the worker on first call and reports startup timings"""
+    try:
+        warm_up()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Warm-up failed: {str(e)}")
+    return startup.startup_report(warmup_seconds)
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "encryption"}
+    return {
+        "status": "healthy",
+        "service": "encryption",
+        "master_key_id": encryption_service.key_manager.key_id,
+        "key_cache": encryption_service.key_manager.cache.stats(),
+        "cipher_suite": preferred_suite(),
+        "suite_benchmark_mbps": benchmark_suites()
+    }
 
 
 if __name__ == "__main__":
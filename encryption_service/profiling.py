@@ -0,0 +1,71 @@
+import os
+
+from medichain_shared.profiling import HEADER, Capture, reason
+
+# Request profiling, off unless PROFILING=True. Capture and on-disk format
+# are shared with the backend (medichain_shared.profiling), so its
+# `manage.py profiles` lists and folds these too (the default PROFILE_DIR
+# is shared).
+PROFILING = os.getenv('PROFILING', 'False') == 'True'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sample')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_ALLOCATIONS = os.getenv('PROFILE_ALLOCATIONS', 'True') == 'True'
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/medichain-profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))
+PROFILE_MAX_MB = float(os.getenv('PROFILE_MAX_MB', '100'))
+
+SERVICE = 'encryption'
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling a PROFILE_SAMPLE_RATE fraction of requests, and
+    any carrying X-Profile: <PROFILE_TOKEN>, into PROFILE_DIR; the response
+    gets an X-Profile-Id header. Only installed when PROFILING is on.
+
+    The endpoints are async and run on the event loop thread, so that's the
+    thread sampled: a profile also shows whatever other requests the loop
+    interleaved with it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = dict(scope['headers'])
+        why = reason(headers.get(HEADER.lower().encode(), b'').decode('latin-1'), PROFILE_TOKEN, PROFILE_SAMPLE_RATE)
+        if why is None:
+            return await self.app(scope, receive, send)
+        capture = Capture(SERVICE, PROFILE_MODE, PROFILE_SAMPLE_INTERVAL_MS / 1000, PROFILE_ALLOCATIONS)
+        if not capture.start():
+            return await self.app(scope, receive, send)
+        response_status = None
+
+        async def send_with_id(message):
+            nonlocal response_status
+            if message['type'] == 'http.response.start':
+                response_status = message['status']
+                message['headers'] = [*message.get('headers', []), (b'x-profile-id', capture.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            capture.stop()
+        endpoint = scope.get('endpoint')
+        try:
+            capture.write(PROFILE_DIR, {
+                'endpoint': getattr(endpoint, '__name__', None),
+                'method': scope['method'],
+                'path': scope['path'],
+                'status': response_status,
+                'reason': why,
+            }, PROFILE_KEEP, PROFILE_MAX_MB * 1024 * 1024)
+        except OSError as e:
+            print(f"[Profile] Could not write profile: {e}")
+        else:
+            print(f"[Profile] {scope['method']} {scope['path']} -> {capture.id} ({capture.duration * 1000:.0f} ms)")
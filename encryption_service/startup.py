@@ -0,0 +1,17 @@
+import time
+
+# Each uvicorn worker only pays for the crypto/compression stack when it's
+# used (or when /ready warms it up)
+from medichain_shared.lazy import LazyModule, import_timings, lazy_module  # noqa: F401
+
+# Captured as early as main.py can import it
+PROCESS_STARTED = time.perf_counter()
+
+
+def startup_report(warmup_seconds: float = None) -> dict:
+    return {
+        'ready': warmup_seconds is not None,
+        'uptime_seconds': round(time.perf_counter() - PROCESS_STARTED, 4),
+        'warmup_seconds': warmup_seconds,
+        'deferred_imports': dict(sorted(import_timings.items(), key=lambda item: -item[1])),
+    }
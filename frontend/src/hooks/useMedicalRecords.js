@@ -363,6 +363,7 @@ export function useMedicalRecords() {
         formData.append("patient_address", patientAddress);
         formData.append("encrypted_file", encryptedFile);
         formData.append("iv", encryptionResult.iv);
+        formData.append("cipher_suite", encryptionResult.suite);
         formData.append("file_hash", hashBytes);
         formData.append("filename", file.name);
         formData.append("file_size", file.size);
@@ -398,7 +399,7 @@ export function useMedicalRecords() {
   );
 
   const downloadAndDecrypt = useCallback(
-    async (cid, iv, key, expectedHash, filename) => {
+    async (cid, iv, key, expectedHash, filename, compression, suite) => {
       logger.info("Downloading and decrypting:", cid);
       setLoading(true);
       setError(null);
@@ -430,6 +431,8 @@ export function useMedicalRecords() {
           base64,
           iv,
           key,
+          compression,
+          suite,
         );
         logger.info("Decryption complete, size:", decryptedResult.size);
 
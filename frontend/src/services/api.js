@@ -71,7 +71,12 @@ class ApiService {
       if (!response.ok) {
         const errorText = await response.text();
         this.logger.error("HTTP error:", response.status, errorText);
-        throw new Error(`HTTP ${response.status}: ${errorText}`);
+        const error = new Error(`HTTP ${response.status}: ${errorText}`);
+        error.status = response.status;
+        // Set on 429/503 when the backend sheds load (admission control), and on
+        // 409 while an earlier request with the same Idempotency-Key runs
+        error.retryAfter = Number(response.headers.get("Retry-After")) || 0;
+        throw error;
       }
 
       // Handle empty responses
@@ -111,22 +116,36 @@ class ApiService {
   }
 
   async requestWithRetry(endpoint, options = {}, maxRetries = 2) {
+    // Repeating a write is only safe when the server can tell it's a retry:
+    // every attempt carries the same Idempotency-Key, so it runs at most once
+    const idempotent =
+      !options.method ||
+      options.method === "GET" ||
+      !!options.headers?.["Idempotency-Key"];
     let lastError;
     for (let i = 0; i < maxRetries; i++) {
       try {
         return await this.request(endpoint, options);
       } catch (err) {
         lastError = err;
-        // Only retry on 500 errors (race conditions), not 404s
-        if (!err.message?.includes("500") || i === maxRetries - 1) {
+        // Retry on 500 errors (race conditions) and load shedding, not 404s
+        const shed = err.status === 429 || err.status === 503;
+        // 409: the first attempt with this key is still running
+        const inProgress = err.status === 409 && idempotent;
+        // No status: the request never got an answer (network error, timeout)
+        const lost = err.status === undefined && idempotent;
+        const retryable =
+          shed || inProgress || lost || err.message?.includes("500");
+        if (!retryable || i === maxRetries - 1) {
           throw err;
         }
         this.logger.warn(
           `Request failed (attempt ${i + 1}), retrying...`,
           err.message,
         );
-        // Wait 100ms before retry
-        await new Promise((resolve) => setTimeout(resolve, 100));
+        // Wait as long as the server asked, else 100ms, before retry
+        const delay = err.retryAfter ? err.retryAfter * 1000 : 100;
+        await new Promise((resolve) => setTimeout(resolve, delay));
       }
     }
     throw lastError;
@@ -175,11 +194,114 @@ class ApiService {
     return this.request(`/records/patient/${patientAddress}/`);
   }
 
-  async updateTxHash(recordId, txHash) {
+  // Dashboard summary (counts per record type, total bytes, last upload,
+  // doctor count) from one precomputed row, without fetching the records
+  async getPatientStats(patientAddress) {
+    this.logger.debug("Fetching patient stats:", patientAddress);
+    return this.request(`/records/stats/${patientAddress}/`);
+  }
+
+  // Delta sync: records changed since `cursor` plus deleted ids; pass the
+  // returned cursor back on the next refresh and page while has_more is true
+  async getRecordChanges(walletAddress, { cursor = 0, as } = {}) {
+    this.logger.debug("Fetching record changes:", walletAddress, cursor);
+    const params = new URLSearchParams({ cursor });
+    if (as) params.set("as", as);
+    return this.request(`/records/changes/${walletAddress}/?${params.toString()}`);
+  }
+
+  // Server-Sent Events for a wallet. `handlers` maps event names
+  // (record.created, record.confirmed, record.tx_failed, record.tx_replaced,
+  // record.tx_dropped, access.granted, access.revoked) to
+  // callbacks receiving the parsed data. Returns an object; call close() on
+  // it to unsubscribe. Read with fetch rather than EventSource, which can't
+  // send X-Wallet-Address; reconnects resume from the last event id.
+  subscribeEvents(walletAddress, handlers = {}) {
+    const controller = new AbortController();
+    let lastEventId = null;
+    let retryMs = 3000;
+
+    const dispatch = (block) => {
+      let event = "message";
+      const data = [];
+      for (const line of block.split("\n")) {
+        const [field, ...rest] = line.split(":");
+        const value = rest.join(":").replace(/^ /, "");
+        if (field === "id") lastEventId = value;
+        else if (field === "event") event = value;
+        else if (field === "data") data.push(value);
+        else if (field === "retry") retryMs = Number(value) || retryMs;
+      }
+      if (data.length && handlers[event]) {
+        handlers[event](JSON.parse(data.join("\n")));
+      }
+    };
+
+    const connect = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          const headers = { "X-Wallet-Address": walletAddress.toLowerCase() };
+          if (lastEventId) headers["Last-Event-ID"] = lastEventId;
+          const response = await fetch(`${this.baseURL}/events/${walletAddress}/`, {
+            headers,
+            signal: controller.signal,
+          });
+          if (response.status === 403) {
+            this.logger.error("Event stream refused for", walletAddress);
+            return;
+          }
+          if (!response.ok) throw new Error(`HTTP ${response.status}`);
+          const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+          let buffer = "";
+          for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+            let end;
+            while ((end = buffer.indexOf("\n\n")) !== -1) {
+              dispatch(buffer.slice(0, end));
+              buffer = buffer.slice(end + 2);
+            }
+          }
+        } catch (err) {
+          if (controller.signal.aborted) return;
+          this.logger.debug("Event stream interrupted, reconnecting", err.message);
+        }
+        await new Promise((resolve) => setTimeout(resolve, retryMs));
+      }
+    };
+
+    connect();
+    return { close: () => controller.abort() };
+  }
+
+  // One key per logical write, reused by every retry of it: the backend
+  // replays the first response instead of running the request again
+  newIdempotencyKey() {
+    return crypto.randomUUID();
+  }
+
+  async updateTxHash(recordId, txHash, idempotencyKey = this.newIdempotencyKey()) {
     this.logger.info("Updating TX hash:", recordId, txHash);
-    return this.request(`/records/${recordId}/tx/`, {
+    return this.requestWithRetry(`/records/${recordId}/tx/`, {
       method: "POST",
       body: JSON.stringify({ tx_hash: txHash }),
+      headers: { "Idempotency-Key": idempotencyKey },
+    });
+  }
+
+  // Paged on-chain records, read by the backend in one batched RPC request
+  async getChainRecords(patientAddress, { offset = 0, limit = 50, pages = 1 } = {}) {
+    this.logger.debug("Fetching chain records:", patientAddress, offset, limit);
+    const params = new URLSearchParams({ offset, limit, pages });
+    return this.request(`/records/chain/${patientAddress}/?${params.toString()}`);
+  }
+
+  async checkAccessBatch(patientAddress, doctors) {
+    this.logger.debug("Checking access for", doctors.length, "doctors");
+    return this.request("/records/chain/access/", {
+      method: "POST",
+      body: JSON.stringify({ patient_address: patientAddress, doctors }),
     });
   }
 
@@ -189,13 +311,19 @@ class ApiService {
   }
 
   // Add to api.js
-  async uploadRecordComplete(formData) {
+  async uploadRecordComplete(formData, idempotencyKey = this.newIdempotencyKey()) {
     this.logger.info("Starting complete upload pipeline");
 
-    return this.request("/records/upload-complete/", {
+    return this.requestWithRetry("/records/upload-complete/", {
       method: "POST",
       body: formData,
-      headers: {}, // Browser sets Content-Type with boundary for FormData
+      // Browser sets Content-Type with boundary for FormData. The record type
+      // also goes in a header: the backend picks the compression codec from it
+      // while the file is still streaming in, before the form field is parsed
+      headers: {
+        "Idempotency-Key": idempotencyKey,
+        "X-Record-Type": formData.get("record_type") || "unknown",
+      },
     });
   }
 
@@ -222,6 +350,40 @@ class ApiService {
     return response; // Return raw response for blob handling
   }
 
+  // Thumbnail of an image/PDF record as an object URL for <img src>;
+  // null when the record has no preview. Revoke the URL when done with it.
+  async getRecordPreview(recordId, size = 256) {
+    const response = await fetch(`${this.baseURL}/records/${recordId}/preview/?size=${size}`, {
+      headers: { "X-Wallet-Address": this.walletAddress },
+    });
+    if (!response.ok) return null;
+    return URL.createObjectURL(await response.blob());
+  }
+
+  // All (or ?recordType-filtered) records of the connected patient as one
+  // archive with a manifest. Returns { blob, filename, until }; pass
+  // `after`/`until` to resume an interrupted export.
+  async exportRecords({ format = "zip", recordType, after, until } = {}) {
+    const params = new URLSearchParams({ format });
+    if (recordType) params.set("record_type", recordType);
+    if (after) params.set("after", after);
+    if (until) params.set("until", until);
+    const response = await fetch(
+      `${this.baseURL}/records/export/${this.walletAddress}/?${params.toString()}`,
+      { headers: { "X-Wallet-Address": this.walletAddress } },
+    );
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.error || "Export failed");
+    }
+    const disposition = response.headers.get("Content-Disposition") || "";
+    return {
+      blob: await response.blob(),
+      filename: disposition.match(/filename="(.+)"/)?.[1] || `medichain-export.${format}`,
+      until: response.headers.get("X-Export-Until"),
+    };
+  }
+
   async updateProfile(walletAddress, profileData) {
     this.logger.info("Updating profile for:", walletAddress);
     return this.request(`/users/${walletAddress}/update/`, {
@@ -253,12 +415,12 @@ class ApiService {
     );
   }
 
-  async syncBlockchainRecord(formData) {
+  async syncBlockchainRecord(formData, idempotencyKey = this.newIdempotencyKey()) {
     this.logger.info("Syncing blockchain record to backend");
-    return this.request("/records/sync-blockchain/", {
+    return this.requestWithRetry("/records/sync-blockchain/", {
       method: "POST",
       body: formData,
-      headers: {},
+      headers: { "Idempotency-Key": idempotencyKey },
     });
   }
 }
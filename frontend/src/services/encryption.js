@@ -57,13 +57,21 @@ class EncryptionService {
     }
   }
 
-  async decryptFile(encryptedContent, iv, key) {
+  async decryptFile(encryptedContent, iv, key, compression = 'none', suite) {
     this.logger.info('Decrypting file...')
+    // No default: new records are AEAD, and guessing CBC would fail to decrypt them
+    if (!suite) {
+      throw new Error("Decryption failed: pass the record's stored cipher_suite")
+    }
     
     const formData = new FormData()
     formData.append('encrypted_content', encryptedContent)
     formData.append('iv', iv)
     formData.append('key', key)
+    // Codec the record was compressed with before encryption (record metadata)
+    formData.append('compression', compression || 'none')
+    // Cipher suite the record was encrypted with (its cipher_suite; legacy rows are aes256-cbc-v1)
+    formData.append('suite', suite)
 
     try {
       const response = await fetch(`${this.baseURL}/decrypt`, {
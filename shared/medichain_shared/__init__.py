@@ -0,0 +1,8 @@
+"""
+Code both services run: the backend (backend/) and the encryption service
+(encryption_service/). Installed into each service's environment from its
+requirements file (`-e ../shared`); the entrypoints (manage.py, wsgi.py,
+asgi.py, main.py) also put ../shared first on sys.path so a checkout works
+before it's reinstalled. Only the standard library may be imported (and
+zstandard lazily, where it's installed).
+"""
@@ -0,0 +1,95 @@
+import importlib.util
+import zlib
+
+from .lazy import lazy_module
+
+# Compression runs before encryption (ciphertext doesn't compress). The
+# encryption service and the backend's streaming upload handler both compress
+# records, and the service decompresses either; so policy and settings live
+# here, once.
+
+# zstd is optional; zlib is always available
+zstandard = lazy_module('zstandard') if importlib.util.find_spec('zstandard') else None
+
+# Text-like record types compress well; imaging is usually already compressed.
+COMPRESSIBLE_RECORD_TYPES = {'lab', 'prescription', 'discharge', 'referral', 'vaccination', 'ayush'}
+INCOMPRESSIBLE_RECORD_TYPES = {'imaging'}
+CODECS = ('none', 'zlib', 'zstd')
+
+CHUNK_SIZE = 1024 * 1024
+SAMPLE_SIZE = 64 * 1024
+MIN_COMPRESS_SIZE = 1024
+# Only compress when a sample shrinks to at most this fraction of its size
+MAX_SAMPLE_RATIO = 0.9
+
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def choose_codec(content, record_type=None):
+    """
+    Pick a codec from the record type, or by sampling when the type doesn't
+    tell. Only the first SAMPLE_SIZE bytes of `content` are looked at, so a
+    stream's first chunk will do; under MIN_COMPRESS_SIZE means the whole
+    file is that small.
+    """
+    if len(content) < MIN_COMPRESS_SIZE:
+        return 'none'
+    if record_type in COMPRESSIBLE_RECORD_TYPES:
+        return default_codec()
+    if record_type in INCOMPRESSIBLE_RECORD_TYPES:
+        return 'none'
+
+    sample = content[:SAMPLE_SIZE]
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    return default_codec() if ratio <= MAX_SAMPLE_RATIO else 'none'
+
+
+def compressor(codec):
+    """Incremental compressor (compress/flush) for `codec`; None for 'none'"""
+    if codec == 'none':
+        return None
+    if codec == 'zlib':
+        return zlib.compressobj(6)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression requested but zstandard is not installed")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+
+def decompress(data, codec, max_size):
+    """Undo `codec`; ValueError instead of producing more than max_size bytes"""
+    if codec == 'none':
+        return data
+    parts = []
+    total = 0
+    for part in _decompressed(data, codec):
+        total += len(part)
+        if total > max_size:
+            raise ValueError(f"Decompressed content exceeds {max_size} bytes")
+        parts.append(part)
+    return b''.join(parts)
+
+
+def _decompressed(data, codec):
+    """Output in pieces of at most about CHUNK_SIZE, so a bomb is stopped early"""
+    if codec == 'zlib':
+        stream = zlib.decompressobj()
+        pending = data
+        while pending:
+            yield stream.decompress(pending, CHUNK_SIZE)
+            pending = stream.unconsumed_tail
+        yield stream.flush()
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd-compressed content but zstandard is not installed")
+        with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+            while True:
+                part = reader.read(CHUNK_SIZE)
+                if not part:
+                    return
+                yield part
+    else:
+        raise ValueError(f"Unknown compression codec: {codec}")
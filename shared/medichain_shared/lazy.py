@@ -0,0 +1,37 @@
+import importlib
+import time
+
+# module name -> seconds its (deferred) import took
+import_timings = {}
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module that is imported on first attribute access.
+    Lets call sites keep the `module.attr` style while keeping worker startup
+    cheap (or until a warm-up pulls it in); the import time is recorded for
+    each service's readiness report.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name)
+            import_timings.setdefault(self._name, round(time.perf_counter() - started, 4))
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'deferred'
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
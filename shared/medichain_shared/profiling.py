@@ -0,0 +1,192 @@
+import cProfile
+import functools
+import glob
+import hmac
+import json
+import os
+import random
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+HEADER = 'X-Profile'
+ALLOC_TOP = 30
+# Frames kept per allocation traceback
+ALLOC_FRAMES = 10
+
+# One capture at a time per process: tracemalloc and the sampler see the
+# whole process, so overlapping captures would blur into each other
+_active = threading.Lock()
+
+
+# Frame paths are shown relative to these, longest (most specific) first
+_PATH_PREFIXES = sorted(
+    {sysconfig.get_paths()['purelib'], sysconfig.get_paths()['stdlib'], os.getcwd()}, key=len, reverse=True
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _short_path(path):
+    for prefix in _PATH_PREFIXES:
+        if path.startswith(prefix + os.sep):
+            return path[len(prefix) + 1:]
+    return path
+
+
+def _frame_label(code):
+    return f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler:
+    """
+    Wall-clock stack samples of one thread, every `interval` seconds from a
+    helper thread, counted as folded stacks ("outer;inner;leaf count" - the
+    input format of flamegraph.pl, speedscope and inferno)
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class Capture:
+    """
+    One request's profile: stack samples ('sample') or deterministic cProfile
+    ('cprofile') of the calling thread, plus a tracemalloc snapshot of what
+    the request left allocated and its peak. `service` goes into the id, so
+    both services can share one directory and each trims only its own.
+    """
+
+    def __init__(self, service, mode, interval, allocations):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{service}-{uuid.uuid4().hex[:8]}"
+        self.service = service
+        self.mode = mode
+        self.sampler = StackSampler(threading.get_ident(), interval) if mode == 'sample' else None
+        self.profiler = cProfile.Profile() if mode == 'cprofile' else None
+        self.allocations = allocations
+        self.snapshot = None
+        self.alloc_peak = None
+        self._owns_tracemalloc = False
+
+    def start(self):
+        """Start capturing; False (and nothing started) while another request is being captured"""
+        if not _active.acquire(blocking=False):
+            return False
+        try:
+            if self.allocations and not tracemalloc.is_tracing():
+                tracemalloc.start(ALLOC_FRAMES)
+                self._owns_tracemalloc = True
+            self.started = time.perf_counter()
+            if self.sampler:
+                self.sampler.start()
+            if self.profiler:
+                self.profiler.enable()
+        except BaseException:
+            _active.release()
+            raise
+        return True
+
+    def stop(self):
+        try:
+            if self.profiler:
+                self.profiler.disable()
+            if self.sampler:
+                self.sampler.stop()
+            self.duration = time.perf_counter() - self.started
+            if self._owns_tracemalloc:
+                self.alloc_peak = tracemalloc.get_traced_memory()[1]
+                self.snapshot = tracemalloc.take_snapshot().filter_traces(
+                    (tracemalloc.Filter(False, tracemalloc.__file__),)
+                )
+                tracemalloc.stop()
+        finally:
+            _active.release()
+
+    def _allocations_text(self):
+        lines = [f'Peak traced memory: {self.alloc_peak / 1024:.1f} KiB', '']
+        for stat in self.snapshot.statistics('traceback')[:ALLOC_TOP]:
+            lines.append(f'{stat.size / 1024:.1f} KiB in {stat.count} blocks')
+            lines.extend(f'    {line}' for line in stat.traceback.format(most_recent_first=True))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory, meta, keep, max_bytes):
+        """Write <id>.json plus .folded / .pstats / .alloc.txt, then trim the ring buffer"""
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, self.id)
+        if self.sampler:
+            with open(f'{stem}.folded', 'w') as f:
+                f.write(self.sampler.folded())
+        if self.profiler:
+            self.profiler.dump_stats(f'{stem}.pstats')
+        if self.snapshot is not None:
+            with open(f'{stem}.alloc.txt', 'w') as f:
+                f.write(self._allocations_text())
+        meta = {
+            'id': self.id,
+            'service': self.service,
+            'mode': self.mode,
+            'duration_ms': round(self.duration * 1000, 2),
+            'samples': sum(self.sampler.stacks.values()) if self.sampler else None,
+            'alloc_peak_bytes': self.alloc_peak,
+            'created_at': time.time(),
+            **meta,
+        }
+        # Metadata last: a profile is listed only once its data is complete
+        with open(f'{stem}.json', 'w') as f:
+            json.dump(meta, f)
+        trim(directory, self.service, keep, max_bytes)
+        return self.id
+
+
+def trim(directory, service, keep, max_bytes):
+    """Drop `service`'s oldest profiles beyond `keep` of them or `max_bytes` in total"""
+    files = {}
+    for path in glob.glob(os.path.join(directory, f'*-{service}-*')):
+        files.setdefault(os.path.basename(path).split('.', 1)[0], []).append(path)
+    stems = sorted(files)  # ids start with their timestamp
+    sizes = {stem: sum(os.path.getsize(path) for path in files[stem] if os.path.exists(path)) for stem in stems}
+    total = sum(sizes.values())
+    while stems and (len(stems) > keep or total > max_bytes):
+        stem = stems.pop(0)
+        total -= sizes[stem]
+        for path in files[stem]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another worker trimmed it first
+
+
+def reason(header_value, token, sample_rate):
+    """Why this request is profiled ('header' or 'sampled'), or None"""
+    if token and header_value and hmac.compare_digest(header_value, token):
+        return 'header'
+    if sample_rate and random.random() < sample_rate:
+        return 'sampled'
+    return None